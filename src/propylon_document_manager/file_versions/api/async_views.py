@@ -0,0 +1,137 @@
+"""
+Async counterparts of the document views, used when the project is served
+over ASGI (see site/asgi.py) with DOCUMENT_ASYNC_VIEWS enabled.
+
+Lookups use the async ORM and downloads are streamed with async iterators,
+so a slow client no longer holds a worker thread for the whole transfer.
+"""
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.http import JsonResponse
+from django.middleware.csrf import CsrfViewMiddleware
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ValidationError
+from rest_framework.request import Request
+
+from ..models import Document
+from ..services import DuplicateRevisionError, create_revision
+from ..uploadhandlers import ContentHashUploadHandler
+from ..usage import QuotaExceededError, has_room
+from .downloads import document_response
+from .serializers import DocumentSerializer
+from .views import QUOTA_EXCEEDED, document_groups_response, latest_revision, readable_document, smallest_upload
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class CSRFCheck(CsrfViewMiddleware):
+    def _reject(self, request, reason):
+        return reason
+
+
+async def authenticate(request):
+    """
+    Resolve the requesting user the way the REST framework's token and session
+    authentication do, using the async ORM. Returns None if the request is
+    anonymous or fails the CSRF check required for session authentication.
+    """
+    keyword, _, key = request.headers.get("Authorization", "").partition(" ")
+    if keyword == "Token":
+        token = await Token.objects.select_related("user").filter(key=key.strip()).afirst()
+        return token.user if token and token.user.is_active else None
+
+    if not hasattr(request, "auser"):
+        return None
+    user = await request.auser()
+    if not user.is_authenticated:
+        return None
+    if request.method not in SAFE_METHODS:
+        check = CSRFCheck(lambda request: None)
+        check.process_request(request)
+        if await sync_to_async(check.process_view)(request, None, (), {}):
+            return None
+    return user
+
+
+@method_decorator([csrf_exempt, transaction.non_atomic_requests], name="dispatch")
+class AsyncAPIView(View):
+    """
+    Base for async API views. Only authenticated users get through; CSRF is
+    enforced for session authentication only, like in the REST framework.
+    Transactions are managed explicitly since ATOMIC_REQUESTS cannot wrap async views.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        user = await authenticate(request)
+        if user is None:
+            return JsonResponse({"detail": "Authentication credentials were not provided."}, status=403)
+        request.user = user
+        return await super().dispatch(request, *args, **kwargs)
+
+
+class AsyncDocumentView(AsyncAPIView):
+    """Handles upload (POST) and retrieval (GET) of documents by URL."""
+
+    def setup(self, request, *args, **kwargs):
+        super().setup(request, *args, **kwargs)
+        request.upload_handlers = [ContentHashUploadHandler(request)]
+
+    async def post(self, request, url):
+        if not await sync_to_async(has_room)(request.user, smallest_upload(request)):
+            return JsonResponse({"detail": QUOTA_EXCEEDED}, status=413)
+        # Parsing the body writes the file to blob staging, keep it off the event loop
+        files = await sync_to_async(lambda: request.FILES)()
+        uploaded_file = files.get("file")
+        if uploaded_file is None:
+            return JsonResponse({"detail": "No file was submitted."}, status=400)
+
+        try:
+            document = await sync_to_async(create_revision)(request.user, url, uploaded_file, uploaded_file.name)
+        except DuplicateRevisionError:
+            return JsonResponse({"detail": "This file already exists for this URL (duplicate content)."}, status=400)
+        except QuotaExceededError:
+            return JsonResponse({"detail": QUOTA_EXCEEDED}, status=413)
+
+        data = await sync_to_async(lambda: DocumentSerializer(document).data)()
+        return JsonResponse(data, status=201)
+
+    async def get(self, request, url):
+        """Retrieve latest or specific revision of a document."""
+        revision = request.GET.get("revision")
+        if revision is not None and not revision.isdigit():
+            return JsonResponse({"revision": ["Must be a revision number."]}, status=400)
+        qs = Document.objects.filter(user=request.user, url=url).select_related("blob")
+
+        if revision is not None:
+            doc = await qs.filter(version_number=int(revision)).afirst()
+        else:
+            doc = await sync_to_async(latest_revision)(request.user, url)
+        if not doc:
+            return JsonResponse({"detail": "Not found."}, status=404)
+
+        return document_response(request, doc, asynchronous=True)
+
+
+class AsyncDocumentByHashView(AsyncAPIView):
+    async def get(self, request, content_hash):
+        doc = await sync_to_async(readable_document)(request.user, content_hash)
+        if not doc:
+            return JsonResponse({"detail": "Not authorized"}, status=403)
+
+        return document_response(request, doc, asynchronous=True)
+
+
+class AsyncDocumentListView(AsyncAPIView):
+    """List all documents belonging to the authenticated user, with revisions (paginated)."""
+
+    async def get(self, request):
+        drf_request = Request(request)
+        drf_request.user = request.user
+        try:
+            response = await sync_to_async(document_groups_response)(drf_request, self)
+        except ValidationError as e:
+            return JsonResponse(e.detail, status=400)
+        return JsonResponse(response.data)
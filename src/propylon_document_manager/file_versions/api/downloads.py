@@ -0,0 +1,209 @@
+"""
+Building download responses for documents, with support for conditional
+requests and byte ranges.
+"""
+import mimetypes
+import re
+import uuid
+from functools import partial
+from urllib.parse import quote
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+
+RANGE_SPEC_RE = re.compile(r"^\s*(\d*)\s*-\s*(\d*)\s*$")
+# More ranges than this are answered with the whole file, as RFC 9110 allows
+MAX_RANGES = 16
+CHUNK_SIZE = 64 * 2**10
+
+
+def parse_range_header(header, size):
+    """
+    Parse a ``Range`` header into a list of inclusive ``(start, end)`` pairs.
+
+    Returns None if the header should be ignored (it is malformed or asks for
+    too many ranges), and an empty list if none of the ranges can be satisfied.
+    """
+    unit, _, specs = header.partition("=")
+    if unit.strip().lower() != "bytes" or not specs:
+        return None
+
+    ranges = []
+    for spec in specs.split(","):
+        match = RANGE_SPEC_RE.match(spec)
+        if not match or match.groups() == ("", ""):
+            return None
+        first, last = match.groups()
+        if not first:
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length and size:
+                ranges.append((max(size - length, 0), size - 1))
+            continue
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if last and int(last) < start:
+            return None
+        if start < size:
+            ranges.append((start, end))
+
+    if len(ranges) > MAX_RANGES:
+        return None
+    return ranges
+
+
+def document_etag(doc):
+    """Strong entity tag of a revision; its content hash already identifies the bytes."""
+    return f'"{doc.content_hash}"'
+
+
+def _validator_matches(if_range, doc):
+    """Whether an ``If-Range`` value still describes the stored document."""
+    if if_range.startswith('"'):
+        return if_range == document_etag(doc)
+    return parse_http_date_safe(if_range) == int(doc.created_at.timestamp())
+
+
+def _read_from(stored, start, end):
+    stored.seek(start)
+    remaining = end - start + 1
+    while remaining:
+        chunk = stored.read(min(CHUNK_SIZE, remaining))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+        yield chunk
+
+
+def _read_range(doc, start, end):
+    with doc.blob.open() as stored:
+        yield from _read_from(stored, start, end)
+
+
+async def async_chunks(chunks, file_only=False):
+    """
+    Iterate blocking reads from async code without blocking the event loop.
+    They run in the request's thread, where the database may be queried.
+
+    With ``file_only`` only the first read, which opens the file and may
+    rebuild a delta from the database, does. Later reads must only touch the
+    open file and run in the shared thread pool, so a download does not hold
+    the request's thread for the whole transfer.
+    """
+    chunks = iter(chunks)
+    done = object()
+    chunk = await sync_to_async(next)(chunks, done)
+    read = sync_to_async(next, thread_sensitive=not file_only)
+    while chunk is not done:
+        yield chunk
+        chunk = await read(chunks, done)
+
+
+def _multipart_ranges(doc, ranges, boundary, content_type):
+    size = doc.blob.size
+    parts = []
+    for start, end in ranges:
+        header = (
+            f"--{boundary}\r\nContent-Type: {content_type}\r\nContent-Range: bytes {start}-{end}/{size}\r\n\r\n"
+        ).encode()
+        parts.append((header, start, end))
+    closing = f"--{boundary}--\r\n".encode()
+    length = sum(len(header) + end - start + 1 + 2 for header, start, end in parts) + len(closing)
+
+    def content():
+        # Opened once, a delta is not rebuilt per range
+        with doc.blob.open() as stored:
+            for header, start, end in parts:
+                yield header
+                yield from _read_from(stored, start, end)
+                yield b"\r\n"
+        yield closing
+
+    return content(), length
+
+
+def _set_validators(response, doc):
+    response["ETag"] = document_etag(doc)
+    response["Last-Modified"] = http_date(doc.created_at.timestamp())
+    # Private to the user, and revalidated on every use since the latest revision can change
+    response["Cache-Control"] = "private, no-cache"
+    return response
+
+
+def document_response(request, doc, asynchronous=False):
+    """
+    Respond with the content of ``doc`` as an attachment.
+
+    Conditional requests are answered with 304/412 and ``HEAD`` from the
+    database row, both without opening the file. Depending on
+    DOCUMENT_DELIVERY the file is then either handed off to the web server
+    or streamed here, honouring ``Range`` and ``If-Range`` with 206/416.
+
+    Async views pass ``asynchronous=True`` to get a body that is streamed
+    with async iterators.
+    """
+    file_name = doc.file_name
+    size = doc.blob.size
+    content_type = mimetypes.guess_type(file_name)[0] or "application/octet-stream"
+
+    conditional = get_conditional_response(
+        request, etag=document_etag(doc), last_modified=int(doc.created_at.timestamp())
+    )
+    if conditional is not None:
+        return _set_validators(conditional, doc)
+
+    if request.method == "HEAD":
+        response = HttpResponse(content_type=content_type)
+        response["Content-Length"] = size
+        response["Content-Disposition"] = content_disposition_header(True, file_name)
+        response["Accept-Ranges"] = "bytes"
+        return _set_validators(response, doc)
+
+    if settings.DOCUMENT_DELIVERY in ("x-accel-redirect", "x-sendfile") and doc.blob.delta_base_id is None:
+        # The web server sends the bytes and handles ranges itself
+        response = HttpResponse(content_type=content_type)
+        response["Content-Disposition"] = content_disposition_header(True, file_name)
+        if settings.DOCUMENT_DELIVERY == "x-accel-redirect":
+            response["X-Accel-Redirect"] = settings.DOCUMENT_ACCEL_REDIRECT_PREFIX + quote(doc.blob.file.name)
+        else:
+            response["X-Sendfile"] = doc.blob.file.path
+        return _set_validators(response, doc)
+
+    ranges = None
+    range_header = request.headers.get("Range")
+    if_range = request.headers.get("If-Range")
+    if range_header and (if_range is None or _validator_matches(if_range, doc)):
+        ranges = parse_range_header(range_header, size)
+
+    body = partial(async_chunks, file_only=True) if asynchronous else iter
+
+    if ranges is None and asynchronous:
+        response = StreamingHttpResponse(body(_read_range(doc, 0, size - 1)), content_type=content_type)
+        response["Content-Length"] = size
+        response["Content-Disposition"] = content_disposition_header(True, file_name)
+    elif ranges is None:
+        response = FileResponse(doc.blob.open(), as_attachment=True, filename=file_name)
+    elif not ranges:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        return response
+    elif len(ranges) == 1:
+        start, end = ranges[0]
+        response = StreamingHttpResponse(body(_read_range(doc, start, end)), status=206, content_type=content_type)
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+        response["Content-Length"] = end - start + 1
+    else:
+        boundary = uuid.uuid4().hex
+        content, length = _multipart_ranges(doc, ranges, boundary, content_type)
+        response = StreamingHttpResponse(
+            body(content), status=206, content_type=f"multipart/byteranges; boundary={boundary}"
+        )
+        response["Content-Length"] = length
+
+    response["Accept-Ranges"] = "bytes"
+    if response.status_code == 206:
+        response["Content-Disposition"] = content_disposition_header(True, file_name)
+    return _set_validators(response, doc)
@@ -1,5 +1,6 @@
 from rest_framework import serializers
-from ..models import FileVersion, User, Document
+from ..models import FileVersion, User, Document, DocumentHead, ShareJob, StorageUsage, UploadSession
+from ..usage import quota_of
 
 
 
@@ -11,6 +12,18 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ["id", "email", "name"]
 
 
+def shared_users(document):
+    """
+    Serialized users a document is shared with. Uses the shares prefetched by
+    ``Document.objects.with_shares()`` when available, a single query otherwise.
+    """
+    if "shares" in getattr(document, "_prefetched_objects_cache", {}):
+        users = [share.shared_with for share in document.shares.all()]
+    else:
+        users = User.objects.filter(shares__document=document).order_by("shares__pk")
+    return UserSerializer(users, many=True).data
+
+
 class FileVersionSerializer(serializers.ModelSerializer):
     """Serializer for FileVersion model."""
 
@@ -22,8 +35,6 @@ class FileVersionSerializer(serializers.ModelSerializer):
 class DocumentRevisionSerializer(serializers.ModelSerializer):
     """Serializer for one revision of a document (e.g. v0, v1)."""
 
-    version_number = serializers.IntegerField(source="version.version_number")
-    file_name = serializers.CharField(source="version.file_name")
     shared_users = serializers.SerializerMethodField(read_only=True)
 
 
@@ -39,10 +50,7 @@ class DocumentRevisionSerializer(serializers.ModelSerializer):
         ]
 
     def get_shared_users(self, obj):
-        return UserSerializer(
-            [share.shared_with for share in obj.shares.all()],
-            many=True
-        ).data
+        return shared_users(obj)
 
 
 class DocumentSerializer(serializers.ModelSerializer):
@@ -52,7 +60,8 @@ class DocumentSerializer(serializers.ModelSerializer):
     """
 
     user = serializers.StringRelatedField(read_only=True)  # shows email
-    version = FileVersionSerializer(read_only=True)
+    file = serializers.FileField(source="blob.file", read_only=True)
+    version = serializers.SerializerMethodField(read_only=True)
     shared_users = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
@@ -69,11 +78,12 @@ class DocumentSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ["content_hash", "user", "created_at", "shared_users"]
 
+    def get_version(self, obj):
+        # Same shape as FileVersionSerializer, from the fields copied onto the document
+        return {"id": obj.version_id, "file_name": obj.file_name, "version_number": obj.version_number}
+
     def get_shared_users(self, obj):
-        return UserSerializer(
-            [share.shared_with for share in obj.shares.all()],
-            many=True
-        ).data
+        return shared_users(obj)
 
 class DocumentWithRevisionsSerializer(serializers.Serializer):
     """
@@ -83,3 +93,98 @@ class DocumentWithRevisionsSerializer(serializers.Serializer):
 
     url = serializers.CharField()
     revisions = DocumentRevisionSerializer(many=True)
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    """Serializer for a resumable upload session and its current offset."""
+
+    class Meta:
+        model = UploadSession
+        fields = ["id", "url", "file_name", "size", "offset", "created_at"]
+        read_only_fields = ["id", "offset", "created_at"]
+
+
+class UploadNegotiationSerializer(serializers.Serializer):
+    """What a client announces about a file before deciding whether to send it."""
+
+    url = serializers.CharField(max_length=1024)
+    content_hash = serializers.RegexField(r"^[0-9a-f]{64}$")
+    size = serializers.IntegerField(min_value=0)
+    file_name = serializers.CharField(max_length=512)
+
+
+class ShareJobSerializer(serializers.ModelSerializer):
+    """Status of a background share reconciliation; ``result`` holds its report once done."""
+
+    class Meta:
+        model = ShareJob
+        fields = ["id", "status", "result", "created_at", "finished_at"]
+
+
+class FolderDocumentSerializer(serializers.ModelSerializer):
+    """Latest revision of a document, as listed in its folder."""
+
+    class Meta:
+        model = Document
+        fields = ["id", "url", "file_name", "version_number", "content_hash", "created_at"]
+
+
+class SharedRevisionSerializer(serializers.ModelSerializer):
+    """A revision someone shared with the requesting user, and when it was shared."""
+
+    shared_at = serializers.DateTimeField(read_only=True)
+
+    class Meta:
+        model = Document
+        fields = ["id", "version_number", "file_name", "content_hash", "created_at", "shared_at"]
+
+
+class SharedDocumentSerializer(serializers.Serializer):
+    """Revisions of one document shared with the requesting user, grouped under its owner and URL."""
+
+    owner = UserSerializer()
+    url = serializers.CharField()
+    revisions = SharedRevisionSerializer(many=True)
+
+
+class SearchResultSerializer(serializers.ModelSerializer):
+    """A document matching a full-text search, with its score and an excerpt around the matches."""
+
+    owner = serializers.StringRelatedField(source="user", read_only=True)
+    score = serializers.FloatField(read_only=True)
+    snippet = serializers.CharField(read_only=True)
+
+    class Meta:
+        model = Document
+        fields = [
+            "id",
+            "url",
+            "file_name",
+            "version_number",
+            "content_hash",
+            "created_at",
+            "owner",
+            "score",
+            "snippet",
+        ]
+
+
+class StorageUsageSerializer(serializers.ModelSerializer):
+    """The revisions a user holds, their total size and the user's quota (null if unlimited)."""
+
+    quota = serializers.SerializerMethodField()
+
+    class Meta:
+        model = StorageUsage
+        fields = ["revisions", "bytes", "quota", "updated_at"]
+
+    def get_quota(self, obj):
+        return quota_of(obj)
+
+
+class URLUsageSerializer(serializers.ModelSerializer):
+    """The revisions of one document URL and their total size."""
+
+    class Meta:
+        model = DocumentHead
+        fields = ["url", "revisions", "bytes"]
@@ -3,14 +3,32 @@ from rest_framework.mixins import RetrieveModelMixin, ListModelMixin
 from rest_framework.viewsets import GenericViewSet
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
-from ..models import FileVersion, Document, DocumentShare, User
-from .serializers import FileVersionSerializer, DocumentWithRevisionsSerializer, DocumentSerializer
+from ..models import FileVersion, Document, DocumentAccess, DocumentHead, DocumentShare, ShareJob, UploadSession
+from .serializers import FileVersionSerializer, DocumentWithRevisionsSerializer, DocumentSerializer, \
+    UploadSessionSerializer, UploadNegotiationSerializer, ShareJobSerializer, FolderDocumentSerializer, \
+    SharedDocumentSerializer, SearchResultSerializer, StorageUsageSerializer, URLUsageSerializer
 from rest_framework.response import Response
-from django.http import FileResponse
 from rest_framework import status
-from ..pagination import StandardResultsSetPagination
-from django.db import models, transaction
-import hashlib
+from ..pagination import DocumentCursorPagination, SharedWithMeCursorPagination, StandardResultsSetPagination
+from .downloads import document_response
+from .exports import export_response
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from rest_framework.exceptions import ValidationError
+from ..services import DuplicateRevisionError, create_revision, create_revision_by_reference
+from ..uploadhandlers import ContentHashUploadHandler
+from ..chunked_uploads import OffsetMismatchError, UploadSizeError, abort_upload, append_chunk, complete_upload
+from ..bulk_uploads import ArchiveError, archive_entries, ingest
+from ..sharing import reconcile_shares, start_share_job
+from ..folders import list_folder
+from ..search import SearchResults
+from ..diffs import OUTPUTS, DiffError, diff_revisions
+from ..usage import QuotaExceededError, has_room, usage_of
+from django.utils.decorators import method_decorator
+from django.urls import reverse
+import io
+from collections import Counter
 
 
 class FileVersionViewSet(RetrieveModelMixin, ListModelMixin, GenericViewSet):
@@ -21,54 +39,68 @@ class FileVersionViewSet(RetrieveModelMixin, ListModelMixin, GenericViewSet):
     lookup_field = "id"
 
 
+def latest_revision(user, url):
+    """
+    The newest revision of ``url``, found through its head in a single lookup.
+    Documents without a head (e.g. created directly through the ORM) are
+    still found by sorting their revisions.
+    """
+    head = DocumentHead.objects.filter(user=user, url=url).select_related("latest__blob").first()
+    if head is not None and head.latest is not None:
+        return head.latest
+    return (
+        Document.objects.filter(user=user, url=url)
+        .select_related("blob")
+        .order_by("-version_number")
+        .first()
+    )
+
+
+QUOTA_EXCEEDED = "Storing this file would exceed your storage quota."
+
+
+# Bytes of a multipart body allowed for boundaries, part headers and other fields besides the file
+MULTIPART_OVERHEAD = 64 * 2**10
+
+
+def smallest_upload(request):
+    """The fewest bytes the file in the multipart request body can hold, 0 if unknown."""
+    try:
+        length = int(request.META.get("CONTENT_LENGTH") or 0)
+    except ValueError:
+        return 0
+    return max(length - MULTIPART_OVERHEAD, 0)
+
+
 class DocumentView(APIView):
     """Handles upload (POST) and retrieval (GET) of documents by URL."""
 
     permission_classes = [IsAuthenticated]
 
+    def initialize_request(self, request, *args, **kwargs):
+        # Hash uploads while they are streamed into blob storage instead of
+        # buffering them and reading them back afterwards
+        request.upload_handlers = [ContentHashUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
+
     def post(self, request, url):
         user = request.user
+        # Rejects bodies too large for any file they may carry to fit, before
+        # request.FILES parses them into storage; the exact size is checked on save.
+        if not has_room(user, smallest_upload(request)):
+            return Response({"detail": QUOTA_EXCEEDED}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
         uploaded_file = request.FILES["file"]
 
-        # Compute hash first
-        hasher = hashlib.sha256()
-        for chunk in uploaded_file.chunks():
-            hasher.update(chunk)
-        file_hash = hasher.hexdigest()
-
-        # Check if any document with this hash already exists for same user & url
-        if Document.objects.filter(user=user, url=url, content_hash=file_hash).exists():
+        try:
+            # The upload handler has already hashed the file while receiving it
+            document = create_revision(user, url, uploaded_file, uploaded_file.name)
+        except DuplicateRevisionError:
             return Response(
                 {"detail": "This file already exists for this URL (duplicate content)."},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-
-        # Determine next version number
-        last_doc = (
-            Document.objects.filter(user=user, url=url)
-            .select_related("version")
-            .order_by("-version__version_number")
-            .first()
-        )
-        if last_doc:
-            version_number = last_doc.version.version_number + 1
-        else:
-            version_number = 0
-
-        # Create FileVersion
-        file_version = FileVersion.objects.create(
-            file_name=uploaded_file.name,
-            version_number=version_number,
-        )
-
-        # Save Document
-        document = Document.objects.create(
-            user=user,
-            url=url,
-            file=uploaded_file,
-            version=file_version,
-            content_hash=file_hash,  # reuse computed hash
-        )
+        except QuotaExceededError:
+            return Response({"detail": QUOTA_EXCEEDED}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
 
         serializer = DocumentSerializer(document)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -77,36 +109,255 @@ class DocumentView(APIView):
     def get(self, request, url):
         """Retrieve latest or specific revision of a document."""
         user = request.user
-        revision = request.query_params.get("revision")
+        revision = _revision_number(request, "revision")
 
-        qs = Document.objects.filter(user=user, url=url).select_related("version")
+        qs = Document.objects.filter(user=user, url=url).select_related("blob")
 
         if revision is not None:
-            doc = get_object_or_404(qs, version__version_number=int(revision))
+            doc = get_object_or_404(qs, version_number=revision)
         else:
-            doc = qs.order_by("-version__version_number").first()
+            doc = latest_revision(user, url)
             if not doc:
                 return Response({"detail": "Not found"}, status=404)
 
-        return FileResponse(doc.file, as_attachment=True, filename=doc.version.file_name)
+        return document_response(request, doc)
+
+
+def _revision_number(request, name):
+    value = request.query_params.get(name)
+    if value is None:
+        return None
+    if not value.isdigit():
+        raise ValidationError({name: "Must be a revision number."})
+    return int(value)
+
+
+class DocumentDiffView(APIView):
+    """
+    Compares two revisions of a document as text. ``to`` defaults to the latest
+    revision and ``from`` to the one before ``to``; ``output`` is "unified" or
+    "structured".
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, url):
+        output = request.query_params.get("output", "unified")
+        if output not in OUTPUTS:
+            raise ValidationError({"output": f"Must be one of: {', '.join(OUTPUTS)}."})
+        old_number, new_number = _revision_number(request, "from"), _revision_number(request, "to")
+
+        if new_number is None:
+            latest = latest_revision(request.user, url)
+            if latest is None:
+                return Response({"detail": "Not found"}, status=404)
+            new_number = latest.version_number
+        if old_number is None:
+            if new_number == 0:
+                raise ValidationError({"from": "Revision 0 has no previous revision."})
+            old_number = new_number - 1
+
+        revisions = Document.objects.filter(
+            user=request.user, url=url, version_number__in=[old_number, new_number]
+        ).select_related("blob")
+        revisions = {doc.version_number: doc for doc in revisions}
+        if old_number not in revisions or new_number not in revisions:
+            return Response({"detail": "Not found"}, status=404)
+        old, new = revisions[old_number], revisions[new_number]
+
+        try:
+            result = diff_revisions(old, new, output)
+        except DiffError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if output == "unified" and not result["identical"]:
+            headers = f"--- {url}\tv{old_number}\n+++ {url}\tv{new_number}\n"
+            result = {**result, "diff": headers + result["diff"]}
+        return Response(
+            {
+                "url": url,
+                "from": {"version_number": old_number, "content_hash": old.content_hash},
+                "to": {"version_number": new_number, "content_hash": new.content_hash},
+                **result,
+            }
+        )
+
+
+class DocumentNegotiateView(APIView):
+    """
+    Pre-flight for an upload (POST): given the ``url``, ``content_hash``,
+    ``size`` and ``file_name`` of a file, either rejects it as a duplicate
+    revision, creates the revision from content the server already has, or
+    asks for the bytes to be uploaded.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = UploadNegotiationSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        try:
+            document = create_revision_by_reference(
+                request.user, data["url"], data["content_hash"], data["size"], data["file_name"]
+            )
+        except DuplicateRevisionError:
+            return Response(
+                {"status": "duplicate", "detail": "This file already exists for this URL (duplicate content)."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        except QuotaExceededError:
+            return Response({"detail": QUOTA_EXCEEDED}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+        if document is None:
+            upload_url = reverse("api:document", kwargs={"url": data["url"]})
+            return Response({"status": "upload_required", "upload_url": request.build_absolute_uri(upload_url)})
+        return Response(
+            {"status": "created", "document": DocumentSerializer(document).data}, status=status.HTTP_201_CREATED
+        )
+
+
+@method_decorator(transaction.non_atomic_requests, name="dispatch")
+class DocumentBulkView(APIView):
+    """
+    Stores many documents in one request (POST), either as a multipart batch of
+    ``files`` with a matching list of ``urls``, or as a tar/zip archive body
+    whose member paths (under the optional ``prefix`` parameter) are the URLs.
+    Each batch of entries is committed on its own, so a large import is not
+    held in a single transaction.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def initialize_request(self, request, *args, **kwargs):
+        request.upload_handlers = [ContentHashUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
+
+    def post(self, request):
+        if request.content_type.startswith("multipart/"):
+            files = request.FILES.getlist("files")
+            urls = request.data.getlist("urls")
+            if not files or len(urls) != len(files):
+                for file in files:
+                    file.close()
+                return Response(
+                    {"detail": "Send one url per file in the urls field"}, status=status.HTTP_400_BAD_REQUEST
+                )
+            entries = [(url, file, file.name) for url, file in zip(urls, files)]
+        else:
+            content_type = request.content_type.split(";")[0].strip()
+            prefix = request.query_params.get("prefix", "")
+            entries = archive_entries(request.stream or io.BytesIO(), content_type, prefix)
+
+        try:
+            results = ingest(request.user, entries)
+        except ArchiveError as e:
+            # Batches before the unreadable part of the archive are committed and reported
+            return Response(
+                {
+                    "detail": f"Not a readable tar or zip archive: {e}",
+                    "created": sum(result["status"] == "created" for result in e.results),
+                    "results": e.results,
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        except QuotaExceededError:
+            # Batches stored before the quota was reached are kept
+            return Response(
+                {"detail": "Storing these files would exceed your storage quota."},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            )
+
+        counts = Counter(result["status"] for result in results)
+        summary = {key: counts[key] for key in ("created", "duplicate", "invalid")}
+        return Response({**summary, "results": results})
+
+
+class DocumentExportView(APIView):
+    """
+    Downloads every revision of the user's documents as one streamed ZIP
+    archive (GET), optionally limited to a single ``url`` or a URL ``prefix``.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        url = request.query_params.get("url")
+        prefix = request.query_params.get("prefix")
+        documents = Document.objects.filter(user=request.user)
+        if url is not None:
+            documents = documents.filter(url=url)
+            if not documents.exists():
+                return Response({"detail": "Not found"}, status=404)
+        elif prefix:
+            documents = documents.filter(url__startswith=prefix)
+
+        documents = documents.select_related("blob").order_by("url", "version_number")
+        file_name = f"{(url or prefix or 'documents').strip('/').replace('/', '-') or 'documents'}.zip"
+        # Iterate without caching the rows, so exports of any size use constant memory
+        return export_response(documents.iterator(chunk_size=100), file_name)
+
+
+def readable_document(user, content_hash):
+    """The newest document with ``content_hash`` that ``user`` owns or has been shared, if any."""
+    access = (
+        DocumentAccess.objects.filter(content_hash=content_hash, user=user)
+        .select_related("document__blob")
+        .order_by("-document_id")
+        .first()
+    )
+    return access.document if access else None
 
 
 class DocumentByHashView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, content_hash):
-        user = request.user
-        doc = (
-            Document.objects
-            .filter(content_hash=content_hash)
-            .filter(models.Q(user=request.user) | models.Q(shares__shared_with=request.user))
-            .first()
-        )
+        doc = readable_document(request.user, content_hash)
         if not doc:
             return Response({"detail": "Not authorized"}, status=403)
 
-        return FileResponse(doc.file, as_attachment=True, filename=doc.version.file_name)
+        return document_response(request, doc)
+
+
+
+def document_groups_response(request, view):
+    """
+    Paginated response of the user's documents grouped by URL, most recently
+    revised URL first. The page of URLs is read from their heads through an
+    index, without grouping the account's revisions, and only its revisions
+    are loaded, optionally limited to the newest ``revisions``.
+    """
+    limit = request.query_params.get("revisions")
+    if limit is not None and (not limit.isdigit() or int(limit) < 1):
+        raise ValidationError({"revisions": "Must be a positive integer."})
+
+    if request.query_params.get("pagination") == "cursor":
+        paginator = DocumentCursorPagination()
+    else:
+        paginator = StandardResultsSetPagination()
+    heads = (
+        DocumentHead.objects.filter(user=request.user, latest_at__isnull=False)
+        .only("pk", "url", "latest_at")
+        .order_by("-latest_at", "url")
+    )
+    page = [head.url for head in paginator.paginate_queryset(heads, request, view=view)]
+
+    documents = (
+        Document.objects.filter(user=request.user, url__in=page).with_shares()
+    )
+    if limit is not None:
+        documents = documents.annotate(
+            position=Window(RowNumber(), partition_by="url", order_by=F("created_at").desc())
+        ).filter(position__lte=int(limit))
 
+    grouped = {url: [] for url in page}
+    for doc in documents:
+        grouped[doc.url].append(doc)
+
+    result = [DocumentWithRevisionsSerializer({"url": url, "revisions": docs}).data for url, docs in grouped.items()]
+    return paginator.get_paginated_response(result)
 
 
 class DocumentListView(APIView):
@@ -115,25 +366,83 @@ class DocumentListView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        user = request.user
-        documents = Document.objects.filter(user=user).select_related("version")
+        return document_groups_response(request, self)
+
+
+class SharedWithMeView(APIView):
+    """
+    Documents other users have shared with the authenticated user, newest share
+    first. Each page is one query: shares are paginated on their keyset and
+    joined to their documents and owners, then grouped by owner and URL.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        paginator = SharedWithMeCursorPagination()
+        shares = DocumentShare.objects.filter(shared_with=request.user).select_related("document__user")
+        page = paginator.paginate_queryset(shares, request, view=self)
 
-        # Group by URL
         grouped = {}
-        for doc in documents:
-            grouped.setdefault(doc.url, []).append(doc)
+        for share in page:
+            doc = share.document
+            doc.shared_at = share.created_at
+            group = grouped.setdefault((doc.user_id, doc.url), {"owner": doc.user, "url": doc.url, "revisions": []})
+            group["revisions"].append(doc)
 
-        result = []
-        for url, docs in grouped.items():
-            serializer = DocumentWithRevisionsSerializer(
-                {"url": url, "revisions": docs}
-            )
-            result.append(serializer.data)
+        return paginator.get_paginated_response(SharedDocumentSerializer(grouped.values(), many=True).data)
+
+
+class DocumentSearchView(APIView):
+    """
+    Full-text search over the contents of the documents the authenticated user
+    owns or has been shared, best match first (paginated).
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        text = request.query_params.get("q", "").strip()
+        if not text:
+            raise ValidationError({"q": "This parameter is required."})
+
+        paginator = StandardResultsSetPagination()
+        page = paginator.paginate_queryset(SearchResults(request.user, text), request, view=self)
+        return paginator.get_paginated_response(SearchResultSerializer(page, many=True).data)
 
-        # Paginate the result list
+
+class FolderView(APIView):
+    """Lists the sub-folders and documents directly inside a folder of document URLs."""
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, path=""):
+        listing = list_folder(request.user, path)
+        if listing is None:
+            return Response({"detail": "Not found"}, status=404)
+        listing["documents"] = FolderDocumentSerializer(listing["documents"], many=True).data
+        return Response(listing)
+
+
+class StorageUsageView(APIView):
+    """The number and total size of the authenticated user's revisions, and their quota."""
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        return Response(StorageUsageSerializer(usage_of(request.user)).data)
+
+
+class URLUsageListView(APIView):
+    """The authenticated user's document URLs by the space their revisions take, largest first (paginated)."""
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
         paginator = StandardResultsSetPagination()
-        page = paginator.paginate_queryset(result, request, view=self)
-        return paginator.get_paginated_response(page)
+        heads = DocumentHead.objects.filter(user=request.user, revisions__gt=0).order_by("-bytes", "url")
+        page = paginator.paginate_queryset(heads, request, view=self)
+        return paginator.get_paginated_response(URLUsageSerializer(page, many=True).data)
 
 
 class DocumentShareView(APIView):
@@ -145,21 +454,96 @@ class DocumentShareView(APIView):
         if not isinstance(emails, list):
             return Response({"detail": "emails must be a list"}, status=400)
 
-        added, removed, not_found = [], [], []
-        current_shares = {s.shared_with.email: s for s in doc.shares.all()}
+        if request.data.get("async"):
+            job = start_share_job(request.user, doc, emails)
+            return Response(ShareJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+        return Response(reconcile_shares(doc, emails))
 
-        for email in emails:
-            try:
-                target_user = User.objects.get(email=email)
-                if email not in current_shares:
-                    DocumentShare.objects.create(document=doc, shared_with=target_user)
-                    added.append(email)
-            except User.DoesNotExist:
-                not_found.append(email)
 
-        for email, share in current_shares.items():
-            if email not in emails:
-                share.delete()
-                removed.append(email)
+class ShareJobView(APIView):
+    """Reports the progress and, once done, the result of a background share reconciliation."""
 
-        return Response({"added": added, "removed": removed, "not_found": not_found})
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        job = get_object_or_404(ShareJob, pk=pk, user=request.user)
+        return Response(ShareJobSerializer(job).data)
+
+
+class UploadSessionListView(APIView):
+    """Starts a resumable upload of a document revision."""
+
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = UploadSessionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        if not has_room(request.user, serializer.validated_data.get("size") or 0):
+            return Response({"detail": QUOTA_EXCEEDED}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        serializer.save(user=request.user)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+class UploadSessionView(APIView):
+    """
+    Reports the current offset of (GET/HEAD), appends a chunk to (PUT) or
+    aborts (DELETE) a resumable upload.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        session = get_object_or_404(UploadSession, pk=pk, user=request.user)
+        return Response(UploadSessionSerializer(session).data, headers={"Upload-Offset": session.offset})
+
+    def put(self, request, pk):
+        session = get_object_or_404(UploadSession.objects.select_for_update(), pk=pk, user=request.user)
+        try:
+            offset = int(request.headers["Upload-Offset"])
+        except (KeyError, ValueError):
+            return Response({"detail": "Upload-Offset header is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            append_chunk(session, request.stream or io.BytesIO(), offset)
+        except OffsetMismatchError:
+            return Response(
+                {"detail": "Chunk does not start at the current offset", "offset": session.offset},
+                status=status.HTTP_409_CONFLICT,
+                headers={"Upload-Offset": session.offset},
+            )
+        except UploadSizeError:
+            return Response({"detail": "Chunk exceeds the announced upload size"}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(UploadSessionSerializer(session).data, headers={"Upload-Offset": session.offset})
+
+    def delete(self, request, pk):
+        session = get_object_or_404(UploadSession, pk=pk, user=request.user)
+        abort_upload(session)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class UploadSessionCompleteView(APIView):
+    """Finalizes a resumable upload into the next revision of its URL."""
+
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, pk):
+        session = get_object_or_404(UploadSession.objects.select_for_update(), pk=pk, user=request.user)
+        try:
+            document = complete_upload(session)
+        except UploadSizeError:
+            return Response(
+                {"detail": "Upload is incomplete", "offset": session.offset},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        except DuplicateRevisionError:
+            return Response(
+                {"detail": "This file already exists for this URL (duplicate content)."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        except QuotaExceededError:
+            return Response({"detail": QUOTA_EXCEEDED}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+        serializer = DocumentSerializer(document)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -5,3 +5,6 @@ class FileVersionsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "propylon_document_manager.file_versions"
     verbose_name = "File Versions"
+
+    def ready(self):
+        from . import signals  # noqa: F401
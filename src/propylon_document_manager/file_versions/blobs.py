@@ -0,0 +1,83 @@
+"""
+Helpers for the content-addressed blob store.
+
+Every distinct file content is written to storage exactly once, under a path
+derived from its SHA-256 digest, and shared by all documents with that hash.
+"""
+import hashlib
+import os
+import tempfile
+import uuid
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+BLOB_ROOT = "blobs"
+# Uploads are written here first, so moving them into place is a rename
+BLOB_STAGING = f"{BLOB_ROOT}/tmp"
+
+
+def hash_file(file):
+    """Return the SHA-256 hex digest of a Django ``File``."""
+    hasher = hashlib.sha256()
+    for chunk in file.chunks():
+        hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def blob_path(content_hash):
+    """Storage name for the given digest, fanned out to keep directories small."""
+    return f"{BLOB_ROOT}/{content_hash[:2]}/{content_hash[2:4]}/{content_hash}"
+
+
+def staging_dir():
+    """
+    Directory for in-progress uploads, on the same filesystem as the blob store
+    when the storage backend is local.
+    """
+    try:
+        path = default_storage.path(BLOB_STAGING)
+    except NotImplementedError:
+        return settings.FILE_UPLOAD_TEMP_DIR or tempfile.gettempdir()
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def store_blob_file(content, content_hash):
+    """
+    Write ``content`` to its content-addressed location and return the storage name.
+
+    The bytes are written under a temporary name in the staging area (staged
+    uploads already are) and renamed into place, so the blob path never holds
+    a partly written file. A file already there (e.g. left behind by a rolled
+    back transaction or an unused blob awaiting collection) is reused if it has
+    the expected size, and touched so collect_blobs leaves it alone until the
+    new reference is committed; otherwise it is overwritten.
+    """
+    name = blob_path(content_hash)
+    try:
+        path = default_storage.path(name)
+    except NotImplementedError:
+        # Remote storages only make whole objects visible, so no partial files to guard against
+        if default_storage.exists(name) and default_storage.size(name) == content.size:
+            return name
+        return default_storage.save(name, content)
+
+    if os.path.exists(path) and os.path.getsize(path) == content.size:
+        os.utime(path)
+        return name
+
+    if hasattr(content, "temporary_file_path"):
+        staged = content.temporary_file_path()
+    else:
+        staged = default_storage.path(default_storage.save(f"{BLOB_STAGING}/{uuid.uuid4().hex}", content))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.replace(staged, path)
+    if default_storage.file_permissions_mode is not None:
+        os.chmod(path, default_storage.file_permissions_mode)
+    return name
+
+
+def delete_blob_file(name):
+    if name and default_storage.exists(name):
+        default_storage.delete(name)
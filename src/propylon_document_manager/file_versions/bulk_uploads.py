@@ -0,0 +1,143 @@
+"""
+Bulk ingest of many documents in one request, either as a multipart batch
+or as a tar/zip archive whose members become revisions of their paths.
+Entries are stored in batches, one transaction each.
+"""
+import hashlib
+import mimetypes
+import os
+import posixpath
+import shutil
+import tarfile
+import tempfile
+import zipfile
+import zlib
+from itertools import islice
+
+from .blobs import staging_dir
+from .services import create_revisions
+from .uploadhandlers import StagedUploadedFile
+
+# Keeps ``url__in`` lookups below SQLite's parameter limit and bounds open staged files
+BATCH_SIZE = 500
+CHUNK_SIZE = 64 * 2**10
+URL_MAX_LENGTH = 1024
+ZIP_CONTENT_TYPES = ("application/zip", "application/x-zip-compressed")
+# Raised by tarfile, zipfile and their decompressors for corrupt or truncated archives
+CORRUPT_ARCHIVE_ERRORS = (tarfile.TarError, zipfile.BadZipFile, zlib.error, EOFError)
+
+
+class ArchiveError(Exception):
+    """
+    The request body is not a readable tar or zip archive. ``results`` holds
+    the results of the entries committed before the error, if any were.
+    """
+
+    results = ()
+
+
+def _stage(fileobj, name):
+    """Copy an archive member to the blob staging area, hashing it on the way."""
+    hasher = hashlib.sha256()
+    fd, path = tempfile.mkstemp(suffix=".upload", dir=staging_dir())
+    try:
+        with os.fdopen(fd, "wb") as staged:
+            for chunk in iter(lambda: fileobj.read(CHUNK_SIZE), b""):
+                hasher.update(chunk)
+                staged.write(chunk)
+            size = staged.tell()
+    except BaseException:
+        os.remove(path)
+        raise
+    file_name = posixpath.basename(name)
+    content_type = mimetypes.guess_type(file_name)[0]
+    return StagedUploadedFile(path, file_name, content_type, size, None, hasher.hexdigest())
+
+
+def _member_url(prefix, name):
+    return posixpath.join(prefix, name.lstrip("/").removeprefix("./")).strip("/")
+
+
+def archive_entries(stream, content_type, prefix=""):
+    """
+    Yield ``(url, content, file_name)`` for every file in the archive read from
+    ``stream``. Tar archives (optionally compressed) are read as a stream; zip
+    archives need random access, so they are spooled to the staging area first.
+
+    Raises ArchiveError when the archive cannot be opened, and also when it
+    turns out to be corrupt or truncated partway through.
+    """
+    try:
+        if content_type in ZIP_CONTENT_TYPES:
+            yield from _zip_entries(stream, prefix)
+        else:
+            yield from _tar_entries(stream, prefix)
+    except CORRUPT_ARCHIVE_ERRORS as e:
+        raise ArchiveError(str(e) or type(e).__name__) from e
+
+
+def _zip_entries(stream, prefix):
+    with tempfile.TemporaryFile(dir=staging_dir()) as spooled:
+        shutil.copyfileobj(stream, spooled, CHUNK_SIZE)
+        with zipfile.ZipFile(spooled) as archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                with archive.open(info) as member:
+                    content = _stage(member, info.filename)
+                yield _member_url(prefix, info.filename), content, content.name
+
+
+def _tar_entries(stream, prefix):
+    with tarfile.open(fileobj=stream, mode="r|*") as archive:
+        for info in archive:
+            if not info.isfile():
+                continue
+            content = _stage(archive.extractfile(info), info.name)
+            yield _member_url(prefix, info.name), content, content.name
+
+
+def _result(url, content, document, status):
+    result = {"url": url, "file_name": content.name, "status": status}
+    if document is not None:
+        result.update(content_hash=document.content_hash, version_number=document.version_number)
+    return result
+
+
+def _next_batch(entries, results):
+    batch = []
+    try:
+        batch.extend(islice(entries, BATCH_SIZE))
+    except ArchiveError as e:
+        for _, content, _ in batch:
+            content.close()
+        e.results = results
+        raise
+    return batch
+
+
+def ingest(user, entries):
+    """
+    Store ``(url, content, file_name)`` entries as new revisions for ``user``
+    and return one result per entry, with ``status`` "created", "duplicate"
+    or "invalid". Staged files are cleaned up batch by batch.
+
+    An ArchiveError raised while reading the entries carries the results of
+    the batches committed before it in ``results``.
+    """
+    entries = iter(entries)
+    results = []
+    while batch := _next_batch(entries, results):
+        try:
+            valid = [entry for entry in batch if 0 < len(entry[0]) <= URL_MAX_LENGTH]
+            documents = iter(create_revisions(user, valid))
+            for url, content, _ in batch:
+                if 0 < len(url) <= URL_MAX_LENGTH:
+                    document = next(documents)
+                    results.append(_result(url, content, document, "created" if document else "duplicate"))
+                else:
+                    results.append(_result(url, content, None, "invalid"))
+        finally:
+            for _, content, _ in batch:
+                content.close()
+    return results
@@ -0,0 +1,138 @@
+"""
+Resumable uploads: chunks are appended to a staging file at the offset the
+client reports, and hashed as they arrive so finalizing never rescans the
+assembled file.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .blobs import hash_file
+from .models import UploadSession
+from .services import create_revision
+from .uploadhandlers import StagedUploadedFile
+
+CHUNK_SIZE = 64 * 2**10
+# Sessions whose running digest is kept per process, least recently used dropped first
+MAX_RUNNING_HASHERS = 256
+
+# Running digests per session, as (offset hashed up to, hasher). Hash state
+# cannot be persisted, so a session continued in another process catches up
+# by hashing what was already received, once per switch of process.
+_hashers = OrderedDict()
+_hashers_lock = threading.Lock()
+
+
+class OffsetMismatchError(Exception):
+    """The chunk does not start where the previous one ended."""
+
+
+class UploadSizeError(Exception):
+    """The upload does not match the size announced by the client."""
+
+
+def _running_hasher(session):
+    with _hashers_lock:
+        offset, hasher = _hashers.get(session.pk, (None, None))
+    if offset == session.offset:
+        # Work on a copy so a failed chunk leaves the cached state untouched
+        return hasher.copy()
+
+    hasher = hashlib.sha256()
+    if session.offset:
+        with open(session.staging_path, "rb") as received:
+            remaining = session.offset
+            while remaining:
+                chunk = received.read(min(CHUNK_SIZE, remaining))
+                hasher.update(chunk)
+                remaining -= len(chunk)
+    return hasher
+
+
+def _keep_hasher(session, hasher):
+    with _hashers_lock:
+        _hashers[session.pk] = (session.offset, hasher)
+        _hashers.move_to_end(session.pk)
+        while len(_hashers) > MAX_RUNNING_HASHERS:
+            _hashers.popitem(last=False)
+
+
+def append_chunk(session, stream, offset):
+    """
+    Append the bytes read from ``stream`` to the session, which must be locked
+    for update by the caller. Returns the new offset.
+
+    Raises UploadSizeError as soon as the chunk runs past the announced size,
+    without reading the rest of it, and keeps nothing of the chunk.
+    """
+    if offset != session.offset:
+        raise OffsetMismatchError(session.offset)
+
+    remaining = None if session.size is None else session.size - offset
+    hasher = _running_hasher(session)
+    with open(session.staging_path, "r+b" if os.path.exists(session.staging_path) else "wb") as received:
+        # Drop anything a failed earlier request wrote past the acknowledged offset
+        received.seek(offset)
+        received.truncate()
+        for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+            if remaining is not None:
+                remaining -= len(chunk)
+                if remaining < 0:
+                    received.truncate(offset)
+                    raise UploadSizeError(session.size)
+            hasher.update(chunk)
+            received.write(chunk)
+        new_offset = received.tell()
+
+    session.offset = new_offset
+    session.save(update_fields=["offset", "updated_at"])
+    _keep_hasher(session, hasher)
+    return new_offset
+
+
+def complete_upload(session):
+    """
+    Turn a fully received session into the next revision of its URL. The
+    session is used up either way; DuplicateRevisionError is raised like for
+    a regular upload.
+    """
+    if session.size is not None and session.offset != session.size:
+        raise UploadSizeError(session.size)
+
+    with _hashers_lock:
+        offset, hasher = _hashers.pop(session.pk, (None, None))
+
+    if not os.path.exists(session.staging_path):
+        open(session.staging_path, "wb").close()
+    staged = StagedUploadedFile(session.staging_path, session.file_name, None, session.offset, None, None)
+    try:
+        staged.content_hash = hasher.hexdigest() if offset == session.offset else hash_file(staged)
+        return create_revision(session.user, session.url, staged, session.file_name, staged.content_hash)
+    finally:
+        staged.close()
+        session.delete()
+
+
+def abort_upload(session):
+    with _hashers_lock:
+        _hashers.pop(session.pk, None)
+    if os.path.exists(session.staging_path):
+        os.remove(session.staging_path)
+    session.delete()
+
+
+def expire_uploads():
+    """
+    Abort the upload sessions that received nothing for
+    DOCUMENT_UPLOAD_SESSION_TIMEOUT seconds. Returns how many were aborted.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.DOCUMENT_UPLOAD_SESSION_TIMEOUT)
+    expired = UploadSession.objects.filter(updated_at__lt=cutoff)
+    for session in expired:
+        abort_upload(session)
+    return len(expired)
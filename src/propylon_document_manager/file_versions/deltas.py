@@ -0,0 +1,268 @@
+"""
+Reverse-delta storage for revision chains.
+
+The newest revision of a URL is kept in full and older revisions are stored
+as binary deltas against their successor. A delta is a zlib-compressed list
+of operations that either copy a range of the base or insert literal bytes.
+"""
+import logging
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from os.path import commonprefix
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections
+from django.db.models import F
+
+from propylon_document_manager.site.transactions import atomic_write
+
+from .blobs import blob_path
+
+logger = logging.getLogger(__name__)
+
+# Encoding deltas is CPU-bound pure Python, kept off the request that uploaded the revision
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="deltify")
+
+MAGIC = b"PDD1"
+BLOCK_SIZE = 32
+COPY = b"C"
+INSERT = b"I"
+COPY_OP = struct.Struct(">QI")
+INSERT_OP = struct.Struct(">I")
+
+
+def _match_length(a, a_start, b, b_start, step=4096):
+    """Length of the common run of ``a[a_start:]`` and ``b[b_start:]``."""
+    length = 0
+    while True:
+        left = a[a_start + length : a_start + length + step]
+        right = b[b_start + length : b_start + length + step]
+        if not left or not right:
+            return length
+        if left == right:
+            length += len(left)
+            continue
+        return length + len(commonprefix([left, right]))
+
+
+def make_delta(base, target, max_size):
+    """
+    Encode ``target`` as a delta against ``base``.
+
+    Returns None as soon as it is clear the delta would not be smaller than
+    ``max_size``, so unrelated files are given up on early.
+    """
+    index = {}
+    for offset in range(0, len(base) - BLOCK_SIZE + 1, BLOCK_SIZE):
+        index.setdefault(base[offset : offset + BLOCK_SIZE], offset)
+
+    ops = []
+    literal_start = 0
+    literal_bytes = 0
+    position = 0
+    end = len(target) - BLOCK_SIZE
+    while position <= end:
+        base_offset = index.get(target[position : position + BLOCK_SIZE])
+        if base_offset is None:
+            position += 1
+            if literal_bytes + position - literal_start > max_size:
+                return None
+            continue
+
+        # Grow the match backwards into the pending literal, then forwards
+        start = position
+        while start > literal_start and base_offset > 0 and target[start - 1] == base[base_offset - 1]:
+            start -= 1
+            base_offset -= 1
+        length = _match_length(target, start, base, base_offset)
+
+        if start > literal_start:
+            chunk = target[literal_start:start]
+            literal_bytes += len(chunk)
+            ops.append(INSERT + INSERT_OP.pack(len(chunk)) + chunk)
+        ops.append(COPY + COPY_OP.pack(base_offset, length))
+        position = literal_start = start + length
+
+    if literal_start < len(target):
+        chunk = target[literal_start:]
+        ops.append(INSERT + INSERT_OP.pack(len(chunk)) + chunk)
+
+    delta = MAGIC + zlib.compress(b"".join(ops))
+    if len(delta) > max_size:
+        return None
+    return delta
+
+
+def apply_delta(base, delta):
+    if not delta.startswith(MAGIC):
+        raise ValueError("Not a document delta")
+    ops = memoryview(zlib.decompress(delta[len(MAGIC) :]))
+    base = memoryview(base)
+    result = bytearray()
+    position = 0
+    while position < len(ops):
+        op = bytes(ops[position : position + 1])
+        position += 1
+        if op == COPY:
+            offset, length = COPY_OP.unpack_from(ops, position)
+            position += COPY_OP.size
+            result += base[offset : offset + length]
+        elif op == INSERT:
+            (length,) = INSERT_OP.unpack_from(ops, position)
+            position += INSERT_OP.size
+            result += ops[position : position + length]
+            position += length
+        else:
+            raise ValueError(f"Unknown delta operation {op!r}")
+    return bytes(result)
+
+
+class MaterializedCache:
+    """Thread-safe LRU of rebuilt revisions, bounded by their total size in bytes."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            data = self._items.get(key)
+            if data is not None:
+                self._items.move_to_end(key)
+            return data
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._items:
+                return
+            self._items[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.size = 0
+
+
+materialized_revisions = MaterializedCache(settings.DOCUMENT_DELTA_CACHE_SIZE)
+
+
+def _read(blob):
+    with blob.file.open("rb") as stored:
+        return stored.read()
+
+
+def materialize(blob):
+    """Return the full content of a blob, rebuilding it from its delta chain if needed."""
+    chain = []
+    data = None
+    while blob.delta_base_id is not None:
+        data = materialized_revisions.get(blob.content_hash)
+        if data is not None:
+            break
+        chain.append(blob)
+        blob = blob.delta_base
+    if data is None:
+        data = _read(blob)
+
+    for blob in reversed(chain):
+        data = apply_delta(data, _read(blob))
+        materialized_revisions.put(blob.content_hash, data)
+    return data
+
+
+def _depends_on(blob, other):
+    """Whether rebuilding ``blob`` requires ``other``."""
+    while blob is not None:
+        if blob.pk == other.pk:
+            return True
+        blob = blob.delta_base
+    return False
+
+
+def _is_latest(blob):
+    """Whether ``blob`` holds the latest revision of any URL, of any user."""
+    from .models import DocumentHead
+
+    return DocumentHead.objects.filter(latest__blob=blob).exists()
+
+
+def deltify(blob, base):
+    """
+    Store ``blob`` as a delta against ``base`` if that saves enough space.
+    Content that is still the latest revision of some URL stays in full.
+    Returns the number of bytes saved.
+    """
+    blob.refresh_from_db()
+    base.refresh_from_db()
+    if blob.delta_base_id is not None or blob.size > settings.DOCUMENT_DELTA_MAX_SIZE:
+        return 0
+    if base.size > settings.DOCUMENT_DELTA_MAX_SIZE or _depends_on(base, blob) or _is_latest(blob):
+        return 0
+
+    delta = make_delta(materialize(base), _read(blob), int(blob.size * settings.DOCUMENT_DELTA_MAX_RATIO))
+    if delta is None:
+        return 0
+
+    Blob = type(blob)
+    full_name = blob.file.name
+    base_state = (base.file.name, base.delta_base_id)
+    with atomic_write():
+        # Locked in a fixed order so jobs converting the two against each other cannot deadlock
+        locked = {b.pk: b for b in Blob.objects.select_for_update().filter(pk__in=[blob.pk, base.pk]).order_by("pk")}
+        # Another process may have converted either of them in the meantime, possibly
+        # ``base`` against ``blob``, which would make the chains a cycle
+        current, current_base = locked.get(blob.pk), locked.get(base.pk)
+        if current is None or current.delta_base_id is not None or current.file.name != full_name:
+            return 0
+        if current_base is None or (current_base.file.name, current_base.delta_base_id) != base_state:
+            return 0
+        if _depends_on(current_base, blob) or _is_latest(blob):
+            return 0
+        # The full file is left for collect_blobs, like any other file no blob refers to
+        name = default_storage.save(blob_path(blob.content_hash) + ".delta", ContentFile(delta))
+        blob.file.name = name
+        blob.delta_base = base
+        blob.save(update_fields=["file", "delta_base"])
+        Blob.objects.filter(pk=base.pk).update(ref_count=F("ref_count") + 1)
+    return blob.size - len(delta)
+
+
+def deltify_revision(previous, latest):
+    """
+    Replace the previous revision of a URL with a delta against the new latest one,
+    keeping every Nth revision in full so chains stay short.
+    """
+    if previous.version_number % settings.DOCUMENT_DELTA_KEYFRAME_INTERVAL == 0:
+        return 0
+    try:
+        return deltify(previous.blob, latest.blob)
+    except Exception:
+        # Losing the space saving is fine, losing the upload is not
+        logger.exception("Could not store %s as a delta", previous.content_hash)
+        return 0
+
+
+def deltify_in_background(pairs):
+    """Run deltify_revision over ``(previous, latest)`` pairs in a background thread."""
+    _executor.submit(_deltify_all, pairs)
+
+
+def _deltify_all(pairs):
+    try:
+        for previous, latest in pairs:
+            deltify_revision(previous, latest)
+    finally:
+        connections.close_all()
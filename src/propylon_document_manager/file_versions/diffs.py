@@ -0,0 +1,103 @@
+"""
+Comparing two revisions as text.
+
+Results are cached by the pair of content hashes, so a comparison is computed
+once however many URLs, users and requests ask for it. Revisions with the same
+content are reported identical without reading either file.
+"""
+import difflib
+
+from django.conf import settings
+from django.core.cache import cache
+
+OUTPUTS = ("unified", "structured")
+# Content sniffed for NUL bytes to tell binary files from text
+SNIFF_SIZE = 8 * 2**10
+
+
+class DiffError(Exception):
+    """The revisions cannot be compared as text."""
+
+
+def _read_lines(blob):
+    if blob.size > settings.DOCUMENT_DIFF_MAX_SIZE:
+        raise DiffError(f"Only revisions up to {settings.DOCUMENT_DIFF_MAX_SIZE} bytes can be compared.")
+    with blob.open() as content:
+        data = content.read()
+    if b"\0" in data[:SNIFF_SIZE]:
+        raise DiffError("Only UTF-8 text documents can be compared.")
+    try:
+        return data.decode("utf-8").splitlines(keepends=True)
+    except UnicodeDecodeError:
+        raise DiffError("Only UTF-8 text documents can be compared.") from None
+
+
+def _range(start, stop):
+    """A hunk's line range as ``start,length`` (1-based), like diff -u prints it."""
+    length = stop - start
+    if length == 1:
+        return str(start + 1)
+    # An empty range is written as the line before it
+    return f"{start + 1 if length else start},{length}"
+
+
+def _diff_line(prefix, line):
+    if line.endswith("\n"):
+        return prefix + line
+    return prefix + line + "\n\\ No newline at end of file\n"
+
+
+def _unified(matcher, old_lines, new_lines):
+    # Without file names, which are added per request: the cached hunks only depend on the contents
+    hunks = []
+    for group in matcher.get_grouped_opcodes(settings.DOCUMENT_DIFF_CONTEXT_LINES):
+        hunks.append(f"@@ -{_range(group[0][1], group[-1][2])} +{_range(group[0][3], group[-1][4])} @@\n")
+        for op, old_start, old_end, new_start, new_end in group:
+            if op == "equal":
+                hunks.extend(_diff_line(" ", line) for line in old_lines[old_start:old_end])
+                continue
+            hunks.extend(_diff_line("-", line) for line in old_lines[old_start:old_end])
+            hunks.extend(_diff_line("+", line) for line in new_lines[new_start:new_end])
+    return {"diff": "".join(hunks)}
+
+
+def _structured(matcher, old_lines, new_lines):
+    return {
+        "changes": [
+            {
+                "op": op,
+                "from_line": old_start + 1,
+                "from_lines": [line.rstrip("\r\n") for line in old_lines[old_start:old_end]],
+                "to_line": new_start + 1,
+                "to_lines": [line.rstrip("\r\n") for line in new_lines[new_start:new_end]],
+            }
+            for op, old_start, old_end, new_start, new_end in matcher.get_opcodes()
+            if op != "equal"
+        ]
+    }
+
+
+def diff_revisions(old, new, output="unified"):
+    """
+    Compare the contents of two documents. ``output`` is "unified" for the
+    hunks of a unified diff, or "structured" for a list of changed line ranges.
+    Both come with the number of ``added`` and ``removed`` lines.
+
+    Raises DiffError if either revision is too large or not text.
+    """
+    if old.content_hash == new.content_hash:
+        result = {"diff": ""} if output == "unified" else {"changes": []}
+        return {"identical": True, "added": 0, "removed": 0, **result}
+
+    key = f"document-diff:{output}:{old.content_hash}:{new.content_hash}"
+    result = cache.get(key)
+    if result is None:
+        old_lines, new_lines = _read_lines(old.blob), _read_lines(new.blob)
+        matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+        result = (_unified if output == "unified" else _structured)(matcher, old_lines, new_lines)
+        opcodes = matcher.get_opcodes()
+        result["added"] = sum(new_end - new_start for op, _, _, new_start, new_end in opcodes if op != "equal")
+        result["removed"] = sum(old_end - old_start for op, old_start, old_end, _, _ in opcodes if op != "equal")
+        result["identical"] = False
+        cache.set(key, result, settings.DOCUMENT_DIFF_CACHE_TIMEOUT)
+    return result
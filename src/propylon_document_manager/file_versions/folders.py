@@ -0,0 +1,72 @@
+"""
+Folder-style browsing of document URLs. Every URL belongs to the folder
+named by its path up to the last slash; folders are materialized as rows
+pointing at their parent, so listing one never scans the rest of the account.
+"""
+from django.db.models import Count
+
+from .models import DocumentHead, Folder
+
+
+def folder_of(url):
+    """``files/reviews/review.txt`` is in ``files/reviews``, top-level URLs are in ``""``."""
+    return url.rpartition("/")[0]
+
+
+def ancestors(url):
+    """Every folder above ``url``, outermost first."""
+    parts = url.split("/")[:-1]
+    return ["/".join(parts[: depth + 1]) for depth in range(len(parts))]
+
+
+def ensure_folders(user, urls):
+    """Create the folders of ``urls`` that do not exist yet."""
+    paths = {path for url in urls for path in ancestors(url)}
+    if paths:
+        Folder.objects.bulk_create(
+            [Folder(user=user, path=path, parent=folder_of(path)) for path in paths],
+            ignore_conflicts=True,
+        )
+
+
+def list_folder(user, path):
+    """
+    The immediate sub-folders and documents of the folder at ``path``.
+
+    Sub-folders come with the number of documents and folders directly inside
+    them, so the queries touch this folder and the level below it only.
+    Returns None if the folder does not exist.
+    """
+    path = path.strip("/")
+    if path and not Folder.objects.filter(user=user, path=path).exists():
+        return None
+
+    heads = DocumentHead.objects.filter(user=user, latest__isnull=False)
+    folders = list(Folder.objects.filter(user=user, parent=path).order_by("path"))
+    children = [folder.path for folder in folders]
+    document_counts = dict(
+        heads.filter(folder__in=children).values("folder").annotate(count=Count("pk")).values_list("folder", "count")
+    )
+    folder_counts = dict(
+        Folder.objects.filter(user=user, parent__in=children)
+        .values("parent")
+        .annotate(count=Count("pk"))
+        .values_list("parent", "count")
+    )
+    documents = heads.filter(folder=path).select_related("latest").order_by("url")
+
+    return {
+        "path": path,
+        "folders": [
+            {
+                "path": folder.path,
+                "name": folder.name,
+                "documents": document_counts.get(folder.path, 0),
+                "folders": folder_counts.get(folder.path, 0),
+            }
+            for folder in folders
+            # Left behind when all revisions below were deleted
+            if document_counts.get(folder.path) or folder_counts.get(folder.path)
+        ],
+        "documents": [head.latest for head in documents],
+    }
@@ -0,0 +1,121 @@
+import random
+import threading
+import time
+import uuid
+from statistics import quantiles
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, close_old_connections, connection
+from django.test.utils import override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from propylon_document_manager.file_versions.api.views import DocumentListView
+from propylon_document_manager.file_versions.services import create_revision
+from propylon_document_manager.site.transactions import atomic_write
+
+User = get_user_model()
+
+# Host of the simulated list requests, which build absolute pagination links
+BENCHMARK_HOST = "benchmark.invalid"
+
+
+def percentile(latencies, n):
+    if len(latencies) < 2:
+        return latencies[0] if latencies else 0
+    return quantiles(latencies, n=100)[n - 1]
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the throughput of document listing (reads) and uploads (writes) on the configured database "
+        "under concurrent requests"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8, help="Concurrent clients")
+        parser.add_argument("--operations", type=int, default=200, help="Operations per client")
+        parser.add_argument("--write-ratio", type=float, default=0.2, help="Fraction of operations that upload")
+        parser.add_argument("--urls", type=int, default=20, help="Distinct document URLs the clients share")
+
+    def handle(self, *args, **options):
+        user = User.objects.create(email=f"benchmark-{uuid.uuid4().hex}@example.invalid", name="Benchmark")
+        urls = [f"benchmark/{i}.txt" for i in range(options["urls"])]
+        for url in urls:
+            create_revision(user, url, ContentFile(uuid.uuid4().bytes, name="seed.txt"), "seed.txt")
+
+        latencies = {"read": [], "write": []}
+        errors = []
+        lock = threading.Lock()
+        list_view = DocumentListView.as_view()
+        factory = APIRequestFactory(HTTP_HOST=BENCHMARK_HOST)
+
+        def list_documents():
+            request = factory.get("/api/documents/", {"revisions": 1})
+            force_authenticate(request, user=user)
+            list_view(request).render()
+
+        def client():
+            local = {"read": [], "write": []}
+            failed = 0
+            try:
+                for _ in range(options["operations"]):
+                    url = random.choice(urls)
+                    kind = "write" if random.random() < options["write_ratio"] else "read"
+                    started = time.perf_counter()
+                    # Like a request: connections are released at its end, which closes them
+                    # unless CONN_MAX_AGE keeps them or a pool takes them back
+                    close_old_connections()
+                    try:
+                        if kind == "write":
+                            # One transaction taking the write lock up front, like an upload request
+                            with atomic_write():
+                                content = ContentFile(uuid.uuid4().bytes, name="bench.txt")
+                                create_revision(user, url, content, "bench.txt")
+                        else:
+                            # Reads never wait for the write lock
+                            list_documents()
+                    except OperationalError:
+                        failed += 1
+                        continue
+                    finally:
+                        close_old_connections()
+                    local[kind].append(time.perf_counter() - started)
+            finally:
+                connection.close()
+            with lock:
+                for kind, values in local.items():
+                    latencies[kind].extend(values)
+                errors.append(failed)
+
+        threads = [threading.Thread(target=client) for _ in range(options["threads"])]
+        started = time.perf_counter()
+        with override_settings(ALLOWED_HOSTS=[BENCHMARK_HOST]):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        elapsed = time.perf_counter() - started
+
+        with atomic_write():
+            user.delete()
+
+        self.stdout.write(f"{connection.vendor} ({connection.settings_dict['ENGINE']}), {options['threads']} threads")
+        for kind, values in latencies.items():
+            values.sort()
+            self.stdout.write(
+                f"{kind:>5}: {len(values)} ops, {len(values) / elapsed:.0f} ops/s, "
+                f"p50 {percentile(values, 50) * 1000:.1f} ms, p95 {percentile(values, 95) * 1000:.1f} ms, "
+                f"p99 {percentile(values, 99) * 1000:.1f} ms"
+            )
+        # Only set by the pooled PostgreSQL backend
+        pool = getattr(connection, "pool", None)
+        if pool is not None:
+            stats = pool.get_stats()
+            self.stdout.write(
+                f" pool: {stats.get('pool_size', 0)} connections, {stats.get('connections_num', 0)} opened, "
+                f"{stats.get('requests_waiting', 0)} waiting, {stats.get('requests_queued', 0)} requests queued "
+                f"for {stats.get('requests_wait_ms', 0)} ms in total, {stats.get('requests_errors', 0)} timed out"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Finished in {elapsed:.2f}s, {sum(errors)} operations failed"))
@@ -0,0 +1,83 @@
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from propylon_document_manager.file_versions.blobs import BLOB_ROOT, BLOB_STAGING
+from propylon_document_manager.file_versions.chunked_uploads import expire_uploads
+from propylon_document_manager.file_versions.models import Blob, UploadSession
+
+# Directories that hold document content, including files uploaded before the blob store existed
+CONTENT_DIRS = [BLOB_ROOT, "documents"]
+
+
+def walk_storage(path):
+    if not default_storage.exists(path):
+        return
+    dirs, files = default_storage.listdir(path)
+    for name in files:
+        yield f"{path}/{name}"
+    for name in dirs:
+        yield from walk_storage(f"{path}/{name}")
+
+
+class Command(BaseCommand):
+    help = "Recount blob references, then delete unreferenced blobs and stray content files"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Only report what would be changed")
+        parser.add_argument(
+            "--grace-minutes",
+            type=int,
+            default=60,
+            help="Leave files younger than this alone, they may belong to an upload still in progress",
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options["dry_run"]
+
+        with transaction.atomic():
+            fixed = 0
+            counted = Blob.objects.annotate(
+                refs=Count("documents", distinct=True) + Count("delta_dependents", distinct=True)
+            )
+            for blob in counted.select_for_update():
+                if blob.ref_count != blob.refs:
+                    fixed += 1
+                    if not dry_run:
+                        Blob.objects.filter(pk=blob.pk).update(ref_count=blob.refs)
+
+            unused = Blob.objects.filter(documents__isnull=True, delta_dependents__isnull=True)
+            removed = unused.count()
+            if not dry_run:
+                # Their files become stray below and share the grace period, since an upload of
+                # the same content may be reusing one for a row not committed yet
+                unused.delete()
+
+        # Abandoned resumable uploads give up their staging files
+        expired = 0 if dry_run else expire_uploads()
+
+        cutoff = timezone.now() - timedelta(minutes=options["grace_minutes"])
+        known = set(Blob.objects.values_list("file", flat=True))
+        # Resumable uploads may sit idle for a while before they are finished
+        known.update(f"{BLOB_STAGING}/{pk}.part" for pk in UploadSession.objects.values_list("pk", flat=True))
+        stray = [
+            name
+            for path in CONTENT_DIRS
+            for name in walk_storage(path)
+            if name not in known and default_storage.get_modified_time(name) < cutoff
+        ]
+        if not dry_run:
+            for name in stray:
+                default_storage.delete(name)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Fixed {fixed} reference counts, removed {removed} unused blobs "
+                f"and {len(stray)} stray files, expired {expired} upload sessions"
+                + (" (dry run)" if dry_run else "")
+            )
+        )
@@ -1,7 +1,8 @@
 from django.core.management.base import BaseCommand
 from django.contrib.auth import get_user_model
 from django.core.files.base import ContentFile
-from propylon_document_manager.file_versions.models import FileVersion, Document
+from propylon_document_manager.file_versions.models import Document
+from propylon_document_manager.file_versions.services import create_revision
 
 User = get_user_model()
 
@@ -29,20 +30,12 @@ class Command(BaseCommand):
         else:
             print("User already exists. Password updated. ")
 
-        existing_docs = Document.objects.filter(user=user, url=url).order_by("-version__version_number")
-        if existing_docs.exists():
-            next_version = existing_docs.first().version.version_number + 1
-        else:
-            next_version = 0
-
-        # Create FileVersion and Document
+        # The version number itself is assigned by create_revision
+        revision_count = Document.objects.filter(user=user, url=url).count()
         file_name = url.split("/")[-1]
-        fv = FileVersion.objects.create(file_name=file_name, version_number=next_version)
-
-        file_content = ContentFile(f"Revision {next_version} content".encode("utf-8"))
+        file_content = ContentFile(f"Revision {revision_count} content".encode("utf-8"))
         file_content.name = file_name
 
-        Document.objects.create(user=user, url=url, file=file_content, version=fv)
+        create_revision(user, url, file_content, file_name)
 
         print("Document created successfully. ")
-
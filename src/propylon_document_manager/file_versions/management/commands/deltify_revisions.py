@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from propylon_document_manager.file_versions.deltas import deltify_revision
+from propylon_document_manager.file_versions.models import Document
+
+
+class Command(BaseCommand):
+    help = "Store older revisions of every document as deltas against their successor"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=str, help="Only convert documents of the user with this email")
+
+    def handle(self, *args, **options):
+        documents = Document.objects.select_related("blob__delta_base").order_by(
+            "user_id", "url", "-version_number"
+        )
+        if options["user"]:
+            documents = documents.filter(user__email=options["user"])
+
+        converted = saved = 0
+        successor = None
+        for doc in documents.iterator(chunk_size=500):
+            if successor is not None and (successor.user_id, successor.url) == (doc.user_id, doc.url):
+                bytes_saved = deltify_revision(doc, successor)
+                if bytes_saved:
+                    converted += 1
+                    saved += bytes_saved
+            successor = doc
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Stored {converted} revisions as deltas, saving {saved} bytes")
+        )
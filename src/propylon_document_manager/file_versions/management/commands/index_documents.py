@@ -0,0 +1,38 @@
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from propylon_document_manager.file_versions.models import Blob
+from propylon_document_manager.file_versions.search import extract_texts, save_texts
+
+
+def extract_batch(blob_ids):
+    try:
+        # Selected without text up front; any indexed since are skipped when saved
+        return extract_texts(Blob.objects.filter(pk__in=blob_ids))
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = "Extract and index the text of documents that are not searchable yet"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4, help="Blobs extracted in parallel")
+        parser.add_argument("--batch-size", type=int, default=100, help="Blobs indexed per transaction")
+
+    def handle(self, *args, **options):
+        # Blobs only kept as delta bases are not documents of their own. The ids are read
+        # up front so no read is left open while the batches are written.
+        pending = iter(
+            Blob.objects.filter(text__isnull=True, documents__isnull=False).distinct().values_list("pk", flat=True)
+        )
+        batches = iter(lambda: list(islice(pending, options["batch_size"])), [])
+
+        # Only this thread writes, so the workers never queue up for the write lock
+        with ThreadPoolExecutor(max_workers=options["workers"]) as executor:
+            indexed = sum(save_texts(texts) for texts in executor.map(extract_batch, batches))
+
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} blobs"))
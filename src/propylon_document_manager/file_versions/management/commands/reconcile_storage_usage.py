@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from propylon_document_manager.file_versions.usage import reconcile_usage
+
+
+class Command(BaseCommand):
+    help = "Recompute every user's and URL's storage usage from their documents"
+
+    def handle(self, *args, **options):
+        users, urls = reconcile_usage()
+        self.stdout.write(self.style.SUCCESS(f"Corrected the usage of {users} users and {urls} URLs"))
@@ -2,7 +2,8 @@ from django.contrib.auth import get_user_model
 from django.core.files.base import ContentFile
 from django.core.management.base import BaseCommand
 
-from propylon_document_manager.file_versions.models import FileVersion, Document, DocumentShare
+from propylon_document_manager.file_versions.models import Document, DocumentShare
+from propylon_document_manager.file_versions.services import DuplicateRevisionError, create_revision
 
 User = get_user_model()
 
@@ -22,32 +23,26 @@ class Command(BaseCommand):
 
         print("Users successfully created.")
 
-        for user in [user1, user2]:
-            url1 = "files/reviews/review.txt"
-
-            fv0 = FileVersion.objects.create(file_name="review.txt", version_number=0)
-            file0 = ContentFile(b"Revision 0 content")
-            file0.name = "review.txt"
-            Document.objects.create(user=user, url=url1, file=file0, version=fv0)
-
-            fv1 = FileVersion.objects.create(file_name="review.txt", version_number=1)
-            file1 = ContentFile(b"Revision 1 content")
-            file1.name = "review.txt"
-            Document.objects.create(user=user, url=url1, file=file1, version=fv1)
-
+        revisions = [
+            ("files/reviews/review.txt", b"Revision 0 content"),
+            ("files/reviews/review.txt", b"Revision 1 content"),
             # Second URL with a single revision
-            url2 = "files/contracts/nda.txt"
-
-            fv2 = FileVersion.objects.create(file_name="nda.txt", version_number=0)
-            file2 = ContentFile(b"Contract NDA content")
-            file2.name = "nda.txt"
-            Document.objects.create(user=user, url=url2, file=file2, version=fv2)
+            ("files/contracts/nda.txt", b"Contract NDA content"),
+        ]
+        for user in [user1, user2]:
+            for url, content in revisions:
+                file_name = url.split("/")[-1]
+                try:
+                    create_revision(user, url, ContentFile(content, name=file_name), file_name)
+                except DuplicateRevisionError:
+                    # Already seeded by an earlier run
+                    pass
 
             print(f"Documents successfully created for user {user.email}.")
 
         shared_doc = (
             Document.objects.filter(user=user1, url="files/reviews/review.txt")
-            .order_by("-version__version_number")
+            .order_by("-version_number")
             .first()
         )
         if shared_doc:
@@ -0,0 +1,97 @@
+# Generated by Django 5.0.1 on 2026-10-17 09:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+import propylon_document_manager.file_versions.models
+
+
+def move_files_to_blobs(apps, schema_editor):
+    """
+    Create one Blob per distinct content hash, adopting the first existing file
+    in place rather than copying it.
+    """
+    import hashlib
+
+    from django.core.files.storage import default_storage
+
+    Blob = apps.get_model("file_versions", "Blob")
+    Document = apps.get_model("file_versions", "Document")
+    db_alias = schema_editor.connection.alias
+
+    blobs = {}
+    for doc in Document.objects.using(db_alias).order_by("id").iterator():
+        if not doc.content_hash:
+            hasher = hashlib.sha256()
+            for chunk in doc.file.chunks():
+                hasher.update(chunk)
+            doc.content_hash = hasher.hexdigest()
+
+        blob = blobs.get(doc.content_hash)
+        if blob is None:
+            name = doc.file.name
+            size = default_storage.size(name) if default_storage.exists(name) else 0
+            blob = Blob.objects.using(db_alias).create(
+                content_hash=doc.content_hash, file=name, size=size, ref_count=0
+            )
+            blobs[doc.content_hash] = blob
+        blob.ref_count += 1
+
+        doc.blob = blob
+        doc.save(using=db_alias, update_fields=["blob", "content_hash"])
+
+    for blob in blobs.values():
+        blob.save(using=db_alias, update_fields=["ref_count"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("file_versions", "0004_documentshare"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Blob",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("content_hash", models.CharField(max_length=64, unique=True)),
+                (
+                    "file",
+                    models.FileField(
+                        max_length=255, upload_to=propylon_document_manager.file_versions.models.blob_upload_to
+                    ),
+                ),
+                ("size", models.BigIntegerField()),
+                (
+                    "ref_count",
+                    models.PositiveIntegerField(default=0, help_text="Number of documents referencing this content"),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="document",
+            name="blob",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="documents",
+                to="file_versions.blob",
+            ),
+        ),
+        migrations.RunPython(move_files_to_blobs, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name="document",
+            name="file",
+        ),
+        migrations.AlterField(
+            model_name="document",
+            name="blob",
+            field=models.ForeignKey(
+                help_text="The stored file content, shared with identical uploads",
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="documents",
+                to="file_versions.blob",
+            ),
+        ),
+    ]
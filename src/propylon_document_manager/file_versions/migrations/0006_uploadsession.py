@@ -0,0 +1,45 @@
+# Generated by Django 5.0.1 on 2026-10-17 01:15
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("file_versions", "0005_blob"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UploadSession",
+            fields=[
+                ("id", models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                (
+                    "url",
+                    models.CharField(
+                        help_text="Logical document URL the upload will become a revision of", max_length=1024
+                    ),
+                ),
+                ("file_name", models.CharField(max_length=512)),
+                (
+                    "size",
+                    models.BigIntegerField(
+                        blank=True, help_text="Total size announced by the client, if known", null=True
+                    ),
+                ),
+                ("offset", models.BigIntegerField(default=0, help_text="Number of bytes received so far")),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="upload_sessions",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+    ]
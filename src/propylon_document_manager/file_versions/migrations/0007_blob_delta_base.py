@@ -0,0 +1,32 @@
+# Generated by Django 5.0.1 on 2026-10-17 01:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("file_versions", "0006_uploadsession"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="blob",
+            name="delta_base",
+            field=models.ForeignKey(
+                blank=True,
+                help_text="If set, the file holds a delta against this blob instead of the full content",
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="delta_dependents",
+                to="file_versions.blob",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="blob",
+            name="ref_count",
+            field=models.PositiveIntegerField(
+                default=0, help_text="Number of documents and deltas referencing this content"
+            ),
+        ),
+    ]
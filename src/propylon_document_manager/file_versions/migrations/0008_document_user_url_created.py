@@ -0,0 +1,16 @@
+# Generated by Django 5.0.1 on 2026-10-17 01:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("file_versions", "0007_blob_delta_base"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="document",
+            index=models.Index(fields=["user", "url", "created_at"], name="document_user_url_created"),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.0.1 on 2026-10-17 01:29
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def create_heads(apps, schema_editor):
+    """One head per existing (user, url), pointing at its highest version."""
+    Document = apps.get_model("file_versions", "Document")
+    DocumentHead = apps.get_model("file_versions", "DocumentHead")
+    db_alias = schema_editor.connection.alias
+
+    heads = {}
+    rows = Document.objects.using(db_alias).order_by("version__version_number").values(
+        "id", "user_id", "url", "version__version_number"
+    )
+    for doc in rows.iterator():
+        heads[doc["user_id"], doc["url"]] = DocumentHead(
+            user_id=doc["user_id"],
+            url=doc["url"],
+            next_version=doc["version__version_number"] + 1,
+            latest_id=doc["id"],
+        )
+    DocumentHead.objects.using(db_alias).bulk_create(heads.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("file_versions", "0008_document_user_url_created"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DocumentHead",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("url", models.CharField(max_length=1024)),
+                ("next_version", models.PositiveIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "latest",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="file_versions.document",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="document_heads",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="documenthead",
+            constraint=models.UniqueConstraint(fields=("user", "url"), name="unique_head_per_url"),
+        ),
+        migrations.RunPython(create_heads, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.0.1 on 2026-10-17 02:05
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copy_version_fields(apps, schema_editor):
+    Document = apps.get_model("file_versions", "Document")
+    FileVersion = apps.get_model("file_versions", "FileVersion")
+    db_alias = schema_editor.connection.alias
+
+    version = FileVersion.objects.filter(pk=OuterRef("version_id"))
+    Document.objects.using(db_alias).update(
+        version_number=Subquery(version.values("version_number")[:1]),
+        file_name=Subquery(version.values("file_name")[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("file_versions", "0009_documenthead"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="document",
+            name="version_number",
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name="document",
+            name="file_name",
+            field=models.CharField(max_length=512, null=True),
+        ),
+        migrations.RunPython(copy_version_fields, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="document",
+            name="version_number",
+            field=models.IntegerField(),
+        ),
+        migrations.AlterField(
+            model_name="document",
+            name="file_name",
+            field=models.CharField(max_length=512),
+        ),
+        migrations.AddIndex(
+            model_name="document",
+            index=models.Index(fields=["user", "url", "-version_number"], name="document_user_url_version"),
+        ),
+    ]
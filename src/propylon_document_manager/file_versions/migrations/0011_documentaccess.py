@@ -0,0 +1,78 @@
+# Generated by Django 5.0.1 on 2026-10-17 01:32
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def grant_existing_access(apps, schema_editor):
+    Document = apps.get_model("file_versions", "Document")
+    DocumentShare = apps.get_model("file_versions", "DocumentShare")
+    DocumentAccess = apps.get_model("file_versions", "DocumentAccess")
+    db_alias = schema_editor.connection.alias
+
+    DocumentAccess.objects.using(db_alias).bulk_create(
+        (
+            DocumentAccess(content_hash=doc["content_hash"], user_id=doc["user_id"], document_id=doc["id"])
+            for doc in Document.objects.using(db_alias).values("id", "user_id", "content_hash").iterator()
+        ),
+        batch_size=500,
+    )
+    shares = DocumentShare.objects.using(db_alias).values(
+        "id", "shared_with_id", "document_id", "document__content_hash"
+    )
+    DocumentAccess.objects.using(db_alias).bulk_create(
+        (
+            DocumentAccess(
+                content_hash=share["document__content_hash"],
+                user_id=share["shared_with_id"],
+                document_id=share["document_id"],
+                share_id=share["id"],
+            )
+            for share in shares.iterator()
+        ),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("file_versions", "0010_document_version_number_file_name"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DocumentAccess",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("content_hash", models.CharField(max_length=64)),
+                (
+                    "document",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="access", to="file_versions.document"
+                    ),
+                ),
+                (
+                    "share",
+                    models.ForeignKey(
+                        blank=True,
+                        help_text="The share granting access, empty for the owner",
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="file_versions.documentshare",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="+", to=settings.AUTH_USER_MODEL
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [models.Index(fields=["content_hash", "user"], name="access_hash_user")],
+            },
+        ),
+        migrations.RunPython(grant_existing_access, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.0.1 on 2026-10-17 01:34
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def create_folders(apps, schema_editor):
+    """File existing heads under their folder and create every folder above them."""
+    DocumentHead = apps.get_model("file_versions", "DocumentHead")
+    Folder = apps.get_model("file_versions", "Folder")
+    db_alias = schema_editor.connection.alias
+
+    heads = []
+    folders = set()
+    for head in DocumentHead.objects.using(db_alias).only("id", "user_id", "url").iterator():
+        head.folder = head.url.rpartition("/")[0]
+        heads.append(head)
+        parts = head.url.split("/")[:-1]
+        for depth in range(len(parts)):
+            folders.add((head.user_id, "/".join(parts[: depth + 1])))
+    DocumentHead.objects.using(db_alias).bulk_update(heads, ["folder"], batch_size=500)
+    Folder.objects.using(db_alias).bulk_create(
+        [Folder(user_id=user_id, path=path, parent=path.rpartition("/")[0]) for user_id, path in folders],
+        batch_size=500,
+    )
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("file_versions", "0012_sharejob"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Folder",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("path", models.CharField(max_length=1024)),
+                ("parent", models.CharField(blank=True, default="", max_length=1024)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="documenthead",
+            name="folder",
+            field=models.CharField(
+                blank=True,
+                default="",
+                help_text="The URL up to its last slash, empty at the top level",
+                max_length=1024,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="documenthead",
+            index=models.Index(fields=["user", "folder", "url"], name="head_user_folder_url"),
+        ),
+        migrations.AddField(
+            model_name="folder",
+            name="user",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE, related_name="folders", to=settings.AUTH_USER_MODEL
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="folder",
+            index=models.Index(fields=["user", "parent", "path"], name="folder_user_parent_path"),
+        ),
+        migrations.AddConstraint(
+            model_name="folder",
+            constraint=models.UniqueConstraint(fields=("user", "path"), name="unique_folder_per_path"),
+        ),
+        migrations.RunPython(create_folders, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,16 @@
+# Generated by Django 5.0.1 on 2026-10-17 01:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("file_versions", "0013_folders"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="documentshare",
+            index=models.Index(fields=["shared_with", "created_at"], name="share_with_created"),
+        ),
+    ]
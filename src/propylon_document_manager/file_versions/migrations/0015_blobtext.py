@@ -0,0 +1,80 @@
+# Generated by Django 5.0.1 on 2026-10-17 01:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+SQLITE_INDEX = [
+    # External content table: the text is stored once, in file_versions_blobtext
+    """
+    CREATE VIRTUAL TABLE file_versions_blobtext_fts
+    USING fts5(body, content='file_versions_blobtext', content_rowid='blob_id')
+    """,
+    """
+    CREATE TRIGGER file_versions_blobtext_ai AFTER INSERT ON file_versions_blobtext BEGIN
+        INSERT INTO file_versions_blobtext_fts(rowid, body) VALUES (new.blob_id, new.body);
+    END
+    """,
+    """
+    CREATE TRIGGER file_versions_blobtext_ad AFTER DELETE ON file_versions_blobtext BEGIN
+        INSERT INTO file_versions_blobtext_fts(file_versions_blobtext_fts, rowid, body)
+        VALUES ('delete', old.blob_id, old.body);
+    END
+    """,
+    """
+    CREATE TRIGGER file_versions_blobtext_au AFTER UPDATE ON file_versions_blobtext BEGIN
+        INSERT INTO file_versions_blobtext_fts(file_versions_blobtext_fts, rowid, body)
+        VALUES ('delete', old.blob_id, old.body);
+        INSERT INTO file_versions_blobtext_fts(rowid, body) VALUES (new.blob_id, new.body);
+    END
+    """,
+]
+SQLITE_DROP_INDEX = [
+    "DROP TRIGGER IF EXISTS file_versions_blobtext_ai",
+    "DROP TRIGGER IF EXISTS file_versions_blobtext_ad",
+    "DROP TRIGGER IF EXISTS file_versions_blobtext_au",
+    "DROP TABLE IF EXISTS file_versions_blobtext_fts",
+]
+POSTGRESQL_INDEX = [
+    "CREATE INDEX blobtext_body_search ON file_versions_blobtext USING GIN (to_tsvector('simple', body))",
+]
+POSTGRESQL_DROP_INDEX = ["DROP INDEX IF EXISTS blobtext_body_search"]
+
+
+def create_search_index(apps, schema_editor):
+    statements = {"sqlite": SQLITE_INDEX, "postgresql": POSTGRESQL_INDEX}
+    for statement in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    statements = {"sqlite": SQLITE_DROP_INDEX, "postgresql": POSTGRESQL_DROP_INDEX}
+    for statement in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("file_versions", "0014_share_with_created"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BlobText",
+            fields=[
+                (
+                    "blob",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="text",
+                        serialize=False,
+                        to="file_versions.blob",
+                    ),
+                ),
+                ("content_hash", models.CharField(max_length=64)),
+                ("body", models.TextField(blank=True)),
+                ("indexed_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
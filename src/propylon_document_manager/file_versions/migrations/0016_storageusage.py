@@ -0,0 +1,101 @@
+# Generated by Django 5.0.1 on 2026-10-17 09:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def count_usage(apps, schema_editor):
+    """Copy the size of every document from its blob and total them per URL and per user."""
+    Blob = apps.get_model("file_versions", "Blob")
+    Document = apps.get_model("file_versions", "Document")
+    DocumentHead = apps.get_model("file_versions", "DocumentHead")
+    StorageUsage = apps.get_model("file_versions", "StorageUsage")
+    User = apps.get_model("file_versions", "User")
+    db_alias = schema_editor.connection.alias
+
+    blob = Blob.objects.filter(pk=OuterRef("blob_id"))
+    Document.objects.using(db_alias).update(size=Subquery(blob.values("size")[:1]))
+
+    def totals(**filters):
+        documents = Document.objects.filter(**filters).order_by().values("user")
+        return (
+            Coalesce(Subquery(documents.annotate(total=Count("pk")).values("total")), Value(0)),
+            Coalesce(Subquery(documents.annotate(total=Sum("size")).values("total")), Value(0)),
+        )
+
+    revisions, size = totals(user=OuterRef("user"), url=OuterRef("url"))
+    DocumentHead.objects.using(db_alias).update(revisions=revisions, bytes=size)
+
+    StorageUsage.objects.using(db_alias).bulk_create(
+        [StorageUsage(user_id=pk) for pk in User.objects.using(db_alias).values_list("pk", flat=True)],
+        batch_size=1000,
+    )
+    revisions, size = totals(user=OuterRef("user"))
+    StorageUsage.objects.using(db_alias).update(revisions=revisions, bytes=size)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("file_versions", "0015_blobtext"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="document",
+            name="size",
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name="documenthead",
+            name="bytes",
+            field=models.BigIntegerField(default=0, help_text="Total size of the revisions"),
+        ),
+        migrations.AddField(
+            model_name="documenthead",
+            name="revisions",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name="StorageUsage",
+            fields=[
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="storage_usage",
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ("revisions", models.IntegerField(default=0)),
+                (
+                    "bytes",
+                    models.BigIntegerField(
+                        default=0,
+                        help_text="Total size of the revisions, counting content shared between them each time",
+                    ),
+                ),
+                (
+                    "quota",
+                    models.BigIntegerField(
+                        blank=True, help_text="Bytes the user may hold, DOCUMENT_QUOTA_BYTES if empty", null=True
+                    ),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(count_usage, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="document",
+            name="size",
+            field=models.BigIntegerField(),
+        ),
+        migrations.AddIndex(
+            model_name="documenthead",
+            index=models.Index(fields=["user", "-bytes"], name="head_user_bytes"),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.0.1 on 2026-10-17 11:40
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copy_latest_at(apps, schema_editor):
+    Document = apps.get_model("file_versions", "Document")
+    DocumentHead = apps.get_model("file_versions", "DocumentHead")
+    db_alias = schema_editor.connection.alias
+
+    latest = Document.objects.filter(pk=OuterRef("latest_id"))
+    DocumentHead.objects.using(db_alias).update(latest_at=Subquery(latest.values("created_at")[:1]))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("file_versions", "0016_storageusage"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="documenthead",
+            name="latest_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(copy_latest_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="documenthead",
+            index=models.Index(fields=["user", "-latest_at", "url"], name="head_user_latest_url"),
+        ),
+    ]
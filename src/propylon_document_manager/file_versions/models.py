@@ -1,11 +1,18 @@
-import hashlib
+import os
+import uuid
 
 from django.contrib.auth.models import AbstractUser
-from django.db import models
-from django.db.models import CharField, EmailField
+from django.core.files.base import ContentFile
+from django.db import IntegrityError, models, transaction
+from django.db.models import CharField, EmailField, F
 from django.urls import reverse
 from django.utils.translation import gettext_lazy as _
 
+from propylon_document_manager.site.transactions import atomic_write
+
+from .blobs import blob_path, hash_file, staging_dir, store_blob_file
+from .deltas import materialize
+
 
 class User(AbstractUser):
     """
@@ -39,6 +46,113 @@ class FileVersion(models.Model):
     version_number = models.fields.IntegerField()
 
 
+def blob_upload_to(instance, filename):
+    return blob_path(instance.content_hash)
+
+
+class BlobManager(models.Manager):
+    def acquire(self, content, content_hash=None):
+        """
+        Take a reference to the blob holding ``content``, storing it if it is new.
+
+        Re-uploading known content only bumps the reference count; the bytes
+        are never written twice.
+        """
+        if content_hash is None:
+            content_hash = hash_file(content)
+
+        with atomic_write():
+            if self.filter(content_hash=content_hash).update(ref_count=F("ref_count") + 1):
+                return self.get(content_hash=content_hash)
+
+            name = store_blob_file(content, content_hash)
+            try:
+                with transaction.atomic():
+                    return self.create(content_hash=content_hash, file=name, size=content.size, ref_count=1)
+            except IntegrityError:
+                # A concurrent upload stored the same content first
+                self.filter(content_hash=content_hash).update(ref_count=F("ref_count") + 1)
+                return self.get(content_hash=content_hash)
+
+    def release(self, pk):
+        """
+        Drop one reference to a blob and delete its row once nothing uses it.
+
+        The file is left for collect_blobs to remove after its grace period:
+        an upload of the same content running concurrently may already be
+        reusing it for a new row this transaction cannot see yet.
+        """
+        with atomic_write():
+            blob = self.select_for_update().filter(pk=pk).first()
+            if blob is None:
+                return
+            if blob.ref_count > 1 or blob.documents.exists() or blob.delta_dependents.exists():
+                self.filter(pk=pk).update(ref_count=F("ref_count") - 1)
+                return
+
+            blob.delete()
+            if blob.delta_base_id is not None:
+                self.release(blob.delta_base_id)
+
+
+class Blob(models.Model):
+    """
+    A single stored file content, shared by every Document with the same hash.
+    """
+
+    content_hash = models.CharField(max_length=64, unique=True)
+    file = models.FileField(upload_to=blob_upload_to, max_length=255)
+    size = models.BigIntegerField()
+    ref_count = models.PositiveIntegerField(
+        default=0,
+        help_text="Number of documents and deltas referencing this content",
+    )
+    delta_base = models.ForeignKey(
+        "self",
+        null=True,
+        blank=True,
+        on_delete=models.PROTECT,
+        related_name="delta_dependents",
+        help_text="If set, the file holds a delta against this blob instead of the full content",
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = BlobManager()
+
+    def open(self):
+        """Open the full content for reading, rebuilding it if it is stored as a delta."""
+        if self.delta_base_id is None:
+            return self.file.open("rb")
+        return ContentFile(materialize(self), name=self.content_hash)
+
+    def __str__(self):
+        return f"{self.content_hash} ({self.ref_count} refs)"
+
+
+class BlobText(models.Model):
+    """
+    Text extracted from a blob for full-text search, empty if the content is
+    not text. The inverted index over ``body`` (FTS5 on SQLite, a GIN index on
+    PostgreSQL) is created by migration 0015 and kept up to date by the
+    database; on SQLite that is done by triggers, which are lost if Django
+    rebuilds this table in a later migration.
+    """
+
+    blob = models.OneToOneField(Blob, on_delete=models.CASCADE, primary_key=True, related_name="text")
+    # Copied from the blob, to join with DocumentAccess
+    content_hash = models.CharField(max_length=64)
+    body = models.TextField(blank=True)
+    indexed_at = models.DateTimeField(auto_now_add=True)
+
+
+class DocumentQuerySet(models.QuerySet):
+    def with_shares(self):
+        """Load the shares of every document, and who they are shared with, in one extra query."""
+        return self.prefetch_related(
+            models.Prefetch("shares", queryset=DocumentShare.objects.select_related("shared_with"))
+        )
+
+
 class Document(models.Model):
     """
     Represents a single stored file (a revision of a logical document URL)
@@ -54,9 +168,11 @@ class Document(models.Model):
         max_length=1024,
         help_text="Logical document URL chosen by the user",
     )
-    file = models.FileField(
-        upload_to="documents/",
-        help_text="The actual uploaded file content",
+    blob = models.ForeignKey(
+        Blob,
+        on_delete=models.PROTECT,
+        related_name="documents",
+        help_text="The stored file content, shared with identical uploads",
     )
     content_hash = models.CharField(
         max_length=64,
@@ -67,11 +183,24 @@ class Document(models.Model):
         on_delete=models.CASCADE,
         related_name="documents",
     )
+    # Copied from ``version`` so revisions are found and listed without a join
+    version_number = models.IntegerField()
+    file_name = models.CharField(max_length=512)
+    # Copied from ``blob`` so usage can be counted and released without a join
+    size = models.BigIntegerField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = DocumentQuerySet.as_manager()
+
     class Meta:
         unique_together = ("user", "url", "version")
         ordering = ["-created_at"]
+        indexes = [
+            # Listing documents grouped by URL, most recently revised first
+            models.Index(fields=["user", "url", "created_at"], name="document_user_url_created"),
+            # Latest revision and ?revision=N lookups
+            models.Index(fields=["user", "url", "-version_number"], name="document_user_url_version"),
+        ]
         constraints = [
             models.UniqueConstraint(
                 fields=["user", "url", "content_hash"],
@@ -79,20 +208,234 @@ class Document(models.Model):
             )
         ]
 
+    # File content assigned through ``file`` that has not been stored yet
+    _pending_file = None
+    # Set by services.py, which updates the heads and usage of the revisions it creates itself
+    _accounted = False
+
+    @property
+    def file(self):
+        if self.blob_id is None:
+            return self._pending_file
+        return self.blob.file
+
+    @file.setter
+    def file(self, content):
+        self._pending_file = content
+
     def save(self, *args, **kwargs):
-        # Compute content hash if not already set
-        if self.file and not self.content_hash:
-            hasher = hashlib.sha256()
-            for chunk in self.file.chunks():
-                hasher.update(chunk)
-            self.content_hash = hasher.hexdigest()
-        super().save(*args, **kwargs)
+        if not self._state.adding:
+            super().save(*args, **kwargs)
+            return
+
+        if self.version_number is None:
+            self.version_number = self.version.version_number
+            self.file_name = self.version.file_name
+
+        # A new document takes one reference to its content blob
+        with atomic_write():
+            if self._pending_file is not None:
+                self.blob = Blob.objects.acquire(self._pending_file, self.content_hash or None)
+                self._pending_file = None
+            else:
+                Blob.objects.filter(pk=self.blob_id).update(ref_count=F("ref_count") + 1)
+            self.content_hash = self.blob.content_hash
+            if self.size is None:
+                self.size = self.blob.size
+            super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.url} (v{self.version_number}) - {self.user.email}"
+
+
+class DocumentHead(models.Model):
+    """
+    Per-URL state of a user's document: the next version number to hand out,
+    the latest revision and the number and size of all revisions, so none of
+    them needs a scan over the revisions.
+    """
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="document_heads")
+    url = models.CharField(max_length=1024)
+    folder = models.CharField(
+        max_length=1024,
+        blank=True,
+        default="",
+        help_text="The URL up to its last slash, empty at the top level",
+    )
+    next_version = models.PositiveIntegerField(default=0)
+    latest = models.ForeignKey(
+        Document,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="+",
+    )
+    # Copied from ``latest`` so URLs are paged by recency through an index
+    latest_at = models.DateTimeField(null=True, blank=True)
+    revisions = models.IntegerField(default=0)
+    bytes = models.BigIntegerField(default=0, help_text="Total size of the revisions")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["user", "url"], name="unique_head_per_url")]
+        indexes = [
+            models.Index(fields=["user", "folder", "url"], name="head_user_folder_url"),
+            # Document listing, most recently revised URL first
+            models.Index(fields=["user", "-latest_at", "url"], name="head_user_latest_url"),
+            # URLs listed by the space they take
+            models.Index(fields=["user", "-bytes"], name="head_user_bytes"),
+        ]
 
     def __str__(self):
-        return f"{self.url} (v{self.version.version_number}) - {self.user.email}"
+        return f"{self.url} (next v{self.next_version}) - {self.user_id}"
+
+
+class StorageUsage(models.Model):
+    """
+    Running totals of the revisions a user holds and their size, updated in
+    the transactions that create and delete documents, so usage and quota
+    checks read a single row. Per-URL totals are kept on DocumentHead.
+    """
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name="storage_usage")
+    revisions = models.IntegerField(default=0)
+    bytes = models.BigIntegerField(
+        default=0,
+        help_text="Total size of the revisions, counting content shared between them each time",
+    )
+    quota = models.BigIntegerField(
+        null=True,
+        blank=True,
+        help_text="Bytes the user may hold, DOCUMENT_QUOTA_BYTES if empty",
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.bytes} bytes in {self.revisions} revisions - {self.user_id}"
+
+
+class Folder(models.Model):
+    """
+    A folder of a user's document URLs, stored with the path of its parent so
+    the sub-folders of any folder are found by index.
+    """
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="folders")
+    path = models.CharField(max_length=1024)
+    parent = models.CharField(max_length=1024, blank=True, default="")
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["user", "path"], name="unique_folder_per_path")]
+        indexes = [models.Index(fields=["user", "parent", "path"], name="folder_user_parent_path")]
+
+    @property
+    def name(self):
+        return self.path.rpartition("/")[2]
+
+    def __str__(self):
+        return f"{self.path}/ - {self.user_id}"
 
 
 class DocumentShare(models.Model):
     document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name="shares")
     shared_with = models.ForeignKey(User, on_delete=models.CASCADE, related_name="shares")
     created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # "Shared with me" pages, newest share first
+            models.Index(fields=["shared_with", "created_at"], name="share_with_created"),
+        ]
+
+
+class ShareJob(models.Model):
+    """A share reconciliation for a long list of emails, run in the background."""
+
+    class Status(models.TextChoices):
+        PENDING = "pending", _("Pending")
+        DONE = "done", _("Done")
+        FAILED = "failed", _("Failed")
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="share_jobs")
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name="+")
+    emails = models.JSONField()
+    status = models.CharField(max_length=16, choices=Status.choices, default=Status.PENDING)
+    result = models.JSONField(
+        null=True,
+        blank=True,
+        help_text="The added/removed/not_found report once done",
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.document_id} ({len(self.emails)} emails, {self.status}) - {self.user_id}"
+
+
+class DocumentAccess(models.Model):
+    """
+    Denormalized read permissions by content hash: one row for the owner of
+    every document and one for every user it is shared with, so authorizing a
+    download by hash is a single index lookup. Rows are created with their
+    document or share and removed with them by cascade.
+    """
+
+    content_hash = models.CharField(max_length=64)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name="access")
+    share = models.ForeignKey(
+        DocumentShare,
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+        related_name="+",
+        help_text="The share granting access, empty for the owner",
+    )
+
+    class Meta:
+        indexes = [models.Index(fields=["content_hash", "user"], name="access_hash_user")]
+
+    @classmethod
+    def for_document(cls, document):
+        return cls(content_hash=document.content_hash, user_id=document.user_id, document=document)
+
+    @classmethod
+    def for_share(cls, share):
+        document = share.document
+        return cls(content_hash=document.content_hash, user_id=share.shared_with_id, document=document, share=share)
+
+
+class UploadSession(models.Model):
+    """
+    A resumable upload in progress. Chunks are appended to a staging file
+    until the client finalizes the session into a new document revision.
+    """
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="upload_sessions")
+    url = models.CharField(
+        max_length=1024,
+        help_text="Logical document URL the upload will become a revision of",
+    )
+    file_name = models.CharField(max_length=512)
+    size = models.BigIntegerField(
+        null=True,
+        blank=True,
+        help_text="Total size announced by the client, if known",
+    )
+    offset = models.BigIntegerField(
+        default=0,
+        help_text="Number of bytes received so far",
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def staging_path(self):
+        """Local file the received chunks are assembled in."""
+        return os.path.join(staging_dir(), f"{self.pk}.part")
+
+    def __str__(self):
+        return f"{self.url} ({self.offset} bytes) - {self.user.email}"
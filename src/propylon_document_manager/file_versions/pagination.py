@@ -1,7 +1,29 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
 
 class StandardResultsSetPagination(PageNumberPagination):
     page_size = 10
     page_size_query_param = "page_size"
     max_page_size = 100
+
+
+class DocumentCursorPagination(CursorPagination):
+    """
+    Keyset pagination over the heads of the user's document URLs, most
+    recently revised first. Pages are found by an index seek on the cursor
+    instead of an OFFSET, so deep pages cost the same as the first one.
+    """
+
+    page_size = 10
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    ordering = ("-latest_at", "url")
+
+
+class SharedWithMeCursorPagination(CursorPagination):
+    """Keyset pagination over the documents shared with a user, newest share first."""
+
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 500
+    ordering = ("-created_at", "-id")
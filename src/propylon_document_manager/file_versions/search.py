@@ -0,0 +1,177 @@
+"""
+Full-text search over document contents.
+
+The text of each blob is extracted once, in the background after the upload
+commits, and stored as a BlobText; the database keeps an inverted index over
+it (see migration 0015). Searches are ranked by that index and limited to
+content the user can read through DocumentAccess, so they never open files.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import NotSupportedError, connections, router, transaction
+
+from propylon_document_manager.site.transactions import atomic_write
+
+from .models import Blob, BlobText, Document
+
+logger = logging.getLogger(__name__)
+
+# Extraction runs in the process that stored the content; the index_documents command catches up after a restart
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="search-index")
+# Content sniffed for NUL bytes to tell binary files from text
+SNIFF_SIZE = 8 * 2**10
+
+SQLITE_MATCHES = """
+    -- rank is bm25(), lower for better matches
+    SELECT rowid AS blob_id, -rank AS score
+    FROM file_versions_blobtext_fts
+    WHERE file_versions_blobtext_fts MATCH %s
+"""
+SQLITE_SNIPPETS = """
+    SELECT rowid, snippet(file_versions_blobtext_fts, 0, '[', ']', '...', 16)
+    FROM file_versions_blobtext_fts
+    WHERE file_versions_blobtext_fts MATCH %s AND rowid IN ({})
+"""
+POSTGRESQL_MATCHES = """
+    SELECT blob_id, ts_rank(to_tsvector('simple', body), plainto_tsquery('simple', %s)) AS score
+    FROM file_versions_blobtext
+    WHERE to_tsvector('simple', body) @@ plainto_tsquery('simple', %s)
+"""
+POSTGRESQL_SNIPPETS = """
+    SELECT blob_id, ts_headline('simple', body, plainto_tsquery('simple', %s), 'StartSel=[, StopSel=], MaxWords=16')
+    FROM file_versions_blobtext
+    WHERE blob_id IN ({})
+"""
+
+
+def extract_text(blob):
+    """The text of ``blob``, or an empty string if it is too large or not UTF-8 text."""
+    if blob.size > settings.DOCUMENT_SEARCH_MAX_SIZE:
+        return ""
+    with blob.open() as content:
+        data = content.read()
+    if b"\0" in data[:SNIFF_SIZE]:
+        return ""
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError:
+        return ""
+
+
+def extract_texts(blobs):
+    """Unsaved BlobTexts holding the text of ``blobs``."""
+    return [BlobText(blob=blob, content_hash=blob.content_hash, body=extract_text(blob)) for blob in blobs]
+
+
+def save_texts(texts):
+    """Store BlobTexts from extract_texts(). Returns how many there were."""
+    with atomic_write():
+        BlobText.objects.bulk_create(texts, ignore_conflicts=True)
+    return len(texts)
+
+
+def index_blobs(blob_ids):
+    """Extract and store the text of the blobs in ``blob_ids`` not indexed yet. Returns how many were indexed."""
+    return save_texts(extract_texts(Blob.objects.filter(pk__in=blob_ids, text__isnull=True)))
+
+
+def index_on_commit(blob_ids):
+    """Index the text of ``blob_ids`` in the background once the transaction commits."""
+    blob_ids = list(blob_ids)
+    if blob_ids:
+        transaction.on_commit(lambda: _executor.submit(_index_in_background, blob_ids))
+
+
+def _index_in_background(blob_ids):
+    try:
+        index_blobs(blob_ids)
+    except Exception:
+        logger.exception("Indexing blobs %s failed", blob_ids)
+    finally:
+        connections.close_all()
+
+
+def _fts5_query(text):
+    """Every word of ``text`` as a quoted FTS5 string, so user input cannot use the query syntax."""
+    return " ".join('"{}"'.format(word.replace('"', '""')) for word in text.split())
+
+
+class SearchResults:
+    """
+    The documents whose content matches ``text`` for ``user``, best match
+    first, one per distinct content (the newest document the user can read
+    with it). Sliced like a queryset, so it can be paginated.
+    """
+
+    def __init__(self, user, text):
+        self.user = user
+        self.text = text
+        self.connection = connections[router.db_for_read(BlobText)]
+        if self.connection.vendor == "sqlite":
+            self.matches, self.params = SQLITE_MATCHES, [_fts5_query(text)]
+        elif self.connection.vendor == "postgresql":
+            self.matches, self.params = POSTGRESQL_MATCHES, [text, text]
+        else:
+            raise NotSupportedError(f"Full-text search is not available on {self.connection.vendor}.")
+
+    def _readable(self, columns, suffix=""):
+        return f"""
+            SELECT {columns}
+            FROM ({self.matches}) m
+            JOIN file_versions_blobtext t ON t.blob_id = m.blob_id
+            JOIN file_versions_documentaccess a ON a.content_hash = t.content_hash AND a.user_id = %s
+            {suffix}
+        """
+
+    def count(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(self._readable("COUNT(DISTINCT m.blob_id)"), [*self.params, self.user.pk])
+            return cursor.fetchone()[0]
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice) or index.step is not None:
+            raise TypeError("Search results can only be sliced.")
+        start = index.start or 0
+        limit = -1 if index.stop is None else max(index.stop - start, 0)
+        if self.connection.vendor == "postgresql" and limit == -1:
+            limit = None
+
+        sql = self._readable(
+            "m.blob_id, MAX(m.score), MAX(a.document_id)",
+            "GROUP BY m.blob_id ORDER BY MAX(m.score) DESC, m.blob_id DESC LIMIT %s OFFSET %s",
+        )
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, [*self.params, self.user.pk, limit, start])
+            rows = cursor.fetchall()
+        if not rows:
+            return []
+
+        snippets = self._snippets([blob_id for blob_id, _, _ in rows])
+        documents = Document.objects.using(self.connection.alias).select_related("user").in_bulk(
+            [document_id for _, _, document_id in rows]
+        )
+        results = []
+        for blob_id, score, document_id in rows:
+            document = documents.get(document_id)
+            if document is None:
+                # Deleted since the search ran
+                continue
+            document.score = score
+            document.snippet = snippets.get(blob_id, "")
+            results.append(document)
+        return results
+
+    def _snippets(self, blob_ids):
+        placeholders = ", ".join(["%s"] * len(blob_ids))
+        if self.connection.vendor == "sqlite":
+            sql, params = SQLITE_SNIPPETS.format(placeholders), [_fts5_query(self.text), *blob_ids]
+        else:
+            sql, params = POSTGRESQL_SNIPPETS.format(placeholders), [self.text, *blob_ids]
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return dict(cursor.fetchall())
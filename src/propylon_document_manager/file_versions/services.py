@@ -0,0 +1,261 @@
+from collections import Counter, defaultdict
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max, OuterRef, Q, Subquery
+
+from propylon_document_manager.site.transactions import atomic_write
+
+from .blobs import hash_file, store_blob_file
+from .deltas import deltify_in_background
+from .folders import ensure_folders, folder_of
+from .models import Blob, Document, DocumentAccess, DocumentHead, FileVersion
+from .search import index_on_commit
+from .usage import record_usage
+
+
+class DuplicateRevisionError(Exception):
+    """The content is already stored as a revision of the same URL."""
+
+
+def create_revision(user, url, content, file_name, content_hash=None):
+    """
+    Store ``content`` as the next revision of ``url`` for ``user``.
+
+    Raises DuplicateRevisionError if any revision of the URL already has the
+    same content, QuotaExceededError if it does not fit in the user's quota.
+    """
+    if content_hash is None:
+        content_hash = getattr(content, "content_hash", None) or hash_file(content)
+    return _create_revision(user, url, file_name, content_hash, file=content)
+
+
+def create_revision_by_reference(user, url, content_hash, size, file_name):
+    """
+    Store content the server already holds as the next revision of ``url``,
+    without the client sending the bytes again.
+
+    Only content the user can already read (their own or shared with them) is
+    reused, so knowing a hash does not give access to someone else's file.
+    Returns None if the bytes have to be uploaded. Raises
+    DuplicateRevisionError and QuotaExceededError like create_revision.
+    """
+    with atomic_write():
+        # Locked so the blob cannot be garbage collected before it is referenced
+        blob = Blob.objects.select_for_update().filter(content_hash=content_hash, size=size).first()
+        if blob is None or not DocumentAccess.objects.filter(content_hash=content_hash, user=user).exists():
+            return None
+        return _create_revision(user, url, file_name, content_hash, blob=blob)
+
+
+def reserve_versions(user, counts):
+    """
+    Take the next ``counts[url]`` version numbers of each of the user's URLs
+    and return the first one reserved per URL.
+
+    The numbers come from an atomic increment on the URL's head, which stays
+    locked until the transaction ends, so concurrent uploads to a URL queue
+    up instead of racing for the same number.
+    """
+    with atomic_write():
+        heads = DocumentHead.objects.filter(user=user, url__in=counts)
+        missing = set(counts) - set(heads.values_list("url", flat=True))
+        if missing:
+            # Revisions created before heads were tracked still count
+            last_versions = dict(
+                Document.objects.filter(user=user, url__in=missing)
+                .values("url")
+                .annotate(last=Max("version_number"))
+                .values_list("url", "last")
+            )
+            DocumentHead.objects.bulk_create(
+                [
+                    DocumentHead(
+                        user=user, url=url, folder=folder_of(url), next_version=last_versions.get(url, -1) + 1
+                    )
+                    for url in missing
+                ],
+                ignore_conflicts=True,
+            )
+            ensure_folders(user, missing)
+
+        by_count = defaultdict(list)
+        for url, count in counts.items():
+            by_count[count].append(url)
+        for count, urls in by_count.items():
+            heads.filter(url__in=urls).update(next_version=F("next_version") + count)
+        return {url: next_version - counts[url] for url, next_version in heads.values_list("url", "next_version")}
+
+
+def update_heads(user, urls):
+    """Point the heads of the user's ``urls`` at their highest version."""
+    latest = Document.objects.filter(user=user, url=OuterRef("url")).order_by("-version_number")
+    DocumentHead.objects.filter(user=user, url__in=urls).update(
+        latest=Subquery(latest.values("pk")[:1]), latest_at=Subquery(latest.values("created_at")[:1])
+    )
+
+
+def _create_revision(user, url, file_name, content_hash, **content):
+    """Create the next revision of ``url`` from either a ``file`` or an existing ``blob``."""
+    with atomic_write():
+        version_number = reserve_versions(user, {url: 1})[url]
+        # Checked once the head is locked, so a concurrent upload of the same content is already committed;
+        # raising rolls the reserved version back
+        if Document.objects.filter(user=user, url=url, content_hash=content_hash).exists():
+            raise DuplicateRevisionError(content_hash)
+
+        # Counted before the content is stored, which is skipped if it does not fit
+        size = content["blob"].size if "blob" in content else content["file"].size
+        record_usage(user, [(url, size)])
+        file_version = FileVersion.objects.create(
+            file_name=file_name,
+            version_number=version_number,
+        )
+
+        # The content is only written if no blob holds it yet
+        document = Document(
+            user=user,
+            url=url,
+            version=file_version,
+            version_number=version_number,
+            file_name=file_name,
+            content_hash=content_hash,
+            size=size,
+            **content,
+        )
+        document._accounted = True
+        document.save()
+        update_heads(user, [url])
+        index_on_commit([document.blob_id])
+
+        if version_number and settings.DOCUMENT_DELTA_STORAGE:
+            _deltify_on_commit(user, {url: version_number}, [document])
+
+    return document
+
+
+def create_revisions(user, entries):
+    """
+    Store a batch of ``(url, content, file_name)`` entries as new revisions
+    for ``user`` in one transaction, using a fixed number of queries for the
+    whole batch instead of several per file.
+
+    Returns a list parallel to ``entries`` holding the created Document, or
+    None where the content duplicates a revision of the same URL (including
+    an earlier entry of the batch). Raises QuotaExceededError if the batch
+    does not fit in the user's quota.
+    """
+    entries = [
+        (url, content, file_name, getattr(content, "content_hash", None) or hash_file(content))
+        for url, content, file_name in entries
+    ]
+    urls = {url for url, _, _, _ in entries}
+
+    with atomic_write():
+        seen = set(Document.objects.filter(user=user, url__in=urls).values_list("url", "content_hash"))
+        new_entries = []
+        for index, (url, content, file_name, content_hash) in enumerate(entries):
+            if (url, content_hash) in seen:
+                continue
+            seen.add((url, content_hash))
+            new_entries.append((index, url, content, file_name, content_hash))
+
+        first_versions = reserve_versions(user, Counter(url for _, url, _, _, _ in new_entries))
+        next_versions = dict(first_versions)
+        version_numbers = []
+        for _, url, _, _, _ in new_entries:
+            version_numbers.append(next_versions[url])
+            next_versions[url] += 1
+
+        record_usage(user, [(url, content.size) for _, url, content, _, _ in new_entries])
+        blobs = _acquire_blobs((content, content_hash) for _, _, content, _, content_hash in new_entries)
+
+        versions = FileVersion.objects.bulk_create(
+            FileVersion(file_name=file_name, version_number=version_number)
+            for (_, _, _, file_name, _), version_number in zip(new_entries, version_numbers)
+        )
+        # Blob references were taken above, so Document.save() is not needed
+        documents = Document.objects.bulk_create(
+            Document(
+                user=user,
+                url=url,
+                blob=blobs[content_hash],
+                content_hash=content_hash,
+                version=version,
+                version_number=version.version_number,
+                file_name=version.file_name,
+                size=blobs[content_hash].size,
+            )
+            for (_, url, _, _, content_hash), version in zip(new_entries, versions)
+        )
+        # bulk_create skips the post_save signals that grant access to new documents
+        DocumentAccess.objects.bulk_create(DocumentAccess.for_document(document) for document in documents)
+        update_heads(user, first_versions)
+        index_on_commit({document.blob_id for document in documents})
+
+        if settings.DOCUMENT_DELTA_STORAGE and documents:
+            _deltify_on_commit(user, first_versions, documents)
+
+    results = [None] * len(entries)
+    for (index, *_), document in zip(new_entries, documents):
+        results[index] = document
+    return results
+
+
+def _acquire_blobs(contents):
+    """
+    Take one reference per item of ``contents`` (pairs of content and hash) to
+    the blob holding it, storing new content. Returns the blobs by hash.
+    """
+    counts = Counter()
+    new = {}
+    for content, content_hash in contents:
+        counts[content_hash] += 1
+        new.setdefault(content_hash, content)
+    if not counts:
+        return {}
+
+    for content_hash in Blob.objects.filter(content_hash__in=counts).values_list("content_hash", flat=True):
+        del new[content_hash]
+    # Concurrent uploads of the same content are skipped here and counted below
+    Blob.objects.bulk_create(
+        [
+            Blob(content_hash=content_hash, file=store_blob_file(content, content_hash), size=content.size)
+            for content_hash, content in new.items()
+        ],
+        ignore_conflicts=True,
+    )
+
+    by_increment = defaultdict(list)
+    for content_hash, count in counts.items():
+        by_increment[count].append(content_hash)
+    for increment, hashes in by_increment.items():
+        Blob.objects.filter(content_hash__in=hashes).update(ref_count=F("ref_count") + increment)
+    return Blob.objects.in_bulk(counts, field_name="content_hash")
+
+
+def _deltify_on_commit(user, first_versions, documents):
+    """
+    After commit, replace each URL's previous revision with a delta against
+    its successor in the background, chaining through the ``documents`` just
+    created.
+    """
+    latest = {}
+    revised = [url for url, version_number in first_versions.items() if version_number]
+    if revised:
+        previous = Document.objects.filter(user=user).filter(
+            reduce(or_, (Q(url=url, version_number=first_versions[url] - 1) for url in revised))
+        )
+        latest = {document.url: document for document in previous.select_related("blob")}
+
+    pairs = []
+    for document in documents:
+        if document.url in latest:
+            pairs.append((latest[document.url], document))
+        latest[document.url] = document
+
+    # Outside the upload transaction, a failed conversion must not lose the upload
+    if pairs:
+        transaction.on_commit(lambda: deltify_in_background(pairs))
@@ -0,0 +1,77 @@
+"""
+Reconciling the users a document is shared with against a list of emails,
+in a fixed number of queries however long the list is. Very long lists can
+be reconciled in the background as a ShareJob.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connections, transaction
+from django.utils import timezone
+
+from propylon_document_manager.site.transactions import atomic_write
+
+from .models import DocumentAccess, DocumentShare, ShareJob, User
+
+logger = logging.getLogger(__name__)
+
+# Jobs run in the process that accepted them; a restart leaves them pending
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="share-jobs")
+
+
+def reconcile_shares(document, emails):
+    """
+    Share ``document`` with exactly the users in ``emails``, adding and removing
+    shares as needed. Returns the ``added``, ``removed`` and ``not_found`` emails.
+    """
+    emails = list(dict.fromkeys(emails))
+    wanted = set(emails)
+
+    with atomic_write():
+        current = {share.shared_with.email: share for share in document.shares.select_related("shared_with")}
+        users = {user.email: user for user in User.objects.filter(email__in=wanted)}
+
+        added = [email for email in emails if email in users and email not in current]
+        shares = DocumentShare.objects.bulk_create(
+            DocumentShare(document=document, shared_with=users[email]) for email in added
+        )
+        # bulk_create skips the post_save signal that grants access
+        DocumentAccess.objects.bulk_create(DocumentAccess.for_share(share) for share in shares)
+
+        removed = [email for email in current if email not in wanted]
+        # Their access rows go with them by cascade
+        DocumentShare.objects.filter(pk__in=[current[email].pk for email in removed]).delete()
+
+    return {
+        "added": added,
+        "removed": removed,
+        "not_found": [email for email in emails if email not in users],
+    }
+
+
+def start_share_job(user, document, emails):
+    """Queue a reconciliation of ``document``'s shares, started once the transaction commits."""
+    job = ShareJob.objects.create(user=user, document=document, emails=list(emails))
+    transaction.on_commit(lambda: _executor.submit(_run_in_background, job.pk))
+    return job
+
+
+def run_share_job(job_id):
+    job = ShareJob.objects.select_related("document").filter(pk=job_id, status=ShareJob.Status.PENDING).first()
+    if job is None:
+        return
+    try:
+        job.result = reconcile_shares(job.document, job.emails)
+        job.status = ShareJob.Status.DONE
+    except Exception:
+        logger.exception("Share job %s failed", job_id)
+        job.status = ShareJob.Status.FAILED
+    job.finished_at = timezone.now()
+    job.save(update_fields=["result", "status", "finished_at"])
+
+
+def _run_in_background(job_id):
+    try:
+        run_share_job(job_id)
+    finally:
+        connections.close_all()
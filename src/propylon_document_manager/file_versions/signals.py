@@ -0,0 +1,72 @@
+from django.db.models import OuterRef, Q, Subquery
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .folders import ensure_folders, folder_of
+from .models import Blob, Document, DocumentAccess, DocumentHead, DocumentShare, StorageUsage, User
+from .usage import record_usage, release_usage
+
+
+@receiver(post_delete, sender=Document)
+def release_document_blob(sender, instance, **kwargs):
+    """Drop the deleted document's reference to its content blob."""
+    Blob.objects.release(instance.blob_id)
+
+
+@receiver(post_delete, sender=Document)
+def repoint_document_head(sender, instance, **kwargs):
+    """Point a head whose latest revision was deleted at the newest remaining one."""
+    remaining = Document.objects.filter(user=OuterRef("user"), url=OuterRef("url"))
+    remaining = remaining.order_by("-version_number")
+    DocumentHead.objects.filter(user_id=instance.user_id, url=instance.url, latest=None).update(
+        latest=Subquery(remaining.values("pk")[:1]), latest_at=Subquery(remaining.values("created_at")[:1])
+    )
+
+
+@receiver(post_save, sender=Document)
+def track_document_head(sender, instance, created, raw=False, **kwargs):
+    """
+    Give documents created outside services.py (e.g. directly through the ORM)
+    a head, so they are numbered, listed and browsed like any other revision,
+    and count them towards storage usage, which their deletion releases. The
+    quota is only enforced on uploads.
+    """
+    if not created or raw or instance._accounted:
+        return
+    DocumentHead.objects.bulk_create(
+        [DocumentHead(user_id=instance.user_id, url=instance.url, folder=folder_of(instance.url))],
+        ignore_conflicts=True,
+    )
+    heads = DocumentHead.objects.filter(user_id=instance.user_id, url=instance.url)
+    heads.update(next_version=Greatest("next_version", instance.version_number + 1))
+    heads.filter(Q(latest=None) | Q(latest__version_number__lt=instance.version_number)).update(
+        latest=instance, latest_at=instance.created_at
+    )
+    record_usage(instance.user, [(instance.url, instance.size)], enforce_quota=False)
+    ensure_folders(instance.user, [instance.url])
+
+
+@receiver(post_delete, sender=Document)
+def release_document_usage(sender, instance, **kwargs):
+    """Take the deleted document off its owner's and URL's storage usage."""
+    release_usage(instance)
+
+
+@receiver(post_save, sender=Document)
+def grant_owner_access(sender, instance, created, **kwargs):
+    if created:
+        DocumentAccess.for_document(instance).save()
+
+
+@receiver(post_save, sender=DocumentShare)
+def grant_share_access(sender, instance, created, **kwargs):
+    if created:
+        DocumentAccess.for_share(instance).save()
+
+
+@receiver(post_save, sender=User)
+def create_storage_usage(sender, instance, created, raw=False, using=None, **kwargs):
+    """Start every user with empty usage, so uploads only ever update it."""
+    if created and not raw:
+        StorageUsage.objects.db_manager(using).create(user=instance)
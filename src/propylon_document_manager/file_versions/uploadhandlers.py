@@ -0,0 +1,65 @@
+import hashlib
+import os
+import tempfile
+
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+
+from .blobs import staging_dir
+
+
+class StagedUploadedFile(UploadedFile):
+    """
+    An uploaded file already written to the blob staging area, together with
+    the SHA-256 digest computed while it was received.
+    """
+
+    def __init__(self, path, name, content_type, size, charset, content_hash, content_type_extra=None):
+        super().__init__(open(path, "rb"), name, content_type, size, charset, content_type_extra)
+        self.path = path
+        self.content_hash = content_hash
+
+    def temporary_file_path(self):
+        return self.path
+
+    def close(self):
+        try:
+            return self.file.close()
+        finally:
+            # Storage moves the file into place; anything left over was not kept
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+class ContentHashUploadHandler(FileUploadHandler):
+    """
+    Stream each uploaded file to the blob staging area and hash it in the same
+    pass, so the upload is never buffered in memory or read a second time.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.hasher = hashlib.sha256()
+        fd, self.path = tempfile.mkstemp(suffix=".upload", dir=staging_dir())
+        self.file = os.fdopen(fd, "wb")
+
+    def receive_data_chunk(self, raw_data, start):
+        self.hasher.update(raw_data)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        self.file.close()
+        return StagedUploadedFile(
+            self.path,
+            self.file_name,
+            self.content_type,
+            file_size,
+            self.charset,
+            self.hasher.hexdigest(),
+            self.content_type_extra,
+        )
+
+    def upload_interrupted(self):
+        if hasattr(self, "file"):
+            self.file.close()
+            os.remove(self.path)
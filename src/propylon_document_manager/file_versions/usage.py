@@ -0,0 +1,126 @@
+"""
+Storage usage and quotas.
+
+Every user has a StorageUsage row and every URL a DocumentHead holding the
+number and total size of their revisions. Both are incremented in the
+transaction that creates revisions, however they are created, and
+decremented when documents are deleted, so reading usage or checking a
+quota never counts documents. The reconcile_storage_usage command
+recomputes them should they drift.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import BigIntegerField, Case, Count, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from propylon_document_manager.site.transactions import atomic_write
+
+from .models import Document, DocumentHead, StorageUsage, User
+
+
+class QuotaExceededError(Exception):
+    """Storing the content would take the user over their storage quota."""
+
+
+def usage_of(user):
+    """The user's StorageUsage, unsaved and empty if they have none yet."""
+    return StorageUsage.objects.filter(user=user).first() or StorageUsage(user=user)
+
+
+def quota_of(usage):
+    """The bytes the owner of ``usage`` may hold, None if unlimited."""
+    return settings.DOCUMENT_QUOTA_BYTES if usage.quota is None else usage.quota
+
+
+def has_room(user, size):
+    """Whether ``size`` more bytes fit in the user's quota."""
+    usage = usage_of(user)
+    quota = quota_of(usage)
+    return quota is None or usage.bytes + size <= quota
+
+
+def _within_quota(size):
+    """Usage rows with room for ``size`` more bytes."""
+    if settings.DOCUMENT_QUOTA_BYTES is None:
+        return Q(quota__isnull=True) | Q(bytes__lte=F("quota") - size)
+    quota = Coalesce("quota", Value(settings.DOCUMENT_QUOTA_BYTES, output_field=BigIntegerField()))
+    return Q(bytes__lte=quota - size)
+
+
+def record_usage(user, sizes, enforce_quota=True):
+    """
+    Add new revisions, given as ``(url, size)`` pairs, to the totals of the
+    user and of their URLs, whose heads must exist.
+
+    The user's row is checked against the quota and incremented in a single
+    update, and stays locked until the transaction ends, so concurrent uploads
+    cannot both take the last of the space. Raises QuotaExceededError, unless
+    ``enforce_quota`` is false and the revisions are only counted.
+    """
+    by_url = defaultdict(lambda: [0, 0])
+    for url, size in sizes:
+        by_url[url][0] += 1
+        by_url[url][1] += size
+    if not by_url:
+        return
+    revisions = sum(count for count, _ in by_url.values())
+    size = sum(total for _, total in by_url.values())
+
+    usage = StorageUsage.objects.filter(user=user)
+    room = usage.filter(_within_quota(size)) if enforce_quota else usage
+    increment = {"revisions": F("revisions") + revisions, "bytes": F("bytes") + size, "updated_at": timezone.now()}
+    if not room.update(**increment):
+        if usage.exists():
+            raise QuotaExceededError(size)
+        # Users are given their row when created, unless they were bulk created
+        StorageUsage.objects.bulk_create([StorageUsage(user=user)], ignore_conflicts=True)
+        if not room.update(**increment):
+            raise QuotaExceededError(size)
+
+    DocumentHead.objects.filter(user=user, url__in=by_url).update(
+        revisions=F("revisions") + Case(*(When(url=url, then=count) for url, (count, _) in by_url.items())),
+        bytes=F("bytes") + Case(*(When(url=url, then=total) for url, (_, total) in by_url.items())),
+    )
+
+
+def release_usage(document):
+    """Subtract a deleted document from the totals of its owner and URL."""
+    decrement = {"revisions": F("revisions") - 1, "bytes": F("bytes") - document.size}
+    StorageUsage.objects.filter(user_id=document.user_id).update(**decrement, updated_at=timezone.now())
+    DocumentHead.objects.filter(user_id=document.user_id, url=document.url).update(**decrement)
+
+
+def _totals(**filters):
+    """Subqueries counting and summing the size of the documents matching ``filters``."""
+    documents = Document.objects.filter(**filters).order_by().values("user")
+    return {
+        "revisions": Coalesce(Subquery(documents.annotate(total=Count("pk")).values("total")), 0),
+        "bytes": Coalesce(Subquery(documents.annotate(total=Sum("size")).values("total")), Value(0)),
+    }
+
+
+def _reconcile(queryset, totals):
+    """Overwrite the totals of the rows of ``queryset`` that differ from ``totals``. Returns how many did."""
+    stale = queryset.annotate(actual_revisions=totals["revisions"], actual_bytes=totals["bytes"]).exclude(
+        revisions=F("actual_revisions"), bytes=F("actual_bytes")
+    )
+    return queryset.filter(pk__in=stale.values("pk")).update(**totals)
+
+
+def reconcile_usage():
+    """
+    Recompute the totals of every user and URL from their documents, in a
+    fixed number of queries. Returns the number of users and of URLs whose
+    totals were wrong.
+    """
+    with atomic_write():
+        StorageUsage.objects.bulk_create(
+            [StorageUsage(user_id=pk) for pk in User.objects.filter(storage_usage=None).values_list("pk", flat=True)],
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+        users = _reconcile(StorageUsage.objects.all(), _totals(user=OuterRef("user")))
+        heads = _reconcile(DocumentHead.objects.all(), _totals(user=OuterRef("user"), url=OuterRef("url")))
+    return users, heads
@@ -3,7 +3,17 @@ from django.urls import path
 from rest_framework.routers import DefaultRouter, SimpleRouter
 
 from propylon_document_manager.file_versions.api.views import FileVersionViewSet, DocumentView, DocumentListView, \
-    DocumentByHashView, DocumentShareView
+    DocumentByHashView, DocumentShareView, DocumentBulkView, DocumentExportView, DocumentNegotiateView, \
+    UploadSessionListView, UploadSessionView, UploadSessionCompleteView, ShareJobView, \
+    FolderView, SharedWithMeView, DocumentSearchView, DocumentDiffView, StorageUsageView, URLUsageListView
+
+from propylon_document_manager.file_versions.api.async_views import AsyncDocumentView, AsyncDocumentByHashView, \
+    AsyncDocumentListView
+
+if settings.DOCUMENT_ASYNC_VIEWS:
+    DocumentView, DocumentByHashView, DocumentListView = (
+        AsyncDocumentView, AsyncDocumentByHashView, AsyncDocumentListView
+    )
 
 if settings.DEBUG:
     router = DefaultRouter()
@@ -15,8 +25,22 @@ router.register("file_versions", FileVersionViewSet)
 app_name = "api"
 urlpatterns = router.urls + [
     path("documents/", DocumentListView.as_view(), name="document-list"),
+    path("documents-bulk/", DocumentBulkView.as_view(), name="document-bulk"),
+    path("documents-negotiate/", DocumentNegotiateView.as_view(), name="document-negotiate"),
+    path("documents-export/", DocumentExportView.as_view(), name="document-export"),
+    path("documents-search/", DocumentSearchView.as_view(), name="document-search"),
+    path("documents-shared/", SharedWithMeView.as_view(), name="document-shared"),
     path("documents/hash/<str:content_hash>/", DocumentByHashView.as_view(), name="document-by-hash"),
     path("documents/hash/<str:content_hash>/share/", DocumentShareView.as_view(), name="document-share"),
+    path("documents-diff/<path:url>/", DocumentDiffView.as_view(), name="document-diff"),
     path("documents/<path:url>/", DocumentView.as_view(), name="document"),
+    path("folders/", FolderView.as_view(), name="folder-root"),
+    path("folders/<path:path>/", FolderView.as_view(), name="folder"),
+    path("usage/", StorageUsageView.as_view(), name="usage"),
+    path("usage/urls/", URLUsageListView.as_view(), name="usage-urls"),
+    path("share-jobs/<uuid:pk>/", ShareJobView.as_view(), name="share-job"),
+    path("uploads/", UploadSessionListView.as_view(), name="upload-session-list"),
+    path("uploads/<uuid:pk>/", UploadSessionView.as_view(), name="upload-session"),
+    path("uploads/<uuid:pk>/complete/", UploadSessionCompleteView.as_view(), name="upload-session-complete"),
 
 ]
@@ -0,0 +1,18 @@
+"""
+ASGI config for Propylon Document Manager.
+
+Serve it with any ASGI server, e.g.::
+
+    uvicorn propylon_document_manager.site.asgi:application
+
+Document transfers are then handled by the async views, so a slow client
+does not hold a worker thread for the duration of its download or upload.
+"""
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "propylon_document_manager.site.settings.production")
+os.environ.setdefault("DJANGO_DOCUMENT_ASYNC_VIEWS", "True")
+
+application = get_asgi_application()
@@ -0,0 +1,80 @@
+"""
+Sending reads to database replicas.
+
+Reads go to the primary unless the current request allows replicas. Only
+safe (GET/HEAD/OPTIONS) requests do, and only if the same client has not
+written within DATABASE_REPLICA_STICKY_SECONDS, so clients see their own
+changes even while the replicas lag behind. Management commands, background
+jobs and everything else outside a request keep reading from the primary.
+"""
+import hashlib
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+
+PRIMARY = "default"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+_replica_reads = ContextVar("replica_reads", default=False)
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """Let reads in the block go to a replica (or force them to the primary with ``enabled=False``)."""
+    token = _replica_reads.set(enabled)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """Writes go to the primary, reads to a random replica where replica_reads() allows it."""
+
+    def db_for_read(self, model, **hints):
+        if settings.DATABASE_REPLICAS and _replica_reads.get():
+            return random.choice(settings.DATABASE_REPLICAS)
+        return PRIMARY
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        databases = {PRIMARY, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+def _sticky_key(request):
+    """Cache key identifying the client by its token or session, None for anonymous clients."""
+    credentials = request.headers.get("Authorization") or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if credentials:
+        return "db-primary:" + hashlib.sha256(credentials.encode()).hexdigest()
+    return None
+
+
+class ReplicaReadsMiddleware:
+    """
+    Allows replica reads for safe requests, and keeps a client on the primary
+    for a while after each request that may have written.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+
+        key = _sticky_key(request)
+        safe = request.method in SAFE_METHODS
+        with replica_reads(safe and not (key and cache.get(key))):
+            response = self.get_response(request)
+        if not safe and key:
+            cache.set(key, True, settings.DATABASE_REPLICA_STICKY_SECONDS)
+        return response
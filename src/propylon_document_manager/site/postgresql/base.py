@@ -0,0 +1,91 @@
+"""
+PostgreSQL backend with a connection pool shared by the threads of a process.
+
+It accepts the ``pool`` option of Django's own PostgreSQL backend from 5.1 on
+(psycopg 3 with psycopg_pool), so settings stay the same after upgrading.
+``True`` uses the pool defaults, a dict is passed on to
+``psycopg_pool.ConnectionPool`` (``min_size``, ``max_size``, ``timeout``...).
+Requests borrow a connection when they first query and return it when they
+close it, instead of opening one per thread. With CONN_HEALTH_CHECKS the pool
+checks a connection before lending it, so connections dropped by the server
+are replaced instead of failing the request.
+"""
+import threading
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.base.base import NO_DB_ALIAS
+from django.db.backends.postgresql import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    _connection_pools = {}
+    _pools_lock = threading.Lock()
+
+    @property
+    def pool(self):
+        pool_options = self.settings_dict["OPTIONS"].get("pool")
+        if self.alias == NO_DB_ALIAS or not pool_options:
+            return None
+
+        with self._pools_lock:
+            if self.alias not in self._connection_pools:
+                if self.settings_dict["CONN_MAX_AGE"] != 0:
+                    raise ImproperlyConfigured("Pooling doesn't support persistent connections (CONN_MAX_AGE).")
+                if not base.is_psycopg3:
+                    raise ImproperlyConfigured("Pooling requires psycopg 3.")
+                try:
+                    from psycopg_pool import ConnectionPool
+                except ImportError as e:
+                    raise ImproperlyConfigured("Error loading psycopg_pool module, install psycopg[pool].") from e
+
+                connect_kwargs = self.get_connection_params()
+                # Django switches autocommit off as needed when the connection is handed out
+                connect_kwargs["autocommit"] = True
+                self._connection_pools[self.alias] = ConnectionPool(
+                    kwargs=connect_kwargs,
+                    open=True,
+                    check=ConnectionPool.check_connection if self.settings_dict["CONN_HEALTH_CHECKS"] else None,
+                    name=self.alias,
+                    **({} if pool_options is True else pool_options),
+                )
+            return self._connection_pools[self.alias]
+
+    def close_pool(self):
+        with self._pools_lock:
+            pool = self._connection_pools.pop(self.alias, None)
+        if pool is not None:
+            pool.close()
+
+    def get_connection_params(self):
+        conn_params = super().get_connection_params()
+        conn_params.pop("pool", None)
+        return conn_params
+
+    def get_new_connection(self, conn_params):
+        if self.pool is None:
+            return super().get_new_connection(conn_params)
+
+        isolation_level = self.settings_dict["OPTIONS"].get("isolation_level")
+        try:
+            self.isolation_level = base.IsolationLevel(
+                base.IsolationLevel.READ_COMMITTED if isolation_level is None else isolation_level
+            )
+        except ValueError:
+            raise ImproperlyConfigured(
+                f"Invalid transaction isolation level {isolation_level} specified. "
+                f"Use one of the psycopg.IsolationLevel values."
+            )
+        connection = self.pool.getconn()
+        if isolation_level is not None:
+            connection.isolation_level = self.isolation_level
+        return connection
+
+    def _close(self):
+        if self.connection is not None and self.pool is not None:
+            with self.wrap_database_errors:
+                # Back to the pool that lent it, which resets it if a transaction was left open
+                self.connection._pool.putconn(self.connection)
+                self.connection = None
+            return None
+        return super()._close()
+
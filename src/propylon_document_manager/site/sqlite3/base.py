@@ -0,0 +1,55 @@
+"""
+SQLite backend for running the project on a single node in production.
+
+It accepts the ``init_command`` and ``transaction_mode`` options of Django's
+own SQLite backend from 5.1 on, so settings stay the same after upgrading:
+
+- ``init_command``: statements (typically pragmas) run on every new
+  connection, separated by semicolons.
+- ``transaction_mode``: ``DEFERRED``, ``IMMEDIATE`` or ``EXCLUSIVE``.
+  With ``IMMEDIATE`` a transaction takes the write lock when it begins, so
+  concurrent writers wait for each other for up to ``timeout`` seconds
+  instead of failing with "database is locked" when a read turns into a write.
+
+Rather than making every transaction, reads included, queue up for the write
+lock, the project leaves the mode unset and only transactions started under
+site.transactions.write_lock() (atomic_write() and unsafe requests) begin
+``IMMEDIATE``.
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+from propylon_document_manager.site.transactions import write_lock_requested
+
+TRANSACTION_MODES = ("DEFERRED", "EXCLUSIVE", "IMMEDIATE")
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        self.init_command = kwargs.pop("init_command", None)
+        transaction_mode = kwargs.pop("transaction_mode", None)
+        if transaction_mode is not None and transaction_mode.upper() not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(
+                f"settings.DATABASES['{self.alias}']['OPTIONS']['transaction_mode'] is improperly configured "
+                f"to '{transaction_mode}'. Use one of {', '.join(map(repr, TRANSACTION_MODES))}, or None."
+            )
+        self.transaction_mode = transaction_mode.upper() if transaction_mode else None
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        if self.init_command:
+            for statement in self.init_command.split(";"):
+                if statement := statement.strip():
+                    conn.execute(statement)
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        transaction_mode = self.transaction_mode
+        if write_lock_requested() and transaction_mode in (None, "DEFERRED"):
+            transaction_mode = "IMMEDIATE"
+        if transaction_mode is None:
+            super()._start_transaction_under_autocommit()
+        else:
+            self.cursor().execute(f"BEGIN {transaction_mode}")
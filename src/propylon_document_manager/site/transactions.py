@@ -0,0 +1,56 @@
+"""
+Taking the database's write lock only for transactions that write.
+
+SQLite lets any number of readers run alongside one writer, but a transaction
+that starts reading and then writes has to upgrade its lock, and fails with
+"database is locked" if another writer got there first. Transactions that
+are going to write therefore ask for the write lock when they begin, with
+atomic_write() (or, for whole requests under ATOMIC_REQUESTS, the
+WriteTransactionMiddleware), while reads keep starting deferred and never
+queue behind the writer. Backends other than site/sqlite3 ignore the request.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import transaction
+
+from .db_routing import SAFE_METHODS
+
+_write_lock = ContextVar("write_lock", default=False)
+
+
+def write_lock_requested():
+    """Whether a transaction beginning now should take the write lock up front."""
+    return _write_lock.get()
+
+
+@contextmanager
+def write_lock(enabled=True):
+    """Let transactions beginning in the block take the write lock up front (or not, with ``enabled=False``)."""
+    token = _write_lock.set(enabled)
+    try:
+        yield
+    finally:
+        _write_lock.reset(token)
+
+
+@contextmanager
+def atomic_write(using=None):
+    """
+    ``transaction.atomic()`` for blocks that write. Started outside a
+    transaction it holds the write lock from the beginning; nested in one it
+    is a savepoint like any other.
+    """
+    with write_lock(), transaction.atomic(using=using):
+        yield
+
+
+class WriteTransactionMiddleware:
+    """Lets the request transaction of unsafe (non GET/HEAD/OPTIONS) requests take the write lock up front."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with write_lock(request.method not in SAFE_METHODS):
+            return self.get_response(request)
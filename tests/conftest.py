@@ -1,5 +1,11 @@
+from concurrent.futures import Future
+
 import pytest
+from django.db import connections
 from rest_framework.test import APIClient
+
+from propylon_document_manager.file_versions import deltas, search, sharing
+
 from .factories import UserFactory, DocumentFactory
 
 
@@ -31,3 +37,24 @@ def api_client(user):
 def document(user):
     """Single test document belonging to the user."""
     return DocumentFactory(user=user, url="docs/test.txt", version__version_number=0)
+
+
+class InlineExecutor:
+    """Runs submitted work in the calling thread, inside the test's transaction."""
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        future.set_result(fn(*args, **kwargs))
+        return future
+
+
+@pytest.fixture(autouse=True)
+def inline_background_work(monkeypatch):
+    """
+    Run the work the worker pools would pick up after a commit in the committing
+    thread, so no test leaves a thread writing to the database after it ends.
+    """
+    for module in (deltas, search, sharing):
+        monkeypatch.setattr(module, "_executor", InlineExecutor())
+    # Pool threads close their own connections when done, which inline are the test's
+    monkeypatch.setattr(connections, "close_all", lambda: None)
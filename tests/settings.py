@@ -1,6 +1,8 @@
 """
 With these settings, tests run faster.
 """
+from pathlib import Path
+from tempfile import gettempdir
 
 from propylon_document_manager.site.settings.base import *  # noqa
 from propylon_document_manager.site.settings.base import env
@@ -30,3 +32,8 @@ EMAIL_BACKEND = "django.core.mail.backends.locmem.EmailBackend"
 TEMPLATES[0]["OPTIONS"]["debug"] = True  # type: ignore # noqa: F405
 # Your stuff...
 # ------------------------------------------------------------------------------
+# A second database standing in for a read replica, only read from in tests that list it in DATABASE_REPLICAS
+DATABASES["replica"] = {**DATABASES["default"], "NAME": "replica.sqlite", "ATOMIC_REQUESTS": False}  # noqa: F405
+# A file instead of the in-memory database, so that concurrent test threads wait for the write lock for up to the
+# busy timeout like they do in production, instead of failing with "database table is locked"
+DATABASES["default"]["TEST"] = {"NAME": str(Path(gettempdir()) / "test_propylon_document_manager.sqlite")}  # noqa: F405
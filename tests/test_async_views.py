@@ -0,0 +1,108 @@
+import io
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.files.base import ContentFile
+from django.test import AsyncRequestFactory
+from rest_framework.authtoken.models import Token
+
+from propylon_document_manager.file_versions.api.async_views import (
+    AsyncDocumentByHashView,
+    AsyncDocumentListView,
+    AsyncDocumentView,
+)
+from propylon_document_manager.file_versions.deltas import deltify, materialized_revisions
+from propylon_document_manager.file_versions.models import Document
+
+from .factories import DocumentFactory, UserFactory
+
+
+@pytest.fixture
+def auth(user):
+    return {"headers": {"Authorization": f"Token {Token.objects.create(user=user).key}"}}
+
+
+def call(view_class, request, **kwargs):
+    async def run():
+        response = await view_class.as_view()(request, **kwargs)
+        if response.streaming:
+            response.content_bytes = b"".join([chunk async for chunk in response.streaming_content])
+        return response
+
+    return async_to_sync(run)()
+
+
+@pytest.mark.django_db
+def test_async_download_streams_latest_revision(user, auth):
+    DocumentFactory(user=user, url="docs/a.txt", version__version_number=0, file=ContentFile(b"first"))
+    DocumentFactory(user=user, url="docs/a.txt", version__version_number=1, file=ContentFile(b"second"))
+    factory = AsyncRequestFactory()
+
+    response = call(AsyncDocumentView, factory.get("/", **auth), url="docs/a.txt")
+    assert response.status_code == 200
+    assert response.content_bytes == b"second"
+
+    response = call(
+        AsyncDocumentView,
+        factory.get("/", {"revision": 0}, headers={**auth["headers"], "Range": "bytes=1-3"}),
+        url="docs/a.txt",
+    )
+    assert response.status_code == 206
+    assert response.content_bytes == b"irs"
+
+
+@pytest.mark.django_db
+def test_async_upload_and_list(user, auth):
+    factory = AsyncRequestFactory()
+    file = io.BytesIO(b"uploaded asynchronously")
+    file.name = "async.txt"
+
+    response = call(AsyncDocumentView, factory.post("/", {"file": file}, **auth), url="docs/async.txt")
+    assert response.status_code == 201
+    assert Document.objects.get(user=user).version.file_name == "async.txt"
+
+    response = call(AsyncDocumentListView, factory.get("/", **auth))
+    assert response.status_code == 200
+    assert b'"url": "docs/async.txt"' in response.content
+
+
+@pytest.mark.django_db
+def test_async_upload_that_just_fits_the_quota_is_stored(user, auth, settings):
+    settings.DOCUMENT_QUOTA_BYTES = 100
+    factory = AsyncRequestFactory()
+    file = io.BytesIO(b"x" * 97)
+    file.name = "full.txt"
+
+    response = call(AsyncDocumentView, factory.post("/", {"file": file}, **auth), url="docs/full.txt")
+    assert response.status_code == 201
+    assert Document.objects.get(user=user).size == 97
+
+
+@pytest.mark.django_db
+def test_async_views_require_access(user, auth):
+    other = DocumentFactory(user=UserFactory(), url="docs/other.txt")
+    factory = AsyncRequestFactory()
+
+    assert call(AsyncDocumentListView, factory.get("/")).status_code == 403
+    response = call(AsyncDocumentByHashView, factory.get("/", **auth), content_hash=other.content_hash)
+    assert response.status_code == 403
+
+
+@pytest.mark.django_db
+def test_async_download_rebuilds_deltas_and_rejects_bad_revisions(user, auth):
+    old = b"".join(f"line {i}\n".encode() for i in range(2000))
+    new = old + b"appended\n"
+    previous = DocumentFactory(user=user, url="docs/log.txt", version__version_number=0, file=ContentFile(old))
+    latest = DocumentFactory(user=user, url="docs/log.txt", version__version_number=1, file=ContentFile(new))
+    assert deltify(previous.blob, latest.blob)
+    materialized_revisions.clear()
+    factory = AsyncRequestFactory()
+
+    request = factory.get("/", {"revision": 0}, headers={**auth["headers"], "Range": "bytes=0-5,-7"})
+    response = call(AsyncDocumentView, request, url="docs/log.txt")
+    assert response.status_code == 206
+    assert b"line 0" in response.content_bytes
+    assert b"e 1999\n" in response.content_bytes
+
+    response = call(AsyncDocumentView, factory.get("/", {"revision": "x"}, **auth), url="docs/log.txt")
+    assert response.status_code == 400
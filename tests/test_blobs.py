@@ -0,0 +1,119 @@
+import io
+import os
+
+import pytest
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from propylon_document_manager.file_versions.blobs import BLOB_STAGING, blob_path, store_blob_file
+from propylon_document_manager.file_versions.models import Blob, Document
+
+from .factories import UserFactory
+
+
+def upload(client, url, content, name="file.txt"):
+    file = io.BytesIO(content)
+    file.name = name
+    return client.post(reverse("api:document", kwargs={"url": url}), {"file": file}, format="multipart")
+
+
+@pytest.mark.django_db
+def test_identical_uploads_share_one_blob(api_client, settings):
+    other_client = APIClient()
+    other_client.force_authenticate(user=UserFactory())
+
+    assert upload(api_client, "docs/a.txt", b"shared bytes").status_code == 201
+    assert upload(api_client, "docs/b.txt", b"shared bytes").status_code == 201
+    assert upload(other_client, "docs/a.txt", b"shared bytes").status_code == 201
+
+    blob = Blob.objects.get()
+    assert blob.ref_count == 3
+    assert blob.size == len(b"shared bytes")
+    assert blob.file.name == blob_path(blob.content_hash)
+    assert Document.objects.filter(blob=blob).count() == 3
+
+    stored = [files for _, _, files in os.walk(settings.MEDIA_ROOT)]
+    assert sum(len(files) for files in stored) == 1
+
+
+@pytest.mark.django_db
+def test_blob_collected_after_last_reference(api_client):
+    upload(api_client, "docs/a.txt", b"short lived")
+    upload(api_client, "docs/b.txt", b"short lived")
+    blob = Blob.objects.get()
+    path = blob.file.path
+
+    Document.objects.filter(url="docs/a.txt").delete()
+    blob.refresh_from_db()
+    assert blob.ref_count == 1
+
+    Document.objects.filter(url="docs/b.txt").delete()
+    assert not Blob.objects.exists()
+    # An upload of the same content may still reuse the file until collect_blobs removes it
+    assert os.path.exists(path)
+
+    call_command("collect_blobs", stdout=io.StringIO())
+    assert os.path.exists(path)
+    call_command("collect_blobs", "--grace-minutes=0", stdout=io.StringIO())
+    assert not os.path.exists(path)
+
+
+@pytest.mark.django_db
+def test_released_file_reused_by_new_upload_survives_collection(api_client):
+    upload(api_client, "docs/a.txt", b"come back")
+    path = Blob.objects.get().file.path
+    Document.objects.all().delete()
+    # Old enough to be collected, had it not been reused
+    os.utime(path, (0, 0))
+
+    assert upload(api_client, "docs/b.txt", b"come back").status_code == 201
+    call_command("collect_blobs", stdout=io.StringIO())
+
+    assert Blob.objects.get().file.path == path
+    with open(path, "rb") as stored:
+        assert stored.read() == b"come back"
+
+
+@pytest.mark.django_db
+def test_truncated_file_at_blob_path_is_replaced(api_client):
+    upload(api_client, "docs/a.txt", b"complete content")
+    path = Blob.objects.get().file.path
+    Document.objects.all().delete()
+    with open(path, "wb") as truncated:
+        truncated.write(b"compl")
+
+    assert upload(api_client, "docs/b.txt", b"complete content").status_code == 201
+
+    with open(path, "rb") as stored:
+        assert stored.read() == b"complete content"
+
+
+def test_content_is_renamed_into_place():
+    content_hash = "ab" * 32
+    name = store_blob_file(ContentFile(b"in one piece"), content_hash)
+
+    assert name == blob_path(content_hash)
+    with default_storage.open(name) as stored:
+        assert stored.read() == b"in one piece"
+    assert default_storage.listdir(BLOB_STAGING) == ([], [])
+
+
+@pytest.mark.django_db
+def test_collect_blobs_repairs_counts_and_removes_unused(api_client):
+    upload(api_client, "docs/a.txt", b"kept")
+    kept = Blob.objects.get()
+    Blob.objects.filter(pk=kept.pk).update(ref_count=5)
+    unused = Blob.objects.acquire(ContentFile(b"unused"))
+    stray = default_storage.save(blob_path("0" * 64), ContentFile(b"stray"))
+
+    call_command("collect_blobs", "--grace-minutes=0", stdout=io.StringIO())
+
+    kept.refresh_from_db()
+    assert kept.ref_count == 1
+    assert os.path.exists(kept.file.path)
+    assert not Blob.objects.filter(pk=unused.pk).exists()
+    assert not default_storage.exists(unused.file.name)
+    assert not default_storage.exists(stray)
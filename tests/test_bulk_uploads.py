@@ -0,0 +1,167 @@
+import io
+import tarfile
+import zipfile
+
+import pytest
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from propylon_document_manager.file_versions.blobs import BLOB_STAGING
+from propylon_document_manager.file_versions.models import Blob, Document, DocumentAccess
+
+from .factories import DocumentFactory
+
+
+def named(content, name):
+    file = io.BytesIO(content)
+    file.name = name
+    return file
+
+
+def bulk_upload(client, pairs):
+    data = {
+        "urls": [url for url, _ in pairs],
+        "files": [named(content, url.rsplit("/", 1)[-1]) for url, content in pairs],
+    }
+    return client.post(reverse("api:document-bulk"), data, format="multipart")
+
+
+@pytest.mark.django_db
+def test_bulk_upload_continues_versions_and_reports_duplicates(api_client, user):
+    DocumentFactory(user=user, url="docs/a.txt", version__version_number=0, file=ContentFile(b"a0"))
+
+    response = bulk_upload(
+        api_client,
+        [("docs/a.txt", b"a1"), ("docs/a.txt", b"a0"), ("docs/b.txt", b"a1"), ("docs/b.txt", b"a1")],
+    )
+
+    assert response.status_code == 200
+    assert (response.data["created"], response.data["duplicate"], response.data["invalid"]) == (2, 2, 0)
+    assert [(r["url"], r["status"], r.get("version_number")) for r in response.data["results"]] == [
+        ("docs/a.txt", "created", 1),
+        ("docs/a.txt", "duplicate", None),
+        ("docs/b.txt", "created", 0),
+        ("docs/b.txt", "duplicate", None),
+    ]
+    # Identical content within the batch is stored once and referenced by both URLs
+    assert Blob.objects.get(content_hash=response.data["results"][0]["content_hash"]).ref_count == 2
+    latest = Document.objects.filter(url="docs/a.txt").order_by("-version__version_number").first()
+    with latest.blob.open() as stored:
+        assert stored.read() == b"a1"
+    assert default_storage.listdir(BLOB_STAGING) == ([], [])
+    # Bulk inserts still grant the owner access by hash
+    assert DocumentAccess.objects.filter(user=user).count() == Document.objects.filter(user=user).count()
+
+
+@pytest.mark.django_db
+def test_bulk_upload_query_count_does_not_grow_with_batch(api_client):
+    def count_queries(pairs):
+        with CaptureQueriesContext(connection) as captured:
+            assert bulk_upload(api_client, pairs).data["created"] == len(pairs)
+        return len(captured)
+
+    small = count_queries([(f"small/{i}.txt", f"small {i}".encode()) for i in range(2)])
+    large = count_queries([(f"large/{i}.txt", f"large {i}".encode()) for i in range(20)])
+    assert small == large
+
+
+@pytest.mark.django_db
+def test_bulk_upload_from_tar_archive(api_client):
+    body = io.BytesIO()
+    with tarfile.open(fileobj=body, mode="w:gz") as archive:
+        for name, content in [("reports/q1.txt", b"first quarter"), ("./reports/q2.txt", b"second quarter")]:
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+
+    response = api_client.post(
+        reverse("api:document-bulk") + "?prefix=imports", body.getvalue(), content_type="application/gzip"
+    )
+
+    assert response.status_code == 200
+    assert sorted(Document.objects.values_list("url", "version__file_name")) == [
+        ("imports/reports/q1.txt", "q1.txt"),
+        ("imports/reports/q2.txt", "q2.txt"),
+    ]
+
+
+@pytest.mark.django_db
+def test_bulk_upload_from_zip_archive(api_client):
+    body = io.BytesIO()
+    with zipfile.ZipFile(body, "w") as archive:
+        archive.writestr("notes/", "")
+        archive.writestr("notes/todo.md", b"- ship it")
+
+    response = api_client.post(reverse("api:document-bulk"), body.getvalue(), content_type="application/zip")
+
+    assert response.data["created"] == 1
+    doc = Document.objects.get()
+    assert doc.url == "notes/todo.md"
+    with doc.blob.open() as stored:
+        assert stored.read() == b"- ship it"
+
+
+@pytest.mark.django_db
+def test_bulk_upload_rejects_bad_requests(api_client):
+    url = reverse("api:document-bulk")
+    data = {"urls": ["docs/a.txt", "docs/b.txt"], "files": [named(b"only one", "a.txt")]}
+    assert api_client.post(url, data, format="multipart").status_code == 400
+
+    assert api_client.post(url, b"not an archive", content_type="application/x-tar").status_code == 400
+    assert not Document.objects.exists()
+
+
+@pytest.mark.django_db
+def test_bulk_upload_stores_older_revisions_as_deltas(api_client, settings, django_capture_on_commit_callbacks):
+    settings.DOCUMENT_DELTA_STORAGE = True
+    base = b"".join(f"line {i}\n".encode() for i in range(500))
+    revisions = [base + f"edit {n}\n".encode() for n in range(3)]
+
+    with django_capture_on_commit_callbacks(execute=True):
+        bulk_upload(api_client, [("docs/log.txt", content) for content in revisions])
+
+    docs = Document.objects.select_related("blob").order_by("version__version_number")
+    # Version 0 is a keyframe, version 1 a delta against the latest
+    assert [doc.blob.delta_base_id is not None for doc in docs] == [False, True, False]
+    for doc, content in zip(docs, revisions):
+        with doc.blob.open() as stored:
+            assert stored.read() == content
+
+
+@pytest.mark.django_db
+def test_bulk_upload_reports_batches_committed_before_a_truncated_archive(api_client, monkeypatch):
+    monkeypatch.setattr("propylon_document_manager.file_versions.bulk_uploads.BATCH_SIZE", 2)
+    body = io.BytesIO()
+    with tarfile.open(fileobj=body, mode="w") as archive:
+        for number in range(4):
+            content = f"report {number}".encode() * 200
+            info = tarfile.TarInfo(f"reports/{number}.txt")
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+    # Cut inside the last member
+    truncated = body.getvalue()[: 17 * 512]
+
+    response = api_client.post(reverse("api:document-bulk"), truncated, content_type="application/x-tar")
+
+    assert response.status_code == 400
+    assert response.data["created"] == 2
+    assert [result["url"] for result in response.data["results"]] == ["reports/0.txt", "reports/1.txt"]
+    assert Document.objects.count() == 2
+    assert default_storage.listdir(BLOB_STAGING) == ([], [])
+
+
+@pytest.mark.django_db
+def test_bulk_upload_rejects_zip_with_corrupt_member(api_client):
+    body = io.BytesIO()
+    with zipfile.ZipFile(body, "w") as archive:
+        archive.writestr("notes/a.txt", b"intact member")
+    corrupt = body.getvalue().replace(b"intact member", b"broken member")
+
+    response = api_client.post(reverse("api:document-bulk"), corrupt, content_type="application/zip")
+
+    assert response.status_code == 400
+    assert not Document.objects.exists()
+    assert default_storage.listdir(BLOB_STAGING) == ([], [])
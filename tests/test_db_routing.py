@@ -0,0 +1,67 @@
+import pytest
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from propylon_document_manager.file_versions.models import Document
+from propylon_document_manager.site.db_routing import replica_reads
+
+pytestmark = pytest.mark.django_db(databases=["default", "replica"])
+
+
+@pytest.fixture
+def replica(settings):
+    settings.DATABASE_REPLICAS = ["replica"]
+    cache.clear()
+    return connections["replica"]
+
+
+@pytest.fixture
+def token_client(user, replica):
+    token = Token.objects.create(user=user)
+    # Replication would have copied them by now
+    user.save(using="replica", force_insert=True)
+    token.save(using="replica", force_insert=True)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+    return client
+
+
+def selects(captured):
+    return [query["sql"] for query in captured if query["sql"].startswith("SELECT")]
+
+
+def test_safe_requests_read_from_replica(token_client, replica):
+    with CaptureQueriesContext(connections["default"]) as primary, CaptureQueriesContext(replica) as replicated:
+        assert token_client.get(reverse("api:document-list")).status_code == 200
+
+    assert selects(replicated)
+    assert not selects(primary)
+
+
+def test_client_reads_its_own_writes_from_primary(token_client, replica):
+    url = reverse("api:document", args=["docs/new.txt"])
+    upload = token_client.post(url, {"file": SimpleUploadedFile("new.txt", b"new")}, format="multipart")
+    assert upload.status_code == 201
+
+    # Still on the primary while the replica has not caught up
+    assert token_client.get(url).status_code == 200
+    assert not Document.objects.using("replica").exists()
+
+    # Once the sticky window is over, reads go back to the (lagging) replica
+    cache.clear()
+    assert token_client.get(url).status_code == 404
+
+
+def test_reads_outside_requests_use_primary(user, replica):
+    with CaptureQueriesContext(replica) as replicated:
+        assert not Document.objects.filter(user=user).exists()
+    assert not replicated
+
+    with replica_reads(), CaptureQueriesContext(replica) as replicated:
+        assert not Document.objects.filter(user=user).exists()
+    assert len(replicated) == 1
@@ -0,0 +1,143 @@
+import hashlib
+import io
+import os
+import random
+from unittest import mock
+
+import pytest
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import transaction
+from django.urls import reverse
+
+from propylon_document_manager.file_versions import deltas, search
+from propylon_document_manager.file_versions.deltas import apply_delta, make_delta, materialized_revisions
+from propylon_document_manager.file_versions.models import Blob, Document
+from propylon_document_manager.file_versions.services import create_revision
+
+from .factories import DocumentFactory, UserFactory
+
+
+def revisions(count, size=64 * 1024):
+    rng = random.Random(count)
+    content = bytearray(rng.randbytes(size))
+    result = []
+    for _ in range(count):
+        for _ in range(3):
+            content[rng.randrange(size)] = rng.randrange(256)
+        content[rng.randrange(size) : 0] = b"inserted text"
+        result.append(bytes(content))
+    return result
+
+
+def test_delta_round_trip():
+    base, target = revisions(2)
+
+    delta = make_delta(base, target, len(target) // 2)
+
+    assert len(delta) < len(target) // 50
+    assert apply_delta(base, delta) == target
+
+
+def test_unrelated_content_is_not_delta_encoded():
+    assert make_delta(os.urandom(64 * 1024), os.urandom(64 * 1024), 32 * 1024) is None
+
+
+@pytest.mark.django_db
+def test_older_revisions_stored_as_deltas(api_client, settings, django_capture_on_commit_callbacks):
+    settings.DOCUMENT_DELTA_STORAGE = True
+    contents = revisions(3)
+    url = reverse("api:document", kwargs={"url": "docs/report.txt"})
+    for content in contents:
+        file = io.BytesIO(content)
+        file.name = "report.txt"
+        with django_capture_on_commit_callbacks(execute=True):
+            assert api_client.post(url, {"file": file}, format="multipart").status_code == 201
+
+    blobs = {doc.version.version_number: doc.blob for doc in Document.objects.select_related("version", "blob")}
+    # The first revision is a keyframe and the latest is always full
+    assert blobs[0].delta_base is None
+    assert blobs[1].delta_base == blobs[2]
+    assert blobs[2].delta_base is None
+    assert blobs[2].ref_count == 2
+    assert blobs[1].file.size < len(contents[1]) // 50
+
+    materialized_revisions.clear()
+    for number, content in enumerate(contents):
+        response = api_client.get(url, {"revision": number})
+        assert b"".join(response.streaming_content) == content
+    assert materialized_revisions.get(blobs[1].content_hash) == contents[1]
+
+
+@pytest.mark.django_db
+def test_deltify_revisions_command_converts_existing_chains(user, django_capture_on_commit_callbacks):
+    contents = revisions(4)
+    for number, content in enumerate(contents):
+        DocumentFactory(user=user, url="docs/chain.txt", version__version_number=number, file=ContentFile(content))
+
+    with django_capture_on_commit_callbacks(execute=True):
+        call_command("deltify_revisions", stdout=io.StringIO())
+
+    docs = Document.objects.select_related("version", "blob").order_by("version__version_number")
+    assert [doc.blob.delta_base_id is not None for doc in docs] == [False, True, True, False]
+    materialized_revisions.clear()
+    for doc, content in zip(docs, contents):
+        with doc.blob.open() as stored:
+            assert stored.read() == content
+    # Full copies of converted revisions are gone
+    assert sum(not blob.file.name.endswith(".delta") for blob in Blob.objects.all()) == 2
+
+
+@pytest.mark.django_db
+def test_upload_response_does_not_wait_for_delta_encoding(user, settings, django_capture_on_commit_callbacks):
+    settings.DOCUMENT_DELTA_STORAGE = True
+    submitted = []
+    with mock.patch.object(deltas._executor, "submit", lambda *args: submitted.append(args)):
+        for content in revisions(3):
+            with mock.patch.object(search._executor, "submit"), django_capture_on_commit_callbacks(execute=True):
+                create_revision(user, "docs/report.txt", ContentFile(content), "report.txt")
+
+    # Only handed to the worker pool, nothing was converted in the request
+    assert len(submitted) == 2
+    assert not Blob.objects.filter(delta_base__isnull=False).exists()
+
+
+@pytest.mark.django_db
+def test_content_that_is_another_urls_latest_revision_stays_full(user, settings):
+    settings.DOCUMENT_DELTA_STORAGE = True
+    first, second, third = revisions(3)
+    create_revision(user, "docs/report.txt", ContentFile(first), "report.txt")
+    create_revision(user, "docs/report.txt", ContentFile(second), "report.txt")
+    create_revision(UserFactory(), "copies/report.txt", ContentFile(second), "report.txt")
+
+    with mock.patch.object(transaction, "on_commit", lambda callback: callback()):
+        with mock.patch.object(search._executor, "submit"):
+            create_revision(user, "docs/report.txt", ContentFile(third), "report.txt")
+
+    # Still what copies/report.txt points at, so it stays in full
+    assert Blob.objects.get(content_hash=hashlib.sha256(second).hexdigest()).delta_base is None
+
+
+@pytest.mark.django_db
+def test_blobs_converted_against_each_other_concurrently_do_not_form_a_cycle(user):
+    first, second, latest = revisions(3)
+    for content in (first, second, latest):
+        create_revision(user, "docs/report.txt", ContentFile(content), "report.txt")
+    a, b = (Blob.objects.get(content_hash=hashlib.sha256(content).hexdigest()) for content in (first, second))
+    encode = deltas.make_delta
+    saved = []
+
+    def converted_in_between(*args):
+        # Another job stores b against a after this one checked b does not depend on a
+        with mock.patch.object(deltas, "make_delta", encode):
+            saved.append(deltas.deltify(Blob.objects.get(pk=b.pk), Blob.objects.get(pk=a.pk)))
+        return encode(*args)
+
+    with mock.patch.object(deltas, "make_delta", converted_in_between):
+        assert deltas.deltify(a, b) == 0
+
+    assert saved[0] > 0
+    a.refresh_from_db()
+    assert a.delta_base is None
+    materialized_revisions.clear()
+    assert deltas.materialize(Blob.objects.get(pk=b.pk)) == second
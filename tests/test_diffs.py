@@ -0,0 +1,101 @@
+import difflib
+
+import pytest
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.storage import default_storage
+from django.urls import reverse
+
+from propylon_document_manager.file_versions.services import create_revision
+
+OLD = b"Clause 1: The tenant pays rent.\nClause 2: Pets are allowed.\nClause 3: Notice is one month.\n"
+NEW = b"Clause 1: The tenant pays rent.\nClause 2: Pets are not allowed.\nClause 3: Notice is one month.\nSigned"
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+
+
+def diff(client, url, **params):
+    return client.get(reverse("api:document-diff", args=[url]), params)
+
+
+@pytest.fixture
+def revisions(user):
+    return [
+        create_revision(user, "leases/flat.txt", ContentFile(content), "flat.txt")
+        for content in [OLD, NEW, b"\x00\x01binary"]
+    ]
+
+
+@pytest.mark.django_db
+def test_unified_diff_matches_difflib(api_client, revisions):
+    response = diff(api_client, "leases/flat.txt", **{"from": 0, "to": 1})
+
+    assert response.status_code == 200
+    assert (response.data["from"]["version_number"], response.data["to"]["version_number"]) == (0, 1)
+    assert (response.data["added"], response.data["removed"]) == (2, 1)
+    expected = difflib.unified_diff(
+        OLD.decode().splitlines(keepends=True),
+        NEW.decode().splitlines(keepends=True),
+        "leases/flat.txt\tv0",
+        "leases/flat.txt\tv1",
+        lineterm="\n",
+    )
+    # difflib leaves the missing final newline to the caller
+    assert response.data["diff"] == "".join(expected).replace("Signed", "Signed\n\\ No newline at end of file\n")
+
+
+@pytest.mark.django_db
+def test_structured_diff_is_cached_by_content(api_client, revisions):
+    response = diff(api_client, "leases/flat.txt", to=1, output="structured")
+
+    assert response.data["changes"] == [
+        {
+            "op": "replace",
+            "from_line": 2,
+            "from_lines": ["Clause 2: Pets are allowed."],
+            "to_line": 2,
+            "to_lines": ["Clause 2: Pets are not allowed."],
+        },
+        {"op": "insert", "from_line": 4, "from_lines": [], "to_line": 4, "to_lines": ["Signed"]},
+    ]
+    # Served from the cache once computed, without reading the files again
+    for doc in revisions[:2]:
+        default_storage.delete(doc.blob.file.name)
+    assert diff(api_client, "leases/flat.txt", to=1, output="structured").data["changes"] == response.data["changes"]
+
+
+@pytest.mark.django_db
+def test_identical_revisions_skip_reading(api_client, revisions):
+    default_storage.delete(revisions[0].blob.file.name)
+
+    response = diff(api_client, "leases/flat.txt", **{"from": 0, "to": 0})
+    assert response.data["identical"] is True
+    assert response.data["diff"] == ""
+
+
+@pytest.mark.django_db
+def test_diff_rejects_what_it_cannot_compare(api_client, settings, revisions):
+    assert diff(api_client, "leases/flat.txt").status_code == 400  # latest is binary
+    assert diff(api_client, "leases/flat.txt", to=0).status_code == 400
+    assert diff(api_client, "leases/flat.txt", to=7).status_code == 404
+    assert diff(api_client, "leases/missing.txt").status_code == 404
+    assert diff(api_client, "leases/flat.txt", to=1, output="html").status_code == 400
+
+    settings.DOCUMENT_DIFF_MAX_SIZE = 10
+    assert diff(api_client, "leases/flat.txt", to=1).status_code == 400
+
+
+@pytest.mark.django_db
+def test_document_urls_ending_in_diff_are_documents(api_client):
+    document = reverse("api:document", args=["notes/diff"])
+    for content in [OLD, NEW]:
+        response = api_client.post(document, {"file": SimpleUploadedFile("diff", content)}, format="multipart")
+        assert response.status_code == 201
+
+    response = api_client.get(document)
+    assert b"".join(response.streaming_content) == NEW
+    assert diff(api_client, "notes/diff").data["added"] == 2
@@ -0,0 +1,121 @@
+import threading
+
+import pytest
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from propylon_document_manager.file_versions.api.views import latest_revision
+from propylon_document_manager.file_versions.models import Document, DocumentHead
+from propylon_document_manager.file_versions.services import DuplicateRevisionError, create_revision, create_revisions
+
+from .factories import DocumentFactory, UserFactory
+
+
+@pytest.mark.django_db
+def test_head_tracks_latest_revision(api_client, user, django_assert_num_queries):
+    # Revisions created before heads existed are continued, not renumbered
+    DocumentFactory(user=user, url="docs/a.txt", version__version_number=0, file=ContentFile(b"v0"))
+    create_revision(user, "docs/a.txt", ContentFile(b"v1"), "a.txt")
+    create_revisions(user, [("docs/a.txt", ContentFile(b"v2"), "a.txt"), ("docs/b.txt", ContentFile(b"b"), "b.txt")])
+
+    head = DocumentHead.objects.get(user=user, url="docs/a.txt")
+    assert head.next_version == 3
+    assert head.latest.version.version_number == 2
+    assert DocumentHead.objects.get(user=user, url="docs/b.txt").latest.version.version_number == 0
+
+    with django_assert_num_queries(1):
+        assert latest_revision(user, "docs/a.txt") == head.latest
+
+    response = api_client.get(reverse("api:document", kwargs={"url": "docs/a.txt"}))
+    assert b"".join(response.streaming_content) == b"v2"
+
+
+@pytest.mark.django_db
+def test_deleting_latest_revision_repoints_head(user):
+    for content in (b"v0", b"v1"):
+        create_revision(user, "docs/a.txt", ContentFile(content), "a.txt")
+
+    latest_revision(user, "docs/a.txt").delete()
+
+    head = DocumentHead.objects.get(user=user, url="docs/a.txt")
+    assert head.latest.version.version_number == 0
+    # Version numbers are never handed out twice
+    assert create_revision(user, "docs/a.txt", ContentFile(b"v2"), "a.txt").version.version_number == 2
+
+
+@pytest.mark.django_db(transaction=True)
+def test_parallel_uploads_get_distinct_versions():
+    user = UserFactory()
+    uploads = 8
+    errors = []
+    # All threads upload at once
+    start = threading.Barrier(uploads)
+
+    def upload(n):
+        try:
+            start.wait()
+            create_revision(user, "docs/contended.txt", ContentFile(f"upload {n}".encode()), "contended.txt")
+        except Exception as e:
+            errors.append(e)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=upload, args=(n,)) for n in range(uploads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    versions = sorted(
+        Document.objects.filter(url="docs/contended.txt").values_list("version__version_number", flat=True)
+    )
+    assert not errors
+    assert versions == list(range(uploads))
+    assert DocumentHead.objects.get(user=user, url="docs/contended.txt").latest.version.version_number == uploads - 1
+
+
+@pytest.mark.django_db
+def test_duplicate_check_waits_for_head_lock(user):
+    create_revision(user, "docs/a.txt", ContentFile(b"v0"), "a.txt")
+
+    with CaptureQueriesContext(connection) as queries, pytest.raises(DuplicateRevisionError):
+        create_revision(user, "docs/a.txt", ContentFile(b"v0"), "a.txt")
+
+    sql = [query["sql"] for query in queries]
+    locked = next(i for i, query in enumerate(sql) if query.startswith('UPDATE "file_versions_documenthead"'))
+    checked = next(i for i, query in enumerate(sql) if '"file_versions_document"."content_hash" =' in query)
+    assert locked < checked
+    # The reserved version was rolled back with the rest
+    assert DocumentHead.objects.get(user=user, url="docs/a.txt").next_version == 1
+
+
+@pytest.mark.django_db(transaction=True)
+def test_parallel_identical_uploads_store_one_revision():
+    user = UserFactory()
+    uploads = 8
+    duplicates = []
+    errors = []
+    start = threading.Barrier(uploads)
+
+    def upload():
+        try:
+            start.wait()
+            create_revision(user, "docs/same.txt", ContentFile(b"same bytes"), "same.txt")
+        except DuplicateRevisionError as e:
+            duplicates.append(e)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=upload) for _ in range(uploads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert len(duplicates) == uploads - 1
+    assert Document.objects.filter(url="docs/same.txt").count() == 1
@@ -1,9 +1,18 @@
 import io
+from datetime import timedelta
 
 import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework.test import APIClient
 
+from propylon_document_manager.file_versions.api.serializers import DocumentSerializer
+from propylon_document_manager.file_versions.api.views import readable_document
+from propylon_document_manager.file_versions.models import Document, DocumentAccess, DocumentShare
+from propylon_document_manager.file_versions.sharing import run_share_job
+
 from .factories import UserFactory, DocumentFactory
 
 
@@ -129,6 +138,28 @@ def test_document_by_hash(api_client, user):
     assert response_other.status_code == 403
 
 
+@pytest.mark.django_db
+def test_hash_access_follows_documents_and_shares(api_client, user, django_assert_num_queries):
+    owner = UserFactory()
+    doc = DocumentFactory(user=owner, url="docs/theirs.txt")
+    share_url = reverse("api:document-share", args=[doc.content_hash])
+    owner_client = APIClient()
+    owner_client.force_authenticate(user=owner)
+
+    assert readable_document(user, doc.content_hash) is None
+    owner_client.post(share_url, {"emails": [user.email]}, format="json")
+    with django_assert_num_queries(1):
+        assert readable_document(user, doc.content_hash) == doc
+    assert api_client.get(reverse("api:document-by-hash", args=[doc.content_hash])).status_code == 200
+
+    owner_client.post(share_url, {"emails": []}, format="json")
+    assert readable_document(user, doc.content_hash) is None
+    assert readable_document(owner, doc.content_hash) == doc
+
+    doc.delete()
+    assert not DocumentAccess.objects.exists()
+
+
 # -----------------------------
 # Upload document test
 # -----------------------------
@@ -161,6 +192,19 @@ def test_document_upload_duplicate_hash_rejected(api_client, user):
     assert resp3.data["url"] == "docs/new.txt"
 
 
+@pytest.mark.django_db
+@pytest.mark.parametrize("document_url", ["bulk", "export", "negotiate", "shared", "search"])
+def test_documents_named_like_endpoints_are_documents(api_client, document_url):
+    url = reverse("api:document", kwargs={"url": document_url})
+    upload = io.BytesIO(b"named like an endpoint")
+    upload.name = "file.txt"
+    assert api_client.post(url, {"file": upload}, format="multipart").status_code == 201
+
+    response = api_client.get(url)
+    assert response.status_code == 200
+    assert b"".join(response.streaming_content) == b"named like an endpoint"
+
+
 # -----------------------------
 # Revision retrieval tests
 # -----------------------------
@@ -239,3 +283,182 @@ def test_document_share_and_access_flow(api_client, user):
     other_client.force_authenticate(user=non_shared_user)
     resp_denied = other_client.get(doc_url)
     assert resp_denied.status_code == 403
+
+
+@pytest.fixture
+def many_urls(user):
+    """Twelve URLs with two revisions each, ``docs/11.txt`` revised most recently."""
+    start = timezone.now() - timedelta(days=1)
+    for i in range(12):
+        for revision in range(2):
+            doc = DocumentFactory(user=user, url=f"docs/{i:02}.txt", version__version_number=revision)
+            Document.objects.filter(pk=doc.pk).update(created_at=start + timedelta(minutes=i, seconds=revision))
+    return [f"docs/{i:02}.txt" for i in reversed(range(12))]
+
+
+@pytest.mark.django_db
+def test_document_list_pages_over_urls(api_client, many_urls):
+    response = api_client.get(reverse("api:document-list"), {"page": 3, "page_size": 5})
+
+    assert response.data["count"] == 12
+    assert [group["url"] for group in response.data["results"]] == many_urls[10:]
+    assert [rev["version_number"] for rev in response.data["results"][0]["revisions"]] == [1, 0]
+
+
+@pytest.mark.django_db
+def test_document_list_cursor_pagination(api_client, many_urls):
+    seen = []
+    next_url = reverse("api:document-list") + "?pagination=cursor&page_size=5"
+    while next_url:
+        response = api_client.get(next_url)
+        assert response.status_code == 200
+        assert len(response.data["results"]) <= 5
+        seen += [group["url"] for group in response.data["results"]]
+        next_url = response.data["next"]
+
+    assert seen == many_urls
+
+
+@pytest.mark.django_db
+def test_document_list_limits_revisions_per_url(api_client, many_urls):
+    response = api_client.get(reverse("api:document-list"), {"revisions": 1})
+
+    assert all(len(group["revisions"]) == 1 for group in response.data["results"])
+    assert response.data["results"][0]["revisions"][0]["version_number"] == 1
+    assert api_client.get(reverse("api:document-list"), {"revisions": 0}).status_code == 400
+
+
+def share_with_all(doc, users):
+    for shared_with in users:
+        DocumentShare.objects.create(document=doc, shared_with=shared_with)
+
+
+@pytest.mark.django_db
+def test_document_list_query_count_is_constant(api_client, user, django_assert_max_num_queries):
+    readers = [UserFactory() for _ in range(3)]
+    for i in range(10):
+        for revision in range(3):
+            doc = DocumentFactory(user=user, url=f"docs/{i}.txt", version__version_number=revision)
+            share_with_all(doc, readers)
+
+    # Count, page of URLs, their revisions and their shares, plus the request savepoints
+    with django_assert_max_num_queries(6):
+        response = api_client.get(reverse("api:document-list"))
+
+    assert len(response.data["results"]) == 10
+    shared = response.data["results"][0]["revisions"][0]["shared_users"]
+    assert [u["email"] for u in shared] == [reader.email for reader in readers]
+
+
+@pytest.mark.django_db
+def test_document_detail_and_share_query_counts(api_client, user, django_assert_max_num_queries):
+    doc = DocumentFactory(user=user, url="docs/shared.txt")
+    readers = [UserFactory() for _ in range(5)]
+    share_with_all(doc, readers)
+
+    with django_assert_max_num_queries(1):
+        shared = DocumentSerializer(doc).data["shared_users"]
+    assert [u["email"] for u in shared] == [reader.email for reader in readers]
+
+    share_url = reverse("api:document-share", args=[doc.content_hash])
+    # Document, existing shares, users by email, plus savepoints; none of it per email
+    with django_assert_max_num_queries(8):
+        response = api_client.post(share_url, {"emails": [reader.email for reader in readers]}, format="json")
+    assert response.data == {"added": [], "removed": [], "not_found": []}
+
+
+@pytest.mark.django_db
+def test_share_reconciliation_is_batched(api_client, user, django_assert_max_num_queries):
+    doc = DocumentFactory(user=user, url="docs/memo.txt")
+    staff = [UserFactory() for _ in range(40)]
+    share_with_all(doc, staff[:10])
+    emails = [member.email for member in staff[5:]] + ["nobody@example.com"]
+
+    # Document, current shares, users, inserts of shares and access rows, then the delete
+    with django_assert_max_num_queries(12):
+        response = api_client.post(
+            reverse("api:document-share", args=[doc.content_hash]), {"emails": emails}, format="json"
+        )
+
+    assert response.data["added"] == [member.email for member in staff[10:]]
+    assert sorted(response.data["removed"]) == sorted(member.email for member in staff[:5])
+    assert response.data["not_found"] == ["nobody@example.com"]
+    assert set(doc.shares.values_list("shared_with__email", flat=True)) == {member.email for member in staff[5:]}
+    assert DocumentAccess.objects.filter(document=doc, share__isnull=False).count() == 35
+
+
+@pytest.mark.django_db
+def test_share_reconciliation_in_background(api_client, user, django_capture_on_commit_callbacks):
+    doc = DocumentFactory(user=user, url="docs/memo.txt")
+    reader = UserFactory()
+    share_url = reverse("api:document-share", args=[doc.content_hash])
+
+    with django_capture_on_commit_callbacks() as callbacks:
+        response = api_client.post(share_url, {"emails": [reader.email], "async": True}, format="json")
+    assert response.status_code == 202
+    job_url = reverse("api:share-job", args=[response.data["id"]])
+    assert api_client.get(job_url).data["status"] == "pending"
+
+    # Run the job in this thread instead of the worker pool
+    assert len(callbacks) == 1
+    run_share_job(response.data["id"])
+
+    response = api_client.get(job_url)
+    assert response.data["status"] == "done"
+    assert response.data["result"] == {"added": [reader.email], "removed": [], "not_found": []}
+    assert readable_document(reader, doc.content_hash) == doc
+
+
+@pytest.mark.django_db
+def test_shared_with_me_groups_by_owner_and_url(api_client, user, django_assert_num_queries):
+    alice, bob = UserFactory(), UserFactory()
+    first = DocumentFactory(user=alice, url="docs/plan.txt", version__version_number=0)
+    second = DocumentFactory(user=alice, url="docs/plan.txt", version__version_number=1)
+    other = DocumentFactory(user=bob, url="docs/plan.txt", version__version_number=0)
+    DocumentFactory(user=bob, url="docs/private.txt", version__version_number=0)
+    for doc in (first, other, second):
+        DocumentShare.objects.create(document=doc, shared_with=user)
+    DocumentShare.objects.create(document=other, shared_with=alice)
+
+    # One SELECT, inside the request's savepoint
+    with django_assert_num_queries(3):
+        response = api_client.get(reverse("api:document-shared"))
+
+    assert response.status_code == 200
+    assert [(group["owner"]["email"], group["url"]) for group in response.data["results"]] == [
+        (alice.email, "docs/plan.txt"),
+        (bob.email, "docs/plan.txt"),
+    ]
+    assert [rev["version_number"] for rev in response.data["results"][0]["revisions"]] == [1, 0]
+
+
+@pytest.mark.django_db
+def test_shared_with_me_keyset_pages(api_client, user):
+    owner = UserFactory()
+    for i in range(5):
+        doc = DocumentFactory(user=owner, url=f"docs/{i}.txt", version__version_number=0)
+        DocumentShare.objects.create(document=doc, shared_with=user)
+
+    urls = []
+    next_page = reverse("api:document-shared") + "?page_size=2"
+    while next_page:
+        response = api_client.get(next_page)
+        urls += [group["url"] for group in response.data["results"]]
+        next_page = response.data["next"]
+
+    assert urls == [f"docs/{i}.txt" for i in reversed(range(5))]
+
+
+@pytest.mark.django_db
+def test_document_list_cursor_seeks_heads_index(api_client, many_urls):
+    first = api_client.get(reverse("api:document-list"), {"pagination": "cursor", "page_size": 5})
+    with CaptureQueriesContext(connection) as captured:
+        response = api_client.get(first.data["next"])
+    assert [group["url"] for group in response.data["results"]] == many_urls[5:10]
+
+    page_query = next(query["sql"] for query in captured if "file_versions_documenthead" in query["sql"])
+    assert "GROUP BY" not in page_query
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN QUERY PLAN {page_query}")
+        plan = " ".join(str(row) for row in cursor.fetchall())
+    assert "head_user_latest_url" in plan
@@ -0,0 +1,144 @@
+import pytest
+from django.core.files.base import ContentFile
+from django.urls import reverse
+from django.utils.http import http_date
+
+from propylon_document_manager.file_versions.models import Blob
+
+from .factories import DocumentFactory
+
+CONTENT = bytes(range(256)) * 4
+
+
+@pytest.fixture
+def doc(user):
+    return DocumentFactory(
+        user=user,
+        url="docs/data.bin",
+        version__file_name="data.bin",
+        version__version_number=0,
+        file=ContentFile(CONTENT),
+    )
+
+
+def download(client, doc, **headers):
+    return client.get(reverse("api:document", kwargs={"url": doc.url}), **headers)
+
+
+@pytest.mark.django_db
+def test_download_advertises_range_support(api_client, doc):
+    response = download(api_client, doc)
+    assert response.status_code == 200
+    assert response["Accept-Ranges"] == "bytes"
+    assert b"".join(response.streaming_content) == CONTENT
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "header, start, end",
+    [("bytes=10-19", 10, 19), ("bytes=1000-", 1000, 1023), ("bytes=-24", 1000, 1023), ("bytes=1000-5000", 1000, 1023)],
+)
+def test_single_range(api_client, doc, header, start, end):
+    response = download(api_client, doc, HTTP_RANGE=header)
+
+    assert response.status_code == 206
+    assert response["Content-Range"] == f"bytes {start}-{end}/1024"
+    assert response["Content-Length"] == str(end - start + 1)
+    assert b"".join(response.streaming_content) == CONTENT[start : end + 1]
+
+
+@pytest.mark.django_db
+def test_multiple_ranges_by_hash(api_client, doc):
+    url = reverse("api:document-by-hash", args=[doc.content_hash])
+    response = api_client.get(url, HTTP_RANGE="bytes=0-1, 10-12")
+
+    assert response.status_code == 206
+    boundary = response["Content-Type"].split("boundary=")[1]
+    body = b"".join(response.streaming_content)
+    assert len(body) == int(response["Content-Length"])
+    parts = body.split(f"--{boundary}".encode())
+    assert b"Content-Range: bytes 0-1/1024\r\n\r\n" + CONTENT[0:2] + b"\r\n" in parts[1]
+    assert b"Content-Range: bytes 10-12/1024\r\n\r\n" + CONTENT[10:13] + b"\r\n" in parts[2]
+    assert parts[3] == b"--\r\n"
+
+
+@pytest.mark.django_db
+def test_unsatisfiable_range(api_client, doc):
+    response = download(api_client, doc, HTTP_RANGE="bytes=2048-")
+    assert response.status_code == 416
+    assert response["Content-Range"] == "bytes */1024"
+
+
+@pytest.mark.django_db
+def test_if_range(api_client, doc):
+    assert download(api_client, doc, HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE=f'"{doc.content_hash}"').status_code == 206
+    last_modified = http_date(doc.created_at.timestamp())
+    assert download(api_client, doc, HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE=last_modified).status_code == 206
+
+    # The client's copy is outdated, so it gets the whole file
+    response = download(api_client, doc, HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE='"outdated"')
+    assert response.status_code == 200
+    assert b"".join(response.streaming_content) == CONTENT
+
+
+def fail_open(self):
+    raise AssertionError("file was opened")
+
+
+@pytest.mark.django_db
+def test_matching_etag_gets_not_modified_without_opening_file(api_client, doc, monkeypatch):
+    response = download(api_client, doc)
+    assert response["ETag"] == f'"{doc.content_hash}"'
+
+    monkeypatch.setattr(Blob, "open", fail_open)
+    response = download(api_client, doc, HTTP_IF_NONE_MATCH=response["ETag"])
+    assert response.status_code == 304
+    assert response["ETag"] == f'"{doc.content_hash}"'
+
+    url = reverse("api:document-by-hash", args=[doc.content_hash])
+    assert api_client.get(url, HTTP_IF_NONE_MATCH=f'"other", "{doc.content_hash}"').status_code == 304
+
+
+@pytest.mark.django_db
+def test_changed_document_is_downloaded_again(api_client, doc, user):
+    etag = download(api_client, doc)["ETag"]
+    DocumentFactory(user=user, url=doc.url, version__version_number=1, file=ContentFile(b"new revision"))
+
+    response = download(api_client, doc, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert b"".join(response.streaming_content) == b"new revision"
+
+
+@pytest.mark.django_db
+def test_head_answers_from_database_row(api_client, doc, monkeypatch):
+    monkeypatch.setattr(Blob, "open", fail_open)
+    response = api_client.head(reverse("api:document", kwargs={"url": doc.url}))
+
+    assert response.status_code == 200
+    assert response["Content-Length"] == "1024"
+    assert response["ETag"] == f'"{doc.content_hash}"'
+    assert response["Content-Disposition"] == 'attachment; filename="data.bin"'
+    assert response.content == b""
+
+
+@pytest.mark.django_db
+def test_delivery_offloaded_to_nginx(api_client, doc, settings):
+    settings.DOCUMENT_DELIVERY = "x-accel-redirect"
+
+    response = download(api_client, doc, HTTP_RANGE="bytes=0-9")
+
+    assert response.status_code == 200
+    assert response["X-Accel-Redirect"] == f"/protected-media/{doc.blob.file.name}"
+    assert response["Content-Disposition"] == 'attachment; filename="data.bin"'
+    assert response["ETag"] == f'"{doc.content_hash}"'
+    assert response.content == b""
+
+
+@pytest.mark.django_db
+def test_delivery_offloaded_to_apache(api_client, doc, settings):
+    settings.DOCUMENT_DELIVERY = "x-sendfile"
+
+    response = download(api_client, doc)
+
+    assert response["X-Sendfile"] == doc.blob.file.path
+    assert response.content == b""
@@ -0,0 +1,103 @@
+import io
+import os
+import threading
+import zipfile
+from unittest import mock
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.files.base import ContentFile
+from django.urls import reverse
+
+from propylon_document_manager.file_versions.deltas import deltify
+from propylon_document_manager.file_versions.models import Blob
+
+from .factories import DocumentFactory, UserFactory
+
+
+def read_zip(response):
+    assert response.streaming
+    return zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content)))
+
+
+@pytest.fixture
+def history(user):
+    big = os.urandom(200 * 1024)
+    docs = [
+        DocumentFactory(
+            user=user,
+            url="docs/report.txt",
+            version__version_number=0,
+            version__file_name="report.txt",
+            file=ContentFile(b"draft " * 100),
+        ),
+        DocumentFactory(
+            user=user,
+            url="docs/report.txt",
+            version__version_number=1,
+            version__file_name="report.txt",
+            file=ContentFile(b"draft " * 100 + b"final"),
+        ),
+        DocumentFactory(
+            user=user,
+            url="media/clip.bin",
+            version__version_number=0,
+            version__file_name="clip.bin",
+            file=ContentFile(big),
+        ),
+    ]
+    DocumentFactory(user=UserFactory(), url="docs/report.txt", version__version_number=0)
+    return docs, big
+
+
+@pytest.mark.django_db
+def test_export_whole_account(api_client, history):
+    docs, big = history
+    # Delta-stored revisions are exported in full
+    deltify(docs[0].blob, docs[1].blob)
+
+    archive = read_zip(api_client.get(reverse("api:document-export")))
+
+    assert archive.namelist() == [
+        "docs/report.txt/v0/report.txt",
+        "docs/report.txt/v1/report.txt",
+        "media/clip.bin/v0/clip.bin",
+    ]
+    assert archive.read("docs/report.txt/v0/report.txt") == b"draft " * 100
+    assert archive.read("docs/report.txt/v1/report.txt") == b"draft " * 100 + b"final"
+    assert archive.read("media/clip.bin/v0/clip.bin") == big
+    assert archive.testzip() is None
+
+
+@pytest.mark.django_db
+def test_export_by_url_and_prefix(api_client, history):
+    response = api_client.get(reverse("api:document-export"), {"url": "docs/report.txt"})
+    assert response["Content-Disposition"] == 'attachment; filename="docs-report.txt.zip"'
+    assert len(read_zip(response).namelist()) == 2
+
+    response = api_client.get(reverse("api:document-export"), {"prefix": "media/"})
+    assert read_zip(response).namelist() == ["media/clip.bin/v0/clip.bin"]
+
+    assert api_client.get(reverse("api:document-export"), {"url": "docs/missing.txt"}).status_code == 404
+
+
+@pytest.mark.django_db
+def test_async_export_queries_in_the_request_thread(api_client, history, settings):
+    settings.DOCUMENT_ASYNC_VIEWS = True
+    threads = []
+    open_blob = Blob.open
+
+    def recording_open(blob, *args, **kwargs):
+        threads.append(threading.current_thread())
+        return open_blob(blob, *args, **kwargs)
+
+    async def read(response):
+        return b"".join([chunk async for chunk in response.streaming_content])
+
+    with mock.patch.object(Blob, "open", recording_open):
+        response = api_client.get(reverse("api:document-export"))
+        archive = zipfile.ZipFile(io.BytesIO(async_to_sync(read)(response)))
+
+    assert len(archive.namelist()) == 3
+    # Where the documents are fetched, not a shared pool thread
+    assert threads == [threading.current_thread()] * 3
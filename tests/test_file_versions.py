@@ -1,4 +1,11 @@
-from propylon_document_manager.file_versions.models import FileVersion
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from propylon_document_manager.file_versions.models import Document, FileVersion
+
+from .factories import DocumentFactory
 
 def test_file_versions():
     file_name = "new_file"
@@ -11,3 +18,18 @@ def test_file_versions():
     assert files.count() == 1
     assert files[0].file_name == file_name
     assert files[0].version_number == file_version
+
+
+def test_document_copies_version_fields():
+    doc = DocumentFactory(url="docs/copied.txt", version__file_name="copied.txt", version__version_number=4)
+    assert (doc.version_number, doc.file_name) == (4, "copied.txt")
+
+    # Revisions are looked up without joining FileVersion
+    with CaptureQueriesContext(connection) as captured:
+        Document.objects.filter(user=doc.user, url=doc.url, version_number=4).get()
+    assert "file_versions_fileversion" not in captured[0]["sql"]
+
+    # FileVersion rows are still written and served for older clients
+    client = APIClient()
+    response = client.get(reverse("api:fileversion-detail", kwargs={"id": doc.version_id}))
+    assert response.data == {"id": doc.version_id, "file_name": "copied.txt", "version_number": 4}
@@ -0,0 +1,74 @@
+import pytest
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from propylon_document_manager.file_versions.models import Document, Folder
+from propylon_document_manager.file_versions.services import create_revision, create_revisions
+
+from .factories import UserFactory
+
+
+def folder(client, path=""):
+    url = reverse("api:folder", kwargs={"path": path}) if path else reverse("api:folder-root")
+    return client.get(url)
+
+
+@pytest.mark.django_db
+def test_folder_lists_immediate_children(api_client, user):
+    create_revision(user, "readme.txt", ContentFile(b"top"), "readme.txt")
+    create_revision(user, "docs/guide.txt", ContentFile(b"g0"), "guide.txt")
+    create_revision(user, "docs/guide.txt", ContentFile(b"g1"), "guide.txt")
+    create_revisions(
+        user,
+        [
+            ("docs/reviews/2024/q1.txt", ContentFile(b"q1"), "q1.txt"),
+            ("docs/reviews/2024/q2.txt", ContentFile(b"q2"), "q2.txt"),
+            ("docs/reviews/summary.txt", ContentFile(b"s"), "summary.txt"),
+        ],
+    )
+    create_revision(UserFactory(), "docs/other.txt", ContentFile(b"other"), "other.txt")
+
+    response = folder(api_client)
+    assert response.status_code == 200
+    assert response.data["folders"] == [{"path": "docs", "name": "docs", "documents": 1, "folders": 1}]
+    assert [doc["url"] for doc in response.data["documents"]] == ["readme.txt"]
+
+    response = folder(api_client, "docs")
+    assert response.data["folders"] == [{"path": "docs/reviews", "name": "reviews", "documents": 1, "folders": 1}]
+    assert [(doc["url"], doc["version_number"]) for doc in response.data["documents"]] == [("docs/guide.txt", 1)]
+
+    response = folder(api_client, "docs/reviews/2024")
+    assert response.data["folders"] == []
+    assert [doc["file_name"] for doc in response.data["documents"]] == ["q1.txt", "q2.txt"]
+
+    assert folder(api_client, "docs/missing").status_code == 404
+
+
+@pytest.mark.django_db
+def test_folder_hides_emptied_folders(api_client, user):
+    create_revision(user, "old/a.txt", ContentFile(b"a"), "a.txt")
+    Document.objects.filter(url="old/a.txt").delete()
+
+    assert Folder.objects.filter(user=user, path="old").exists()
+    assert folder(api_client).data["folders"] == []
+
+
+@pytest.mark.django_db
+def test_folder_query_count_does_not_grow_with_contents(api_client, user):
+    def count_queries(path, size):
+        create_revisions(
+            user,
+            [
+                (f"{path}/{i}/{j}.txt", ContentFile(f"{path} {i} {j}".encode()), f"{j}.txt")
+                for i in range(size)
+                for j in range(2)
+            ]
+            + [(f"{path}/{i}.txt", ContentFile(f"{path} {i}".encode()), f"{i}.txt") for i in range(size)],
+        )
+        with CaptureQueriesContext(connection) as captured:
+            assert len(folder(api_client, path).data["folders"]) == size
+        return len(captured)
+
+    assert count_queries("small", 2) == count_queries("large", 20)
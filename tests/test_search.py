@@ -0,0 +1,77 @@
+from unittest import mock
+
+import pytest
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.urls import reverse
+
+from propylon_document_manager.file_versions.models import BlobText, Document, DocumentShare
+from propylon_document_manager.file_versions.search import index_blobs
+from propylon_document_manager.file_versions.services import create_revision, create_revisions
+
+from .factories import UserFactory
+
+
+def search(client, q, **params):
+    return client.get(reverse("api:document-search"), {"q": q, **params})
+
+
+@pytest.mark.django_db
+def test_uploads_are_indexed_after_commit(api_client, user, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks() as callbacks:
+        doc = create_revision(user, "notes/todo.txt", ContentFile(b"Renew the lease before March"), "todo.txt")
+        create_revisions(user, [("notes/logo.png", ContentFile(b"\x89PNG\r\n\x00\x00binary"), "logo.png")])
+    assert not BlobText.objects.exists()
+
+    # Run the indexing in this thread instead of the worker pool
+    assert len(callbacks) == 2
+    index_blobs(Document.objects.values_list("blob_id", flat=True))
+
+    assert BlobText.objects.get(blob_id=doc.blob_id).body == "Renew the lease before March"
+    results = search(api_client, "lease").data["results"]
+    assert [(result["url"], result["owner"]) for result in results] == [("notes/todo.txt", user.email)]
+    assert "[lease]" in results[0]["snippet"]
+
+
+@pytest.mark.django_db
+def test_search_is_scoped_ranked_and_paginated(api_client, user):
+    other = UserFactory()
+    docs = create_revisions(
+        user,
+        [
+            ("a.txt", ContentFile(b"budget"), "a.txt"),
+            ("b.txt", ContentFile(b"budget budget budget review"), "b.txt"),
+            ("c.txt", ContentFile(b"nothing to see"), "c.txt"),
+        ],
+    )
+    private = create_revision(other, "secret.txt", ContentFile(b"budget for someone else"), "secret.txt")
+    shared = create_revision(other, "shared.txt", ContentFile(b"shared budget notes"), "shared.txt")
+    DocumentShare.objects.create(document=shared, shared_with=user)
+    index_blobs([doc.blob_id for doc in [*docs, private, shared]])
+
+    response = search(api_client, "budget")
+    assert response.data["count"] == 3
+    assert response.data["results"][0]["url"] == "b.txt"
+    assert {result["url"] for result in response.data["results"]} == {"a.txt", "b.txt", "shared.txt"}
+
+    first = search(api_client, "budget", page_size=2)
+    rest = api_client.get(first.data["next"])
+    urls = [result["url"] for result in first.data["results"] + rest.data["results"]]
+    assert sorted(urls) == ["a.txt", "b.txt", "shared.txt"]
+
+    # Words are matched literally, query syntax is not interpreted
+    assert search(api_client, 'budget" OR "nothing').data["count"] == 0
+    assert search(api_client, "").status_code == 400
+
+
+@pytest.mark.django_db(transaction=True)
+def test_index_documents_backfills_missing_text(user):
+    # Left unindexed, as after a restart, instead of racing the command's workers
+    with mock.patch("propylon_document_manager.file_versions.search._executor"):
+        create_revisions(user, [(f"docs/{i}.txt", ContentFile(f"report {i}".encode()), f"{i}.txt") for i in range(5)])
+    assert not BlobText.objects.exists()
+
+    call_command("index_documents", workers=2, batch_size=2)
+
+    assert BlobText.objects.count() == 5
+    assert BlobText.objects.filter(body="report 3").exists()
@@ -0,0 +1,63 @@
+import pytest
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, connections, transaction
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from propylon_document_manager.site.sqlite3.base import DatabaseWrapper
+from propylon_document_manager.site.transactions import atomic_write
+
+
+def begins(call):
+    """The BEGIN statements run on the primary during ``call()``."""
+    with CaptureQueriesContext(connection) as captured:
+        call()
+    return [query["sql"] for query in captured if query["sql"].startswith("BEGIN")]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_only_write_transactions_take_the_write_lock_up_front():
+    def atomic_read():
+        with transaction.atomic():
+            pass
+
+    def write_in_read():
+        with transaction.atomic(), atomic_write():
+            pass
+
+    def write():
+        with atomic_write():
+            pass
+
+    assert begins(atomic_read) == ["BEGIN"]
+    # Nested in a transaction that already began, it is a savepoint
+    assert begins(write_in_read) == ["BEGIN"]
+    assert begins(write) == ["BEGIN IMMEDIATE"]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_only_unsafe_requests_take_the_write_lock_up_front(api_client):
+    def read():
+        api_client.get(reverse("api:usage"))
+
+    def upload():
+        url = reverse("api:document", kwargs={"url": "docs/a.txt"})
+        api_client.post(url, {"file": SimpleUploadedFile("a.txt", b"a")}, format="multipart")
+
+    assert begins(read) == ["BEGIN"]
+    # The upload and the indexing that follows its commit both write
+    assert begins(upload) == ["BEGIN IMMEDIATE", "BEGIN IMMEDIATE"]
+
+
+def test_connections_run_init_command():
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA synchronous")
+        # NORMAL
+        assert cursor.fetchone() == (1,)
+
+
+def test_rejects_unknown_transaction_mode():
+    settings_dict = {**connections["default"].settings_dict, "OPTIONS": {"transaction_mode": "LAZY"}}
+    with pytest.raises(ImproperlyConfigured):
+        DatabaseWrapper(settings_dict).get_connection_params()
@@ -0,0 +1,138 @@
+from unittest import mock
+
+import pytest
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.urls import reverse
+
+from propylon_document_manager.file_versions.models import Document, DocumentHead, StorageUsage
+from propylon_document_manager.file_versions.services import create_revision, create_revisions
+from propylon_document_manager.file_versions.uploadhandlers import ContentHashUploadHandler
+from propylon_document_manager.file_versions.usage import QuotaExceededError
+
+from .factories import DocumentFactory
+
+
+def usage(user):
+    row = StorageUsage.objects.get(user=user)
+    return row.revisions, row.bytes
+
+
+def head_usage(user, url):
+    head = DocumentHead.objects.get(user=user, url=url)
+    return head.revisions, head.bytes
+
+
+@pytest.mark.django_db
+def test_usage_follows_uploads_and_deletes(user):
+    create_revision(user, "docs/a.txt", ContentFile(b"12345"), "a.txt")
+    create_revision(user, "docs/a.txt", ContentFile(b"123"), "a.txt")
+    create_revisions(
+        user, [("docs/b.txt", ContentFile(b"12345"), "b.txt"), ("docs/c.txt", ContentFile(b"1"), "c.txt")]
+    )
+
+    # Content shared between revisions counts for each of them
+    assert usage(user) == (4, 14)
+    assert head_usage(user, "docs/a.txt") == (2, 8)
+    assert head_usage(user, "docs/b.txt") == (1, 5)
+
+    Document.objects.filter(user=user, url="docs/a.txt", version_number=0).delete()
+    assert usage(user) == (3, 9)
+    assert head_usage(user, "docs/a.txt") == (1, 3)
+
+
+@pytest.mark.django_db
+def test_documents_created_through_the_orm_are_counted_and_released(user, settings):
+    settings.DOCUMENT_QUOTA_BYTES = 5
+    create_revision(user, "docs/a.txt", ContentFile(b"123"), "a.txt")
+    # Only uploads are held to the quota
+    DocumentFactory(user=user, url="docs/a.txt", version__version_number=1, file=ContentFile(b"4567"))
+    DocumentFactory(user=user, url="docs/b.txt", file=ContentFile(b"89"))
+    assert usage(user) == (3, 9)
+    assert head_usage(user, "docs/a.txt") == (2, 7)
+
+    Document.objects.filter(user=user).delete()
+    assert usage(user) == (0, 0)
+    assert head_usage(user, "docs/a.txt") == (0, 0)
+
+
+@pytest.mark.django_db
+def test_quota_rejects_revisions_that_do_not_fit(user, settings):
+    settings.DOCUMENT_QUOTA_BYTES = 10
+    create_revision(user, "a.txt", ContentFile(b"123456"), "a.txt")
+
+    with pytest.raises(QuotaExceededError):
+        create_revision(user, "b.txt", ContentFile(b"12345"), "b.txt")
+    with pytest.raises(QuotaExceededError):
+        create_revisions(user, [("c.txt", ContentFile(b"12"), "c.txt"), ("d.txt", ContentFile(b"345"), "d.txt")])
+    assert usage(user) == (1, 6)
+    assert not Document.objects.exclude(url="a.txt").exists()
+
+    # A user's own quota overrides the default
+    StorageUsage.objects.filter(user=user).update(quota=20)
+    create_revision(user, "b.txt", ContentFile(b"12345"), "b.txt")
+    assert usage(user) == (2, 11)
+
+
+@pytest.mark.django_db
+def test_upload_over_quota_is_rejected_before_the_body_is_read(api_client, user, settings):
+    settings.DOCUMENT_QUOTA_BYTES = 1000
+    url = reverse("api:document", kwargs={"url": "docs/big.txt"})
+
+    with mock.patch.object(ContentHashUploadHandler, "receive_data_chunk") as receive:
+        response = api_client.post(url, {"file": SimpleUploadedFile("big.txt", b"x" * 2**17)}, format="multipart")
+    assert response.status_code == 413
+    assert not receive.called
+    assert not Document.objects.exists()
+
+    response = api_client.post(url, {"file": SimpleUploadedFile("small.txt", b"x" * 10)}, format="multipart")
+    assert response.status_code == 201
+    assert usage(user) == (1, 10)
+
+
+@pytest.mark.django_db
+def test_upload_that_just_fits_the_quota_is_stored(api_client, user, settings):
+    settings.DOCUMENT_QUOTA_BYTES = 100
+    url = reverse("api:document", kwargs={"url": "docs/full.txt"})
+
+    # The multipart body is larger than the quota, the file is not
+    response = api_client.post(url, {"file": SimpleUploadedFile("full.txt", b"x" * 97)}, format="multipart")
+    assert response.status_code == 201
+    assert usage(user) == (1, 97)
+
+    response = api_client.post(url, {"file": SimpleUploadedFile("more.txt", b"y" * 4)}, format="multipart")
+    assert response.status_code == 413
+    assert usage(user) == (1, 97)
+
+
+@pytest.mark.django_db
+def test_usage_endpoints(api_client, user, settings, django_assert_num_queries):
+    settings.DOCUMENT_QUOTA_BYTES = 1000
+    create_revision(user, "small.txt", ContentFile(b"1"), "small.txt")
+    create_revision(user, "large.txt", ContentFile(b"123"), "large.txt")
+    create_revision(user, "large.txt", ContentFile(b"456"), "large.txt")
+
+    # Savepoint and release around the one lookup, however many documents there are
+    with django_assert_num_queries(3):
+        response = api_client.get(reverse("api:usage"))
+    assert (response.data["revisions"], response.data["bytes"], response.data["quota"]) == (3, 7, 1000)
+
+    response = api_client.get(reverse("api:usage-urls"))
+    assert [(r["url"], r["revisions"], r["bytes"]) for r in response.data["results"]] == [
+        ("large.txt", 2, 6),
+        ("small.txt", 1, 1),
+    ]
+
+
+@pytest.mark.django_db
+def test_reconcile_repairs_drifted_counters(user):
+    create_revision(user, "docs/a.txt", ContentFile(b"123"), "a.txt")
+    DocumentFactory(user=user, url="docs/a.txt", version__version_number=1, file=ContentFile(b"4567"))
+    StorageUsage.objects.filter(user=user).delete()
+    DocumentHead.objects.filter(user=user).update(revisions=0, bytes=0)
+
+    call_command("reconcile_storage_usage")
+
+    assert usage(user) == (2, 7)
+    assert head_usage(user, "docs/a.txt") == (2, 7)
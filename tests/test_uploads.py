@@ -0,0 +1,183 @@
+import hashlib
+import io
+import os
+from datetime import timedelta
+
+import pytest
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+
+from propylon_document_manager.file_versions.blobs import BLOB_STAGING
+from propylon_document_manager.file_versions.models import Document, DocumentShare, UploadSession
+
+from .factories import DocumentFactory, UserFactory
+
+
+def fail_hash_file(file):
+    raise AssertionError("upload was read back to hash it")
+
+
+@pytest.mark.django_db
+def test_upload_is_hashed_while_streamed_to_storage(api_client, monkeypatch):
+    monkeypatch.setattr("propylon_document_manager.file_versions.services.hash_file", fail_hash_file)
+    monkeypatch.setattr("propylon_document_manager.file_versions.models.hash_file", fail_hash_file)
+    content = os.urandom(300 * 1024)
+    file = io.BytesIO(content)
+    file.name = "big.bin"
+
+    response = api_client.post(
+        reverse("api:document", kwargs={"url": "docs/big.bin"}), {"file": file}, format="multipart"
+    )
+
+    assert response.status_code == 201
+    doc = Document.objects.select_related("blob").get()
+    assert doc.content_hash == hashlib.sha256(content).hexdigest()
+    with doc.blob.file.open("rb") as stored:
+        assert stored.read() == content
+    # The staged upload was moved into place, not copied
+    assert default_storage.listdir(BLOB_STAGING) == ([], [])
+
+
+@pytest.mark.django_db
+def test_duplicate_upload_discards_staged_file(api_client):
+    url = reverse("api:document", kwargs={"url": "docs/dup.txt"})
+    for _ in range(2):
+        file = io.BytesIO(b"same content")
+        file.name = "dup.txt"
+        api_client.post(url, {"file": file}, format="multipart")
+
+    assert Document.objects.count() == 1
+    assert default_storage.listdir(BLOB_STAGING) == ([], [])
+
+
+def start_upload(client, **data):
+    response = client.post(reverse("api:upload-session-list"), data, format="json")
+    assert response.status_code == 201
+    return reverse("api:upload-session", args=[response.data["id"]])
+
+
+def put_chunk(client, session_url, chunk, offset):
+    return client.put(session_url, chunk, content_type="application/octet-stream", HTTP_UPLOAD_OFFSET=str(offset))
+
+
+@pytest.mark.django_db
+def test_resumable_upload_creates_revision(api_client, user, monkeypatch):
+    content = os.urandom(200 * 1024)
+    session_url = start_upload(api_client, url="docs/big.bin", file_name="big.bin", size=len(content))
+
+    assert put_chunk(api_client, session_url, content[:100_000], 0).status_code == 200
+    # A retried chunk at a stale offset is refused with the offset to resume from
+    response = put_chunk(api_client, session_url, content[:100_000], 0)
+    assert response.status_code == 409
+    assert response.data["offset"] == 100_000
+
+    response = api_client.head(session_url)
+    assert response["Upload-Offset"] == "100000"
+    assert put_chunk(api_client, session_url, content[100_000:], 100_000).status_code == 200
+
+    # Chunks were hashed on arrival, finalizing does not read the file again
+    monkeypatch.setattr("propylon_document_manager.file_versions.chunked_uploads.hash_file", fail_hash_file)
+    response = api_client.post(session_url + "complete/")
+
+    assert response.status_code == 201
+    assert response.data["version"]["version_number"] == 0
+    assert response.data["content_hash"] == hashlib.sha256(content).hexdigest()
+    assert not UploadSession.objects.exists()
+    with Document.objects.get(user=user).file.open("rb") as stored:
+        assert stored.read() == content
+
+
+@pytest.mark.django_db
+def test_resumable_upload_rejects_incomplete_and_duplicate(api_client):
+    first = start_upload(api_client, url="docs/a.txt", file_name="a.txt", size=10)
+    put_chunk(api_client, first, b"01234", 0)
+    response = api_client.post(first + "complete/")
+    assert response.status_code == 400
+    assert response.data["offset"] == 5
+    put_chunk(api_client, first, b"56789", 5)
+    assert api_client.post(first + "complete/").status_code == 201
+
+    second = start_upload(api_client, url="docs/a.txt", file_name="a.txt")
+    put_chunk(api_client, second, b"0123456789", 0)
+    response = api_client.post(second + "complete/")
+    assert response.status_code == 400
+    assert "already exists" in response.data["detail"]
+
+
+def negotiate(client, url, content, file_name="file.txt"):
+    data = {
+        "url": url,
+        "content_hash": hashlib.sha256(content).hexdigest(),
+        "size": len(content),
+        "file_name": file_name,
+    }
+    return client.post(reverse("api:document-negotiate"), data, format="json")
+
+
+@pytest.mark.django_db
+def test_negotiation_reuses_readable_content(api_client, user):
+    template = DocumentFactory(user=user, url="templates/nda.docx", file=ContentFile(b"template body"))
+
+    response = negotiate(api_client, "contracts/acme.docx", b"template body", "acme.docx")
+
+    assert response.status_code == 201
+    assert response.data["status"] == "created"
+    assert response.data["document"]["version"]["file_name"] == "acme.docx"
+    doc = Document.objects.get(url="contracts/acme.docx")
+    assert doc.blob_id == template.blob_id
+    doc.blob.refresh_from_db()
+    assert doc.blob.ref_count == 2
+
+    response = negotiate(api_client, "contracts/acme.docx", b"template body")
+    assert response.status_code == 400
+    assert response.data["status"] == "duplicate"
+
+
+@pytest.mark.django_db
+def test_negotiation_asks_for_bytes_of_unknown_or_unreadable_content(api_client, user):
+    other = UserFactory()
+    DocumentFactory(user=other, url="private.txt", file=ContentFile(b"someone else's file"))
+    shared = DocumentFactory(user=other, url="shared.txt", file=ContentFile(b"shared with me"))
+    DocumentShare.objects.create(document=shared, shared_with=user)
+
+    # Knowing the hash of another user's file is not enough to get a copy of it
+    response = negotiate(api_client, "copy.txt", b"someone else's file")
+    assert response.data["status"] == "upload_required"
+    assert response.data["upload_url"].endswith(reverse("api:document", kwargs={"url": "copy.txt"}))
+    assert negotiate(api_client, "new.txt", b"never uploaded").data["status"] == "upload_required"
+
+    assert negotiate(api_client, "mine.txt", b"shared with me").status_code == 201
+    assert not Document.objects.filter(user=user, url__in=["copy.txt", "new.txt"]).exists()
+
+
+@pytest.mark.django_db
+def test_chunk_past_announced_size_is_refused_without_keeping_it(api_client):
+    session_url = start_upload(api_client, url="docs/a.txt", file_name="a.txt", size=10)
+    put_chunk(api_client, session_url, b"01234", 0)
+
+    assert put_chunk(api_client, session_url, b"x" * 1_000_000, 5).status_code == 400
+    session = UploadSession.objects.get()
+    assert session.offset == 5
+    assert os.path.getsize(session.staging_path) == 5
+
+    put_chunk(api_client, session_url, b"56789", 5)
+    assert api_client.post(session_url + "complete/").status_code == 201
+
+
+@pytest.mark.django_db
+def test_collect_blobs_expires_abandoned_uploads(api_client, settings):
+    settings.DOCUMENT_UPLOAD_SESSION_TIMEOUT = 60
+    abandoned = start_upload(api_client, url="docs/old.txt", file_name="old.txt")
+    put_chunk(api_client, abandoned, b"stale", 0)
+    staging_path = UploadSession.objects.get().staging_path
+    UploadSession.objects.update(updated_at=timezone.now() - timedelta(minutes=2))
+    active = start_upload(api_client, url="docs/new.txt", file_name="new.txt")
+    put_chunk(api_client, active, b"fresh", 0)
+
+    call_command("collect_blobs", stdout=io.StringIO())
+
+    assert list(UploadSession.objects.values_list("url", flat=True)) == ["docs/new.txt"]
+    assert not os.path.exists(staging_path)